@@ -2,8 +2,10 @@ from django.contrib.auth import get_user_model
 
 from rest_framework import serializers
 
+from core.profiling import SerializeTimerMixin
 
-class UserSerializer(serializers.ModelSerializer):
+
+class UserSerializer(SerializeTimerMixin, serializers.ModelSerializer):
     class Meta:
         model = get_user_model()
         fields = (
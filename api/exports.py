@@ -0,0 +1,160 @@
+import csv
+import tempfile
+from typing import Iterable, Iterator
+
+from django.core.handlers.asgi import ASGIRequest
+from django.http import FileResponse, HttpRequest, StreamingHttpResponse
+from openpyxl import Workbook
+
+from core.gradebook import get_gradebook
+from core.models import Task, UserAnswer
+
+EXPORT_CHUNK_SIZE = 2000
+
+CSV_CONTENT_TYPE = "text/csv; charset=utf-8"
+XLSX_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+
+class Echo:
+    """File-like object returning what is written, for csv.writer."""
+
+    def write(self, value: str) -> str:
+        return value
+
+
+# Spreadsheet apps run cells starting with these as formulas
+FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+
+def _escape_formula(value):
+    """Text cells are quoted, so answers and comments can't run formulas."""
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return f"'{value}"
+
+    return value
+
+
+def _escaped(rows: Iterable[list]) -> Iterator[list]:
+    for row in rows:
+        yield [_escape_formula(value) for value in row]
+
+
+def task_results_rows(task: Task) -> Iterator[list]:
+    yield ["Email", "Student", "Question", "Answer", "Score", "Mark", "Comment"]
+
+    user_answers = (
+        UserAnswer.objects.filter(
+            task_session__task=task, task_session__finished_at__isnull=False
+        )
+        .order_by("task_session__user__email", "question_id")
+        .values_list(
+            "task_session__user__email",
+            "task_session__user__first_name",
+            "task_session__user__last_name",
+            "question__title",
+            "text",
+            "score",
+            "question__value",
+            "comment",
+        )
+        .iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    )
+
+    for row in user_answers:
+        email, first_name, last_name, title, text, score, value, comment = row
+        yield [
+            email,
+            f"{first_name} {last_name}".strip(),
+            title,
+            text,
+            score,
+            round(value * score / 100, 2) if score is not None else None,
+            comment,
+        ]
+
+
+def gradebook_rows(course_id: int) -> Iterator[list]:
+    gradebook = get_gradebook(course_id)
+
+    yield (
+        ["Email", "Student"]
+        + [task["title"] for task in gradebook["tasks"]]
+        + ["Total", "Max"]
+    )
+
+    for student in gradebook["students"]:
+        yield (
+            [
+                student["email"],
+                f"{student['first_name']} {student['last_name']}".strip(),
+            ]
+            + student["marks"]
+            + [student["total_mark"], student["max_mark"]]
+        )
+
+    yield (
+        ["", "Average"]
+        + [task["average_mark"] for task in gradebook["tasks"]]
+        + ["", ""]
+    )
+
+
+def csv_response(
+    rows: Iterable[list], filename: str, is_buffered: bool = False
+) -> StreamingHttpResponse:
+    """
+    Rows are written while the body is sent, straight from the database.
+    Buffered rows are all fetched first, needed under ASGI, where Django
+    sends the body from the event loop and the queries can't run.
+    """
+    if is_buffered:
+        rows = list(rows)
+
+    writer = csv.writer(Echo())
+
+    def stream() -> Iterator[str]:
+        # BOM, so spreadsheet apps detect UTF-8
+        yield "\ufeff"
+
+        for row in _escaped(rows):
+            yield writer.writerow(row)
+
+    return StreamingHttpResponse(
+        stream(),
+        content_type=CSV_CONTENT_TYPE,
+        headers={"Content-Disposition": f'attachment; filename="{filename}.csv"'},
+    )
+
+
+def xlsx_response(rows: Iterable[list], filename: str) -> FileResponse:
+    """
+    XLSX files can only be written as a whole, so rows are written
+    to a temporary file first, which is then streamed in chunks.
+    """
+    workbook = Workbook(write_only=True)
+    worksheet = workbook.create_sheet()
+
+    for row in _escaped(rows):
+        worksheet.append(row)
+
+    file = tempfile.TemporaryFile()
+    workbook.save(file)
+    file.seek(0)
+
+    return FileResponse(
+        file,
+        as_attachment=True,
+        filename=f"{filename}.xlsx",
+        content_type=XLSX_CONTENT_TYPE,
+    )
+
+
+def export_response(
+    request: HttpRequest, rows: Iterable[list], filename: str, file_format: str
+):
+    if file_format == "xlsx":
+        return xlsx_response(rows, filename)
+
+    # Unwraps the request of REST framework views
+    request = getattr(request, "_request", request)
+    return csv_response(rows, filename, is_buffered=isinstance(request, ASGIRequest))
@@ -0,0 +1,90 @@
+import asyncio
+import hashlib
+import secrets
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpRequest
+from rest_framework import status
+from rest_framework.response import Response
+
+LOCK_POLL_INTERVAL_SEC = 0.5
+
+
+def acquire_lock(key: str) -> str | None:
+    """
+    Take a lock shared by every process using the same cache backend.
+    Returns the lock token, or None if someone else holds the lock.
+    """
+    token = secrets.token_hex(16)
+
+    if cache.add(f"lock:{key}", token, timeout=settings.FINISH_LOCK_TIMEOUT_SEC):
+        return token
+
+    return None
+
+
+def release_lock(key: str, token: str) -> None:
+    # Lock could have expired and been taken by another request
+    if cache.get(f"lock:{key}") == token:
+        cache.delete(f"lock:{key}")
+
+
+def wait_for_lock_release(key: str) -> bool:
+    """Wait until the lock is released, returns False on timeout."""
+    deadline = time.monotonic() + settings.FINISH_WAIT_TIMEOUT_SEC
+
+    while cache.get(f"lock:{key}") is not None:
+        if time.monotonic() > deadline:
+            return False
+
+        time.sleep(LOCK_POLL_INTERVAL_SEC)
+
+    return True
+
+
+async def await_lock_release(key: str) -> bool:
+    """Same as wait_for_lock_release, without blocking the event loop."""
+    deadline = time.monotonic() + settings.FINISH_WAIT_TIMEOUT_SEC
+
+    while await cache.aget(f"lock:{key}") is not None:
+        if time.monotonic() > deadline:
+            return False
+
+        await asyncio.sleep(LOCK_POLL_INTERVAL_SEC)
+
+    return True
+
+
+def hash_body(request: HttpRequest) -> str:
+    return hashlib.sha256(request.body).hexdigest()
+
+
+def get_replay(key: str, body_hash: str) -> Response | None:
+    """
+    The response stored for the key, or an error when the key was used
+    for a request with another body, which must not get that response.
+    """
+    replay = cache.get(f"replay:{key}")
+
+    if replay is None:
+        return None
+
+    data, status_code, stored_body_hash = replay
+
+    if body_hash != stored_body_hash:
+        return Response(
+            {"detail": "Idempotency-Key was already used with another request body."},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        )
+
+    return Response(data, status=status_code)
+
+
+def store_replay(key: str, body_hash: str, response: Response) -> None:
+    cache.set(
+        f"replay:{key}",
+        (response.data, response.status_code, body_hash),
+        timeout=settings.IDEMPOTENCY_KEY_TTL_SEC,
+    )
@@ -0,0 +1,153 @@
+import datetime
+import time
+from typing import Callable
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, QuerySet
+from rest_framework.renderers import JSONRenderer
+from rest_framework.serializers import Serializer
+
+from api.renderers import ORJSONRenderer
+from api.serializers import (
+    CourseListSerializer,
+    TaskSerializer,
+    TaskSessionSerializer,
+)
+from api.values_serializers import (
+    CourseListValuesSerializer,
+    TaskSessionValuesSerializer,
+    TaskValuesSerializer,
+    ValuesSerializer,
+)
+from core.models import Course, CourseMembership, Quiz, Subject, Task, TaskSession
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare rendering list endpoints with model serializers and with "
+        "values() serializers, on sample data which is rolled back"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=1000)
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self._create_sample_data(options["rows"])
+
+            for name, queryset, serializer_class, values_serializer_class in (
+                (
+                    "courses",
+                    Course.objects.annotate(users_count=Count("users"))
+                    .select_related("subject")
+                    .order_by("id"),
+                    CourseListSerializer,
+                    CourseListValuesSerializer,
+                ),
+                (
+                    "tasks",
+                    Task.objects.select_related("quiz").order_by("id"),
+                    TaskSerializer,
+                    TaskValuesSerializer,
+                ),
+                (
+                    "task sessions",
+                    TaskSession.objects.select_related("user").order_by("id"),
+                    TaskSessionSerializer,
+                    TaskSessionValuesSerializer,
+                ),
+            ):
+                self._compare(
+                    name,
+                    queryset,
+                    serializer_class,
+                    values_serializer_class,
+                    options["repeat"],
+                )
+
+            transaction.set_rollback(True)
+
+    def _compare(
+        self,
+        name: str,
+        queryset: QuerySet,
+        serializer_class: type[Serializer],
+        values_serializer_class: type[ValuesSerializer],
+        repeat: int,
+    ) -> None:
+        def render() -> bytes:
+            data = serializer_class(list(queryset.all()), many=True).data
+            return JSONRenderer().render(data)
+
+        def render_values() -> bytes:
+            rows = list(queryset.values(*values_serializer_class.lookups))
+            data = values_serializer_class(rows, many=True).data
+            return ORJSONRenderer().render(data)
+
+        if render() != render_values():
+            raise CommandError(f"Rendered {name} differ")
+
+        elapsed = self._measure(render, repeat)
+        values_elapsed = self._measure(render_values, repeat)
+
+        self.stdout.write(
+            f"{name}: serializer {elapsed * 1000:.1f} ms, "
+            f"values {values_elapsed * 1000:.1f} ms, "
+            f"{elapsed / values_elapsed:.1f}x faster, output identical"
+        )
+
+    @staticmethod
+    def _measure(function: Callable[[], bytes], repeat: int) -> float:
+        """Best time of `repeat` runs, in seconds."""
+        timings = []
+
+        for _ in range(repeat):
+            started_at = time.perf_counter()
+            function()
+            timings.append(time.perf_counter() - started_at)
+
+        return min(timings)
+
+    @staticmethod
+    def _create_sample_data(rows: int) -> None:
+        now = datetime.datetime.now()
+        subject = Subject.objects.create(name="Benchmark")
+        quiz = Quiz.objects.create(name="Benchmark", max_duration=60, subject=subject)
+        courses = Course.objects.bulk_create(
+            Course(name=f"Course {i}", subject=subject, invitation_token=f"bench-{i}")
+            for i in range(rows)
+        )
+        users = get_user_model().objects.bulk_create(
+            get_user_model()(
+                email=f"benchmark-{i}@example.com",
+                first_name=f"Student {i}",
+                last_name="Ünicode",
+            )
+            for i in range(rows)
+        )
+        CourseMembership.objects.bulk_create(
+            CourseMembership(user=user, course=courses[0]) for user in users
+        )
+        tasks = Task.objects.bulk_create(
+            Task(
+                title=f"Task {i}",
+                deadline=now + datetime.timedelta(days=1, microseconds=i),
+                course=courses[0],
+                quiz=quiz,
+            )
+            for i in range(rows)
+        )
+        TaskSession.objects.bulk_create(
+            TaskSession(
+                user=user,
+                task=tasks[0],
+                finished_at=now + datetime.timedelta(minutes=1) if i % 2 else None,
+                grading_status=TaskSession.GradingStatus.GRADED if i % 2 else None,
+                total_mark=i % 7 * 1.5,
+                max_mark=10,
+            )
+            for i, user in enumerate(users)
+        )
@@ -0,0 +1,500 @@
+import datetime
+import functools
+import json
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection
+from django.test import Client
+from django.test.utils import override_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from core.models import Course, CourseMembership, Question, Quiz, Subject, Task
+
+DEBUG_TOOLBAR_MIDDLEWARE = "debug_toolbar.middleware.DebugToolbarMiddleware"
+# Share of the scheduled arrival rate actually sent below which it's reported
+ACHIEVED_RATE_TOLERANCE = 0.95
+
+WORDS = (
+    "algorithm array binary cache compiler database function graph hash heap "
+    "index integer kernel list memory network object pointer process queue "
+    "recursion register schema socket stack string thread tree variable vector"
+).split()
+
+
+@dataclass
+class Stats:
+    """Measurements collected by the student threads."""
+
+    # From when the request was due to be sent, see Command._timed
+    latencies: dict[str, list[float]] = field(default_factory=lambda: defaultdict(list))
+    statuses: dict[str, Counter] = field(default_factory=lambda: defaultdict(Counter))
+    # When the start requests were due and actually sent
+    start_schedule: list[tuple[float, float]] = field(default_factory=list)
+    grading_statuses: Counter = field(default_factory=Counter)
+    queries: int = 0
+    write_latencies: list[float] = field(default_factory=list)
+    lock_errors: int = 0
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def add_request(
+        self, endpoint: str, status: int, elapsed: float, due_at: float, sent_at: float
+    ) -> None:
+        with self.lock:
+            self.latencies[endpoint].append(elapsed)
+            self.statuses[endpoint][status] += 1
+
+            if endpoint == "start":
+                self.start_schedule.append((due_at, sent_at))
+
+
+def percentile(values: list[float], percent: float) -> float:
+    """Nearest-rank percentile of sorted values."""
+    if not values:
+        return 0.0
+
+    rank = max(round(percent / 100 * len(values) + 0.5) - 1, 0)
+    return values[min(rank, len(values) - 1)]
+
+
+class Command(BaseCommand):
+    help = (
+        "Simulate an exam deadline: N students start and finish a task at the "
+        "given arrival rate, graded by the local grader with simulated latency. "
+        "Seeds its own course in the configured database and deletes it after."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--students", type=int, default=200)
+        parser.add_argument("--questions", type=int, default=5)
+        parser.add_argument(
+            "--rate",
+            type=float,
+            default=20.0,
+            help="Students arriving per second",
+        )
+        parser.add_argument(
+            "--arrivals",
+            choices=("uniform", "poisson"),
+            default="poisson",
+            help="Evenly spaced arrivals or a Poisson process with the given rate",
+        )
+        parser.add_argument(
+            "--think-time",
+            type=float,
+            default=0.0,
+            help="Seconds between start and finish of a student",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=64,
+            help="Maximum number of students in flight at the same time",
+        )
+        parser.add_argument("--grader-latency-ms", type=float, default=800.0)
+        parser.add_argument("--grader-jitter-ms", type=float, default=400.0)
+        parser.add_argument(
+            "--grader-distribution",
+            choices=("uniform", "exponential"),
+            default="exponential",
+        )
+        parser.add_argument(
+            "--url",
+            help=(
+                "Base URL of a running server, e.g. http://127.0.0.1:8000, "
+                "instead of calling the application in this process. The server "
+                "has to use the same database and the local grader backend, "
+                "configured by its GRADER_* environment variables."
+            ),
+        )
+        parser.add_argument("--seed", type=int, default=None)
+        parser.add_argument("--output", help="Write the report as JSON to this file")
+        parser.add_argument("--baseline", help="JSON report to compare with")
+        parser.add_argument(
+            "--keep", action="store_true", help="Keep the seeded data after the run"
+        )
+
+    def handle(self, *args, **options):
+        if options["students"] < 1 or options["rate"] <= 0:
+            raise CommandError("--students and --rate have to be positive")
+
+        self.options = options
+        self.random = random.Random(options["seed"])
+        self.stats = Stats()
+
+        with ExitStack() as stack:
+            if not options["url"]:
+                # Measured like production, without the query log and
+                # the toolbar of development
+                stack.enter_context(
+                    override_settings(
+                        DEBUG=False,
+                        MIDDLEWARE=[
+                            middleware
+                            for middleware in settings.MIDDLEWARE
+                            if middleware != DEBUG_TOOLBAR_MIDDLEWARE
+                        ],
+                        ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "localhost"],
+                        GRADER_BACKEND="openai_client.backends.LocalGraderBackend",
+                        GRADER_LOCAL_LATENCY_MS=options["grader_latency_ms"],
+                        GRADER_LOCAL_LATENCY_JITTER_MS=options["grader_jitter_ms"],
+                        GRADER_LOCAL_LATENCY_DISTRIBUTION=options[
+                            "grader_distribution"
+                        ],
+                    )
+                )
+
+            subject, task, students = self._seed()
+
+            try:
+                elapsed = self._run(task, students)
+            finally:
+                if not options["keep"]:
+                    get_user_model().objects.filter(
+                        id__in=[student.id for student in students]
+                    ).delete()
+                    subject.delete()
+
+        report = self._report(elapsed)
+        self._print(report)
+
+        if options["output"]:
+            with open(options["output"], "w") as file:
+                json.dump(report, file, indent=2)
+
+        if options["baseline"]:
+            with open(options["baseline"]) as file:
+                self._compare(report, json.load(file))
+
+    def _seed(self) -> tuple[Subject, Task, list]:
+        run_id = uuid.uuid4().hex[:8]
+        subject = Subject.objects.create(name=f"Load test {run_id}")
+        quiz = Quiz.objects.create(name="Load test", max_duration=60, subject=subject)
+        Question.objects.bulk_create(
+            Question(
+                title=f"Question {i}",
+                expected_answer=" ".join(self.random.sample(WORDS, 8)),
+                value=10,
+                quiz=quiz,
+            )
+            for i in range(self.options["questions"])
+        )
+        course = Course.objects.create(name=f"Load test {run_id}", subject=subject)
+        students = get_user_model().objects.bulk_create(
+            get_user_model()(email=f"load-test-{run_id}-{i}@example.com")
+            for i in range(self.options["students"])
+        )
+        CourseMembership.objects.bulk_create(
+            CourseMembership(user=student, course=course) for student in students
+        )
+        task = Task.objects.create(
+            title="Load test",
+            deadline=datetime.datetime.now() + datetime.timedelta(days=1),
+            course=course,
+            quiz=quiz,
+        )
+
+        return subject, task, students
+
+    def _run(self, task: Task, students: list) -> float:
+        questions = list(task.quiz.questions.all())
+        rate = self.options["rate"]
+        arrival_at = 0.0
+        started_at = time.perf_counter()
+
+        with ThreadPoolExecutor(max_workers=self.options["concurrency"]) as executor:
+            for i, student in enumerate(students):
+                # Unique answers, so the grading cache can't answer for the grader
+                answers = [
+                    {
+                        "question_id": question.id,
+                        "answer": " ".join(
+                            self.random.sample(question.expected_answer.split(), 5)
+                            + [f"student{i}"]
+                        ),
+                    }
+                    for question in questions
+                ]
+                delay = started_at + arrival_at - time.perf_counter()
+
+                if delay > 0:
+                    time.sleep(delay)
+
+                executor.submit(
+                    self._student, task, student, answers, started_at + arrival_at
+                )
+
+                if self.options["arrivals"] == "poisson":
+                    arrival_at += self.random.expovariate(rate)
+                else:
+                    arrival_at += 1 / rate
+
+        return time.perf_counter() - started_at
+
+    def _student(self, task: Task, student, answers: list[dict], due_at: float) -> None:
+        base = f"/api/courses/{task.course_id}/tasks/{task.id}/"
+        authorization = f"Bearer {AccessToken.for_user(student)}"
+
+        try:
+            if self.options["url"]:
+                request = functools.partial(self._request_http, authorization)
+                self._student_requests(base, answers, request, due_at)
+                return
+
+            client = Client(SERVER_NAME="localhost", HTTP_AUTHORIZATION=authorization)
+
+            def request(path: str, data: dict) -> tuple[int, dict]:
+                response = client.post(path, data, content_type="application/json")
+                return response.status_code, self._json(response.content)
+
+            with connection.execute_wrapper(self._record_query):
+                self._student_requests(base, answers, request, due_at)
+        except Exception as exc:
+            self.stderr.write(f"Student {student.email}: {exc!r}")
+        finally:
+            connection.close()
+
+    def _student_requests(
+        self, base: str, answers: list[dict], request, due_at: float
+    ) -> None:
+        status = self._timed("start", request, base + "start/", {}, due_at)
+
+        if status >= 400 or status == 0:
+            return
+
+        due_at = time.perf_counter() + self.options["think_time"]
+
+        if self.options["think_time"]:
+            time.sleep(self.options["think_time"])
+
+        self._timed("finish", request, base + "finish/", {"answers": answers}, due_at)
+
+    def _timed(
+        self, endpoint: str, request, path: str, data: dict, due_at: float
+    ) -> int:
+        """
+        Latency is measured from when the request was due, not when it was
+        sent. A student waiting for a free thread of --concurrency waits
+        like a real one would for the overloaded server, so the time counts.
+        """
+        sent_at = time.perf_counter()
+        status, payload = request(path, data)
+        self.stats.add_request(
+            endpoint, status, time.perf_counter() - due_at, due_at, sent_at
+        )
+
+        if endpoint == "finish" and 0 < status < 400:
+            with self.stats.lock:
+                self.stats.grading_statuses[payload.get("grading_status")] += 1
+
+        return status
+
+    def _request_http(
+        self, authorization: str, path: str, data: dict
+    ) -> tuple[int, dict]:
+        request = urllib.request.Request(
+            self.options["url"].rstrip("/") + path,
+            data=json.dumps(data).encode(),
+            headers={
+                "Content-Type": "application/json",
+                "Authorization": authorization,
+            },
+            method="POST",
+        )
+
+        try:
+            with urllib.request.urlopen(request, timeout=120) as response:
+                return response.status, self._json(response.read())
+        except urllib.error.HTTPError as exc:
+            return exc.code, {}
+        except OSError:
+            # Refused or timed out connection, counted as status 0
+            return 0, {}
+
+    @staticmethod
+    def _json(content: bytes) -> dict:
+        try:
+            return json.loads(content)
+        except ValueError:
+            return {}
+
+    def _record_query(self, execute, sql, params, many, context):
+        """
+        Times statements changing data. On SQLite their duration is
+        mostly the wait for the database write lock.
+        """
+        is_write = sql.lstrip()[:6].upper() in ("INSERT", "UPDATE", "DELETE")
+        started_at = time.perf_counter()
+
+        try:
+            return execute(sql, params, many, context)
+        except OperationalError as exc:
+            if "locked" in str(exc):
+                with self.stats.lock:
+                    self.stats.lock_errors += 1
+            raise
+        finally:
+            with self.stats.lock:
+                self.stats.queries += 1
+
+                if is_write:
+                    self.stats.write_latencies.append(time.perf_counter() - started_at)
+
+    def _report(self, elapsed: float) -> dict:
+        endpoints = {}
+
+        for endpoint in ("start", "finish"):
+            latencies = sorted(self.stats.latencies[endpoint])
+            statuses = self.stats.statuses[endpoint]
+            errors = sum(count for status, count in statuses.items() if status >= 400)
+            errors += statuses[0]
+            total = sum(statuses.values())
+            endpoints[endpoint] = {
+                "requests": total,
+                "throughput_per_sec": total / elapsed,
+                "error_rate": errors / total if total else 0.0,
+                "statuses": {str(status): n for status, n in sorted(statuses.items())},
+                **{f"p{p}_ms": percentile(latencies, p) * 1000 for p in (50, 95, 99)},
+                "max_ms": latencies[-1] * 1000 if latencies else 0.0,
+            }
+
+        report = {
+            **self._arrival_rates(),
+            "options": {
+                name: self.options[name]
+                for name in (
+                    "students",
+                    "questions",
+                    "rate",
+                    "arrivals",
+                    "think_time",
+                    "concurrency",
+                    "grader_latency_ms",
+                    "grader_jitter_ms",
+                    "grader_distribution",
+                    "url",
+                )
+            },
+            "elapsed_sec": elapsed,
+            "endpoints": endpoints,
+            "grading_statuses": {
+                str(status): n for status, n in self.stats.grading_statuses.items()
+            },
+        }
+
+        if not self.options["url"]:
+            writes = sorted(self.stats.write_latencies)
+            report["database"] = {
+                "queries": self.stats.queries,
+                "writes": len(writes),
+                "write_total_sec": sum(writes),
+                **{f"write_p{p}_ms": percentile(writes, p) * 1000 for p in (50, 99)},
+                "write_max_ms": writes[-1] * 1000 if writes else 0.0,
+                "lock_errors": self.stats.lock_errors,
+            }
+
+        return report
+
+    def _arrival_rates(self) -> dict:
+        """
+        Students per second the arrivals were scheduled at and were
+        actually sent at. Sending falls behind when every thread is busy.
+        """
+        schedule = self.stats.start_schedule
+        due = [due_at for due_at, _ in schedule]
+        sent = [sent_at for _, sent_at in schedule]
+
+        def rate(times: list[float]) -> float | None:
+            if len(times) < 2 or max(times) == min(times):
+                return None
+
+            return (len(times) - 1) / (max(times) - min(times))
+
+        return {
+            "scheduled_rate_per_sec": rate(due),
+            "achieved_rate_per_sec": rate(sent),
+            "max_send_delay_ms": max(
+                (sent_at - due_at for due_at, sent_at in schedule), default=0.0
+            )
+            * 1000,
+        }
+
+    def _print(self, report: dict) -> None:
+        self.stdout.write(f"Finished in {report['elapsed_sec']:.1f} s")
+
+        scheduled_rate = report["scheduled_rate_per_sec"]
+        achieved_rate = report["achieved_rate_per_sec"]
+
+        if scheduled_rate is not None and achieved_rate is not None:
+            message = (
+                f"arrivals: {achieved_rate:.1f}/s sent of {scheduled_rate:.1f}/s "
+                f"scheduled for --rate {report['options']['rate']}, sent up to "
+                f"{report['max_send_delay_ms']:.0f} ms late"
+            )
+
+            # Latencies still count from the schedule, but the server saw less load
+            if achieved_rate < scheduled_rate * ACHIEVED_RATE_TOLERANCE:
+                self.stderr.write(f"{message}, below the schedule, raise --concurrency")
+            else:
+                self.stdout.write(message)
+
+        for endpoint, result in report["endpoints"].items():
+            statuses = ", ".join(
+                f"{status}: {n}" for status, n in result["statuses"].items()
+            )
+            self.stdout.write(
+                f"{endpoint}: {result['requests']} requests, "
+                f"{result['throughput_per_sec']:.1f}/s, "
+                f"p50 {result['p50_ms']:.0f} ms, p95 {result['p95_ms']:.0f} ms, "
+                f"p99 {result['p99_ms']:.0f} ms, max {result['max_ms']:.0f} ms, "
+                f"errors {result['error_rate']:.1%} ({statuses})"
+            )
+
+        if report["grading_statuses"]:
+            self.stdout.write(
+                "grading statuses: "
+                + ", ".join(f"{s}: {n}" for s, n in report["grading_statuses"].items())
+            )
+
+        if "database" in report:
+            database = report["database"]
+            self.stdout.write(
+                f"database: {database['queries']} queries, {database['writes']} "
+                f"writes taking {database['write_total_sec']:.2f} s, "
+                f"write p50 {database['write_p50_ms']:.1f} ms, "
+                f"p99 {database['write_p99_ms']:.1f} ms, "
+                f"max {database['write_max_ms']:.0f} ms, "
+                f"{database['lock_errors']} lock errors"
+            )
+
+    def _compare(self, report: dict, baseline: dict) -> None:
+        self.stdout.write("Compared with the baseline:")
+
+        for endpoint, result in report["endpoints"].items():
+            before = baseline["endpoints"].get(endpoint)
+
+            if before is None:
+                continue
+
+            changes = []
+
+            for name in ("p50_ms", "p95_ms", "p99_ms", "throughput_per_sec"):
+                if before[name]:
+                    change = (result[name] - before[name]) / before[name]
+                    changes.append(f"{name} {change:+.1%}")
+
+            changes.append(
+                f"error_rate {before['error_rate']:.1%} -> {result['error_rate']:.1%}"
+            )
+            self.stdout.write(f"{endpoint}: " + ", ".join(changes))
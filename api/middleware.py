@@ -0,0 +1,216 @@
+import asyncio
+import cProfile
+import itertools
+import json
+import logging
+import os
+import time
+
+from django.conf import settings
+from django.http import HttpRequest, HttpResponse
+from django.urls import Resolver404, resolve
+from django.utils.functional import LazyObject
+
+from core import tracing
+from core.profiling import RequestProfile, profile_request
+
+logger = logging.getLogger(__name__)
+
+
+def _user_id(request: HttpRequest) -> int | None:
+    user = getattr(request, "user", None)
+
+    # Reading the session user nobody has asked for would query the database
+    if user is None or isinstance(user, LazyObject):
+        return None
+
+    return user.id
+
+
+class ProfilingMiddleware:
+    """
+    Adds the SQL, grader, serialization and total time of every request
+    as a Server-Timing header and logs requests slower than
+    PROFILING_SLOW_REQUEST_MS. One in PROFILING_SAMPLE_EVERY requests to
+    the PROFILING_SAMPLE_VIEWS url names is run under cProfile, its stats
+    are written to PROFILING_DIR. Only the thread serving the request is
+    profiled, under ASGI that is the event loop shared with other requests.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response) -> None:
+        self.get_response = get_response
+        self._counter = itertools.count(1)
+
+        if asyncio.iscoroutinefunction(self.get_response):
+            # Same way as MiddlewareMixin tells Django this is a coroutine
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request: HttpRequest):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+
+        sampler = self._start_sampler(request)
+
+        with profile_request() as profile:
+            try:
+                response = self.get_response(request)
+            finally:
+                if sampler is not None:
+                    sampler.disable()
+
+        self._finish(request, response, profile, sampler)
+        return response
+
+    async def __acall__(self, request: HttpRequest) -> HttpResponse:
+        sampler = self._start_sampler(request)
+
+        with profile_request() as profile:
+            try:
+                response = await self.get_response(request)
+            finally:
+                if sampler is not None:
+                    sampler.disable()
+
+        self._finish(request, response, profile, sampler)
+        return response
+
+    def _start_sampler(self, request: HttpRequest) -> cProfile.Profile | None:
+        if not settings.PROFILING_SAMPLE_EVERY:
+            return None
+
+        try:
+            # Under ASGI requests have their own urlconf, see config/asgi.py
+            url_name = resolve(
+                request.path_info, getattr(request, "urlconf", None)
+            ).url_name
+        except Resolver404:
+            return None
+
+        if (
+            url_name not in settings.PROFILING_SAMPLE_VIEWS
+            or next(self._counter) % settings.PROFILING_SAMPLE_EVERY
+        ):
+            return None
+
+        sampler = cProfile.Profile()
+        sampler.enable()
+        return sampler
+
+    def _finish(
+        self,
+        request: HttpRequest,
+        response: HttpResponse,
+        profile: RequestProfile,
+        sampler: cProfile.Profile | None,
+    ) -> None:
+        elapsed = profile.elapsed
+        durations = {**profile.durations, "total": elapsed}
+
+        if settings.PROFILING_SERVER_TIMING:
+            response["Server-Timing"] = ", ".join(
+                self._server_timing(name, seconds, profile)
+                for name, seconds in durations.items()
+            )
+
+        if sampler is not None:
+            self._dump(request, sampler)
+
+        if elapsed * 1000 >= settings.PROFILING_SLOW_REQUEST_MS:
+            resolver_match = request.resolver_match
+            entry = {
+                "method": request.method,
+                "path": request.path,
+                "view": resolver_match.view_name if resolver_match else None,
+                "status": response.status_code,
+                "user": _user_id(request),
+                "queries": profile.query_count,
+                "trace": span.trace_id if (span := tracing.current_span()) else None,
+                **{f"{name}_ms": round(s * 1000, 1) for name, s in durations.items()},
+            }
+            logger.warning("Slow request %s", json.dumps(entry), extra=entry)
+
+    @staticmethod
+    def _server_timing(name: str, seconds: float, profile: RequestProfile) -> str:
+        metric = f"{name};dur={seconds * 1000:.1f}"
+
+        if name == "db":
+            metric += f';desc="{profile.query_count} queries"'
+
+        return metric
+
+    @staticmethod
+    def _dump(request: HttpRequest, sampler: cProfile.Profile) -> None:
+        os.makedirs(settings.PROFILING_DIR, exist_ok=True)
+        url_name = request.resolver_match.url_name if request.resolver_match else ""
+        file_name = f"{url_name}-{time.time_ns()}-{os.getpid()}.prof"
+        sampler.dump_stats(os.path.join(settings.PROFILING_DIR, file_name))
+
+
+class TracingMiddleware:
+    """
+    Traces the request, continuing the trace of its ``traceparent``
+    header. The request span is named after the view and its action and
+    is returned to the caller in the ``traceresponse`` header.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response) -> None:
+        self.get_response = get_response
+
+        if asyncio.iscoroutinefunction(self.get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request: HttpRequest):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+
+        with self._start_trace(request) as span:
+            response = self.get_response(request)
+            self._finish(request, response, span)
+
+        return response
+
+    async def __acall__(self, request: HttpRequest) -> HttpResponse:
+        with self._start_trace(request) as span:
+            response = await self.get_response(request)
+            self._finish(request, response, span)
+
+        return response
+
+    @staticmethod
+    def _start_trace(request: HttpRequest):
+        return tracing.start_trace(
+            request.method,
+            request.headers.get("traceparent"),
+            {"http.method": request.method, "http.target": request.path},
+        )
+
+    @staticmethod
+    def _finish(
+        request: HttpRequest, response: HttpResponse, span: tracing.Span | None
+    ) -> None:
+        if span is None:
+            return
+
+        resolver_match = request.resolver_match
+
+        if resolver_match is not None:
+            # Viewsets map the method to an action, e.g. finish
+            actions = getattr(resolver_match.func, "actions", {})
+            action = actions.get(request.method.lower(), resolver_match.url_name)
+            span.name = f"{request.method} {resolver_match.view_name}"
+            span.set_attribute("http.route", resolver_match.route)
+            span.set_attribute("view.action", action)
+
+        span.set_attribute("http.status_code", response.status_code)
+        span.set_attribute("user.id", _user_id(request))
+
+        if response.status_code >= 500:
+            span.status = "error"
+
+        response["traceresponse"] = span.traceparent
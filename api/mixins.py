@@ -0,0 +1,68 @@
+import contextlib
+
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.request import Request
+from rest_framework.response import Response
+
+from api.values_serializers import ValuesSerializer
+from core.db import is_pinned_to_primary, pin_to_primary, use_replica
+
+
+class ReplicaReadMixin:
+    """
+    Serves `replica_actions` from the read replica. Users are pinned to
+    the default database for a while after any successful write, so
+    they always see their own changes, e.g. results right after finish.
+    """
+
+    replica_actions: tuple[str, ...] = ()
+
+    def initial(self, request: Request, *args, **kwargs) -> None:
+        self._replica_reads = contextlib.ExitStack()
+        super().initial(request, *args, **kwargs)
+
+        # Permissions are checked on the default database above
+        if (
+            self.action in self.replica_actions
+            and request.method in SAFE_METHODS
+            and not is_pinned_to_primary(request.user.id)
+        ):
+            self._replica_reads.enter_context(use_replica())
+
+    def finalize_response(
+        self, request: Request, response: Response, *args, **kwargs
+    ) -> Response:
+        if hasattr(self, "_replica_reads"):
+            self._replica_reads.close()
+
+        if (
+            request.method not in SAFE_METHODS
+            and response.status_code < 400
+            and request.user.is_authenticated
+        ):
+            pin_to_primary(request.user.id)
+
+        return super().finalize_response(request, response, *args, **kwargs)
+
+
+class ValuesListMixin:
+    """
+    Lists `.values()` rows rendered by `values_serializer_class` instead
+    of model instances rendered by the serializer class, which is still
+    used for the schema and every other action.
+    """
+
+    values_serializer_class: type[ValuesSerializer]
+
+    def list(self, request: Request, *args, **kwargs) -> Response:
+        serializer_class = self.values_serializer_class
+        queryset = self.filter_queryset(self.get_queryset()).values(
+            *serializer_class.lookups
+        )
+
+        page = self.paginate_queryset(queryset)
+
+        if page is not None:
+            return self.get_paginated_response(serializer_class(page, many=True).data)
+
+        return Response(serializer_class(queryset, many=True).data)
@@ -0,0 +1,29 @@
+from django.conf import settings
+from rest_framework.pagination import CursorPagination
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Pages by the position of the last row instead of an offset, so pages
+    stay stable when rows are inserted and deep pages are as fast as the
+    first one. Ordering has to be backed by an index.
+    """
+
+    page_size_query_param = "page_size"
+
+    def __init__(self) -> None:
+        self.page_size = settings.API_PAGE_SIZE
+        self.max_page_size = settings.API_MAX_PAGE_SIZE
+
+
+class CoursePagination(KeysetPagination):
+    ordering = ("-created_at", "-id")
+
+
+class TaskPagination(KeysetPagination):
+    ordering = ("-created_at", "-id")
+
+
+class TaskSessionPagination(KeysetPagination):
+    # Ordering comes from the view's ordering filter
+    ordering = ("id",)
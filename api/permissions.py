@@ -1,9 +1,11 @@
 from typing import Any
 
+from django.http import Http404
 from rest_framework.generics import get_object_or_404
 from rest_framework.permissions import BasePermission
 from rest_framework.request import Request
 
+from core.memberships import get_course_permission
 from core.models import Subject, CourseMembership
 
 
@@ -21,15 +23,16 @@ class IsCourseBasePermission(BasePermission):
 
     def has_permission(self, request: Request, view: Any) -> bool:
         course_pk = view.kwargs.get("course_pk") or view.kwargs.get("pk")
-        return (
-            request.user.is_authenticated
-            and get_object_or_404(
-                CourseMembership,
-                user=request.user,
-                course_id=course_pk,
-            ).permission
-            in self.permissions
-        )
+
+        if not request.user.is_authenticated:
+            return False
+
+        permission = get_course_permission(request, course_pk)
+
+        if permission is None:
+            raise Http404
+
+        return permission in self.permissions
 
 
 class IsCourseOwner(IsCourseBasePermission):
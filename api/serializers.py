@@ -1,6 +1,10 @@
+from drf_spectacular.utils import extend_schema_field
 from rest_framework import serializers
 
 from account.serializers import UserSerializer
+from core.memberships import get_course_permission
+from core.profiling import SerializeTimerMixin
+from core.task_cache import get_task_payload, get_task_version
 from core.models import (
     Subject,
     Course,
@@ -13,14 +17,23 @@ from core.models import (
 )
 
 
-class SubjectNestedSerializer(serializers.ModelSerializer):
+# Bases of the serializers below, timed in the request profile
+class ModelSerializer(SerializeTimerMixin, serializers.ModelSerializer):
+    pass
+
+
+class Serializer(SerializeTimerMixin, serializers.Serializer):
+    pass
+
+
+class SubjectNestedSerializer(ModelSerializer):
     class Meta:
         model = Subject
         fields = ("id", "name")
         read_only_fields = ("id",)
 
 
-class SubjectSerializer(serializers.ModelSerializer):
+class SubjectSerializer(ModelSerializer):
     teachers = UserSerializer(many=True, read_only=True)
 
     class Meta:
@@ -29,28 +42,35 @@ class SubjectSerializer(serializers.ModelSerializer):
         read_only_fields = ("id", "teachers", "invitation_token")
 
 
-class QuizSerializer(serializers.ModelSerializer):
+class QuizSerializer(ModelSerializer):
     class Meta:
         model = Quiz
-        fields = ("id", "name", "max_duration", "subject")
+        fields = ("id", "name", "max_duration", "subject", "pregrading_rules")
         read_only_fields = ("id", "subject")
 
 
-class QuestionSerializer(serializers.ModelSerializer):
+class QuestionSerializer(ModelSerializer):
     class Meta:
         model = Question
-        fields = ("id", "title", "expected_answer", "value", "quiz")
+        fields = (
+            "id",
+            "title",
+            "expected_answer",
+            "value",
+            "quiz",
+            "pregrading_rules",
+        )
         read_only_fields = ("id", "quiz")
 
 
-class QuestionNestedSerializer(serializers.ModelSerializer):
+class QuestionNestedSerializer(ModelSerializer):
     class Meta:
         model = Question
         fields = ("id", "title", "value")
         read_only_fields = ("id", "title", "value")
 
 
-class CourseCreateSerializer(serializers.ModelSerializer):
+class CourseCreateSerializer(ModelSerializer):
     class Meta:
         model = Course
         fields = ("id", "name", "subject", "users", "invitation_token")
@@ -70,7 +90,7 @@ class CourseCreateSerializer(serializers.ModelSerializer):
         return course
 
 
-class CourseSerializer(serializers.ModelSerializer):
+class CourseSerializer(ModelSerializer):
     users = UserSerializer(many=True, read_only=True)
     subject = SubjectNestedSerializer(many=False, read_only=True)
 
@@ -80,7 +100,15 @@ class CourseSerializer(serializers.ModelSerializer):
         read_only_fields = ("id", "users", "invitation_token")
 
 
-class CourseMembershipSerializer(serializers.ModelSerializer):
+class CourseListSerializer(CourseSerializer):
+    users_count = serializers.IntegerField(read_only=True)
+
+    class Meta(CourseSerializer.Meta):
+        fields = ("id", "name", "subject", "users_count", "invitation_token")
+        read_only_fields = ("id", "users_count", "invitation_token")
+
+
+class CourseMembershipSerializer(ModelSerializer):
     user = UserSerializer(many=False, read_only=True)
 
     class Meta:
@@ -96,19 +124,16 @@ class CourseDetailSerializer(CourseSerializer):
     is_admin = serializers.SerializerMethodField()
 
     def get_is_admin(self, obj: Course) -> bool:
-        membership = CourseMembership.objects.get(
-            user=self.context["request"].user,
-            course=obj,
-        )
+        permission = get_course_permission(self.context["request"], obj.id)
 
-        return membership.permission != CourseMembership.UserPermission.STUDENT
+        return permission != CourseMembership.UserPermission.STUDENT
 
     class Meta:
         model = Course
         fields = CourseSerializer.Meta.fields + ("is_admin",)
 
 
-class TaskSerializer(serializers.ModelSerializer):
+class TaskSerializer(ModelSerializer):
     quiz_name = serializers.CharField(source="quiz.name", read_only=True)
 
     class Meta:
@@ -117,7 +142,7 @@ class TaskSerializer(serializers.ModelSerializer):
         read_only_fields = ("id", "course")
 
 
-class QuizNestedSerializer(serializers.ModelSerializer):
+class QuizNestedSerializer(ModelSerializer):
     questions = QuestionNestedSerializer(many=True, read_only=True)
 
     class Meta:
@@ -125,7 +150,7 @@ class QuizNestedSerializer(serializers.ModelSerializer):
         fields = ("id", "name", "max_duration", "subject", "questions")
 
 
-class TaskDetailSerializer(serializers.ModelSerializer):
+class TaskDetailSerializer(ModelSerializer):
     quiz = QuizNestedSerializer(many=False, read_only=True)
 
     class Meta:
@@ -134,7 +159,7 @@ class TaskDetailSerializer(serializers.ModelSerializer):
         read_only_fields = ("id", "course", "quiz")
 
 
-class TaskSessionSerializer(serializers.ModelSerializer):
+class TaskSessionSerializer(ModelSerializer):
     user_full_name = serializers.CharField(source="user.get_full_name")
 
     class Meta:
@@ -146,29 +171,50 @@ class TaskSessionSerializer(serializers.ModelSerializer):
             "task",
             "user",
             "user_full_name",
+            "grading_status",
             "total_mark",
+            "max_mark",
         )
 
 
-class TaskSessionDetailSerializer(serializers.ModelSerializer):
-    task = TaskDetailSerializer(many=False, read_only=True)
+class TaskSessionDetailSerializer(ModelSerializer):
+    task = serializers.SerializerMethodField()
     user = UserSerializer(many=False, read_only=True)
 
+    @extend_schema_field(TaskDetailSerializer)
+    def get_task(self, obj: TaskSession) -> dict:
+        # Same for every student of the task, so it's rendered once
+        return get_task_payload(
+            "detail",
+            obj.task_id,
+            get_task_version(obj.task_id),
+            lambda: TaskDetailSerializer(obj.task).data,
+        )
+
     class Meta:
         model = TaskSession
         fields = ("id", "started_at", "finished_at", "task", "user")
         read_only_fields = ("id", "started_at", "finished_at", "task", "user")
 
 
-class UserAnswerSerializer(serializers.ModelSerializer):
+class UserAnswerSerializer(ModelSerializer):
     question = QuestionSerializer(many=False, read_only=True)
 
     class Meta:
         model = UserAnswer
-        fields = ("id", "question", "comment", "text", "score", "is_adjusted", "mark")
+        fields = (
+            "id",
+            "question",
+            "comment",
+            "text",
+            "score",
+            "is_adjusted",
+            "pregrading_rule",
+            "mark",
+        )
 
 
-class TaskSessionResultSerializer(serializers.ModelSerializer):
+class TaskSessionResultSerializer(ModelSerializer):
     task = TaskDetailSerializer(many=False, read_only=True)
     user_answers = UserAnswerSerializer(
         source="useranswer_set", many=True, read_only=True
@@ -182,24 +228,40 @@ class TaskSessionResultSerializer(serializers.ModelSerializer):
             "finished_at",
             "task",
             "user_answers",
+            "grading_status",
             "total_mark",
+            "max_mark",
         )
 
+    def to_representation(self, instance: TaskSession) -> dict:
+        data = super().to_representation(instance)
+
+        # Answers are graded as they're saved, grades are only shown
+        # once they can't be changed anymore
+        if instance.finished_at is None:
+            for user_answer in data["user_answers"]:
+                user_answer.update(
+                    score=None, comment="", pregrading_rule="", mark=None
+                )
+
+        return data
+
 
-class InvitationTokenSerializer(serializers.Serializer):
+class InvitationTokenSerializer(Serializer):
     invitation_token = serializers.CharField(max_length=255, required=True)
 
 
-class AnswerSerializer(serializers.Serializer):
+class AnswerSerializer(Serializer):
     question_id = serializers.IntegerField(required=True)
-    answer = serializers.CharField(required=True)
+    answer = serializers.CharField(required=True, allow_blank=True)
 
 
-class TaskSessionFinishSerializer(serializers.Serializer):
-    answers = AnswerSerializer(many=True, required=True)
+class TaskSessionFinishSerializer(Serializer):
+    # Answers saved one by one before are kept unless they're sent again
+    answers = AnswerSerializer(many=True, required=False, default=list)
 
 
-class ChangeCourseUserPermissionSerializer(serializers.ModelSerializer):
+class ChangeCourseUserPermissionSerializer(ModelSerializer):
     class Meta:
         model = CourseMembership
         fields = ("permission", "user")
@@ -0,0 +1,185 @@
+import datetime
+import json
+import os
+import subprocess
+import sys
+import threading
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connections
+from django.test import TransactionTestCase, override_settings
+from rest_framework.test import APIClient
+
+from api.tests.test_finish import FinishTestMixin
+from api.tests.utils import asgi_request
+from core.models import GradingJob, Task
+
+
+class ASGIConnectionTest(FinishTestMixin, TransactionTestCase):
+    def setUp(self):
+        self.create_fixture()
+
+    def test_entrypoint_closes_connections_after_requests(self):
+        result = subprocess.run(
+            [
+                sys.executable,
+                "-c",
+                "import config.asgi; from django.conf import settings; "
+                "print(settings.DATABASES['default']['CONN_MAX_AGE'])",
+            ],
+            cwd=settings.BASE_DIR,
+            env={**os.environ, "DATABASE_CONN_MAX_AGE": "60"},
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+
+        self.assertEqual(result.stdout.strip(), "0")
+
+    async def test_connection_is_closed_after_request(self):
+        wrapper_class = type(connections["default"])
+        close = wrapper_class.close
+        closed_in = []
+
+        # SQLite test databases are in memory and never really closed
+        def record_close(wrapper):
+            closed_in.append(threading.get_ident())
+            close(wrapper)
+
+        with mock.patch.dict(
+            connections.settings["default"], {"CONN_MAX_AGE": 0}
+        ), mock.patch.object(wrapper_class, "close", record_close):
+            status_code, _ = await asgi_request(
+                self.task_path("start"), self.student, method="POST"
+            )
+
+        self.assertEqual(status_code, 200)
+        # Closed by the request's own thread, the only one using it
+        self.assertTrue(closed_in)
+        self.assertNotIn(threading.get_ident(), closed_in)
+
+
+@override_settings(
+    GRADING_ASYNC=False,
+    GRADER_BACKEND="openai_client.backends.LocalGraderBackend",
+    GRADER_LOCAL_LATENCY_MS=0,
+    GRADER_LOCAL_LATENCY_JITTER_MS=0,
+)
+class ASGIIdempotencyTest(FinishTestMixin, TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.create_fixture()
+
+    async def finish(self, data: dict) -> tuple[int, dict]:
+        status_code, content = await asgi_request(
+            self.task_path("finish"),
+            self.student,
+            method="POST",
+            body=json.dumps(data).encode(),
+            extra_headers={"Idempotency-Key": "key"},
+        )
+        return status_code, json.loads(content)
+
+    async def test_key_is_only_replayed_for_same_body(self):
+        first = await self.finish(self.finish_data())
+        second = await self.finish(self.finish_data())
+        other = await self.finish(self.finish_data(answer="Something else"))
+
+        self.assertEqual(first[0], 200)
+        self.assertEqual(second, first)
+        self.assertEqual(other[0], 422)
+
+
+@override_settings(
+    GRADING_ASYNC=False,
+    GRADER_BACKEND="openai_client.backends.LocalGraderBackend",
+    GRADER_LOCAL_LATENCY_MS=0,
+    GRADER_LOCAL_LATENCY_JITTER_MS=0,
+)
+class ASGITaskTest(FinishTestMixin, TransactionTestCase):
+    """Start and finish served by the async views."""
+
+    def setUp(self):
+        cache.clear()
+        self.create_fixture()
+
+    async def post(self, action: str, user=None, data: dict = None) -> tuple[int, dict]:
+        status_code, content = await asgi_request(
+            self.task_path(action),
+            user,
+            method="POST",
+            body=json.dumps(data).encode() if data is not None else b"",
+        )
+        return status_code, json.loads(content)
+
+    def sync_post(self, action: str, user=None, data: dict = None) -> tuple[int, dict]:
+        client = APIClient()
+
+        if user is not None:
+            client.force_authenticate(user)
+
+        response = client.post(self.task_path(action), data, format="json")
+        return response.status_code, response.json()
+
+    async def test_start_and_finish(self):
+        status_code, started = await self.post("start", self.student)
+
+        self.assertEqual(status_code, 200)
+        self.assertEqual(started["task_session"]["id"], self.task_session.id)
+
+        status_code, finished = await self.post(
+            "finish", self.student, self.finish_data()
+        )
+
+        self.assertEqual(status_code, 200)
+        self.assertEqual(finished["grading_status"], "graded")
+        self.assertEqual(
+            [answer["question"]["id"] for answer in finished["user_answers"]],
+            [question.id for question in self.questions],
+        )
+        self.assertTrue(
+            all(answer["score"] is not None for answer in finished["user_answers"])
+        )
+
+        status_code, _ = await self.post("finish", self.student, self.finish_data())
+
+        self.assertEqual(status_code, 400)
+
+    @override_settings(GRADING_ASYNC=True)
+    async def test_finish_queues_grading(self):
+        status_code, finished = await self.post(
+            "finish", self.student, self.finish_data()
+        )
+
+        self.assertEqual(status_code, 202)
+        self.assertEqual(finished["grading_status"], "pending")
+        self.assertEqual(
+            await GradingJob.objects.filter(task_session=self.task_session).acount(), 1
+        )
+
+    async def test_errors_match_sync_views(self):
+        outsider = await sync_to_async(get_user_model().objects.create_user)(
+            email="outsider@example.com", password="password"
+        )
+        await Task.objects.filter(id=self.task.id).aupdate(
+            deadline=datetime.datetime.now() - datetime.timedelta(minutes=1)
+        )
+        cases = [
+            ("start", None, None),
+            ("finish", outsider, self.finish_data()),
+            ("start", self.student, None),
+            ("finish", self.student, {"answers": [{"question_id": 0}]}),
+        ]
+
+        for action, user, data in cases:
+            with self.subTest(action=action, user=user, data=data), self.assertLogs(
+                "django.request", "WARNING"
+            ):
+                self.assertEqual(
+                    await self.post(action, user, data),
+                    await sync_to_async(self.sync_post)(action, user, data),
+                )
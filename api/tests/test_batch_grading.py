@@ -0,0 +1,85 @@
+import json
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from openai_client import main
+from openai_client.grading import GradingRequest, grade_concurrently
+
+
+def completion(content: str) -> dict:
+    return {"choices": [{"message": {"content": content}}], "usage": {}}
+
+
+class ParseBatchAnswerTest(SimpleTestCase):
+    def test_maps_items_by_id(self):
+        message = json.dumps(
+            [
+                {"id": 2, "score": 40, "explanation": "Second"},
+                {"id": 9, "score": 90, "explanation": "Not asked for"},
+                {"id": 1, "score": 100, "explanation": "First"},
+                {"id": 3, "score": 101, "explanation": "Out of range"},
+                {"id": 4, "explanation": "No score"},
+            ]
+        )
+
+        self.assertEqual(
+            main.parse_batch_answer(message, [1, 2, 3, 4]),
+            {1: (100, "First"), 2: (40, "Second")},
+        )
+
+    def test_rejects_malformed_reply(self):
+        for message in ("Score: 100%", '{"id": 1, "score": 100}'):
+            with self.subTest(message=message), self.assertRaises(main.BatchParseError):
+                main.parse_batch_answer(message, [1])
+
+
+@override_settings(
+    GRADER_BACKEND="openai_client.backends.OpenAIGraderBackend",
+    GRADING_BATCH_SIZE=3,
+    GRADING_MAX_WORKERS=1,
+)
+class BatchFallbackTest(SimpleTestCase):
+    requests = [
+        GradingRequest(question_id, f"Question {question_id}", "Expected", "Answer")
+        for question_id in (1, 2, 3)
+    ]
+
+    def grade(self, batch_reply: str) -> tuple[dict, list[str]]:
+        """Results, and the questions graded one by one after the batch."""
+        graded_alone = []
+
+        def create_completion(messages: list[dict], answers_count: int = 1) -> dict:
+            if messages[0]["content"] == main.SYSTEM_BATCH_TEACHER_PROMPT:
+                return completion(batch_reply)
+
+            graded_alone.append(messages[-1]["content"].split("\n")[0])
+            return completion("Score: 50%\nExplanation: Alone")
+
+        with mock.patch.object(main, "create_completion", create_completion):
+            return grade_concurrently(self.requests), graded_alone
+
+    def test_short_reply_falls_back_for_missing_answers(self):
+        results, graded_alone = self.grade(
+            json.dumps(
+                [
+                    {"id": 3, "score": 30, "explanation": "Third"},
+                    {"id": 1, "score": 10, "explanation": "First"},
+                ]
+            )
+        )
+
+        self.assertEqual(
+            {question_id: result.score for question_id, result in results.items()},
+            {1: 10, 2: 50, 3: 30},
+        )
+        self.assertEqual(results[3].explanation, "Third")
+        self.assertEqual(graded_alone, ["Q: Question 2"])
+
+    def test_malformed_reply_falls_back_for_every_answer(self):
+        with self.assertLogs("openai_client.grading", "ERROR"):
+            results, graded_alone = self.grade("Score: 100%")
+
+        self.assertTrue(all(result.score == 50 for result in results.values()))
+        self.assertEqual(len(results), 3)
+        self.assertEqual(len(graded_alone), 3)
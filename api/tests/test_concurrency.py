@@ -0,0 +1,320 @@
+import asyncio
+import datetime
+import threading
+import time
+from unittest import mock
+
+import openai
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from api import idempotency
+from api.idempotency import acquire_lock, release_lock, wait_for_lock_release
+from core.grading import claim_next_job
+from core.models import Course, GradingJob, Quiz, Subject, Task, TaskSession
+from openai_client.rate_limit import (
+    AdaptiveConcurrencyLimiter,
+    DeadlineExceeded,
+    RateLimiter,
+    TokenBucket,
+)
+
+LOCMEM_CACHE = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "concurrency-tests",
+    }
+}
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class LockTest(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_lock_is_exclusive(self):
+        token = acquire_lock("key")
+
+        self.assertIsNotNone(token)
+        self.assertIsNone(acquire_lock("key"))
+        self.assertIsNotNone(acquire_lock("other-key"))
+
+        release_lock("key", token)
+
+        self.assertIsNotNone(acquire_lock("key"))
+
+    def test_release_keeps_lock_of_other_holder(self):
+        acquire_lock("key")
+
+        release_lock("key", "expired token")
+
+        self.assertIsNone(acquire_lock("key"))
+
+    @override_settings(FINISH_WAIT_TIMEOUT_SEC=0)
+    def test_wait_times_out(self):
+        acquire_lock("key")
+
+        self.assertFalse(wait_for_lock_release("key"))
+
+    @mock.patch.object(idempotency, "LOCK_POLL_INTERVAL_SEC", 0.01)
+    def test_wait_returns_on_release(self):
+        token = acquire_lock("key")
+        releaser = threading.Timer(0.05, release_lock, ("key", token))
+        releaser.start()
+        self.addCleanup(releaser.join)
+
+        self.assertTrue(wait_for_lock_release("key"))
+        self.assertIsNotNone(acquire_lock("key"))
+
+
+@override_settings(GRADING_JOB_TIMEOUT_SEC=600)
+class ClaimJobTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = get_user_model().objects.create_user(
+            email="student@example.com", password="password"
+        )
+        subject = Subject.objects.create(name="Subject")
+        task = Task.objects.create(
+            title="Task",
+            deadline=datetime.datetime.now() + datetime.timedelta(days=1),
+            course=Course.objects.create(name="Course", subject=subject),
+            quiz=Quiz.objects.create(name="Quiz", max_duration=60, subject=subject),
+        )
+        cls.task_session = TaskSession.objects.create(task=task, user=user)
+
+    def create_job(self, **kwargs) -> GradingJob:
+        return GradingJob.objects.create(task_session=self.task_session, **kwargs)
+
+    def test_claims_oldest_queued_job_once(self):
+        first = self.create_job()
+        second = self.create_job()
+        self.create_job(status=GradingJob.Status.DONE)
+
+        claimed = [claim_next_job("worker-1"), claim_next_job("worker-2")]
+
+        self.assertEqual([job.id for job in claimed], [first.id, second.id])
+        self.assertEqual([job.claimed_by for job in claimed], ["worker-1", "worker-2"])
+        self.assertTrue(all(job.status == GradingJob.Status.RUNNING for job in claimed))
+        self.assertTrue(all(job.attempts == 1 for job in claimed))
+        self.assertIsNone(claim_next_job("worker-3"))
+
+    def test_reclaims_stale_job(self):
+        now = datetime.datetime.now()
+        self.create_job(
+            status=GradingJob.Status.RUNNING,
+            claimed_by="worker-1",
+            claimed_at=now - datetime.timedelta(seconds=60),
+            attempts=1,
+        )
+        stale = self.create_job(
+            status=GradingJob.Status.RUNNING,
+            claimed_by="worker-2",
+            claimed_at=now - datetime.timedelta(seconds=601),
+            attempts=1,
+        )
+
+        job = claim_next_job("worker-3")
+
+        self.assertEqual(job.id, stale.id)
+        self.assertEqual(job.claimed_by, "worker-3")
+        self.assertEqual(job.attempts, 2)
+        self.assertIsNone(claim_next_job("worker-4"))
+
+    def test_lost_race_takes_next_job(self):
+        first = self.create_job()
+        second = self.create_job()
+        filter_jobs = GradingJob.objects.filter
+
+        def claim_first_meanwhile(*args, **kwargs):
+            # Another worker claims the job between our read and update
+            if kwargs.get("id") == first.id and "claimed_by" not in kwargs:
+                GradingJob._base_manager.filter(id=first.id).update(
+                    status=GradingJob.Status.RUNNING,
+                    claimed_by="other",
+                    claimed_at=datetime.datetime.now(),
+                )
+
+            return filter_jobs(*args, **kwargs)
+
+        with mock.patch.object(
+            GradingJob.objects, "filter", side_effect=claim_first_meanwhile
+        ):
+            job = claim_next_job("worker-1")
+
+        self.assertEqual(job.id, second.id)
+        self.assertEqual(GradingJob.objects.get(id=first.id).claimed_by, "other")
+
+
+class TokenBucketTest(SimpleTestCase):
+    def test_waits_for_refill(self):
+        bucket = TokenBucket(per_minute=60)
+        bucket.acquire(60, deadline=time.monotonic())
+
+        with self.assertRaises(DeadlineExceeded):
+            bucket.acquire(10, deadline=time.monotonic() + 1)
+
+        started_at = time.monotonic()
+        bucket.acquire(1, deadline=time.monotonic() + 5)
+
+        self.assertGreater(time.monotonic() - started_at, 0.5)
+
+    def test_adjust_refunds_unused_units(self):
+        bucket = TokenBucket(per_minute=60)
+        bucket.acquire(60, deadline=time.monotonic())
+
+        bucket.adjust(-30)
+
+        bucket.acquire(30, deadline=time.monotonic())
+
+
+class AdaptiveConcurrencyLimiterTest(SimpleTestCase):
+    def call(
+        self,
+        limiter: AdaptiveConcurrencyLimiter,
+        latency: float,
+        answers_count: int = 1,
+        is_throttled: bool = False,
+    ) -> None:
+        limiter.acquire("course", deadline=time.monotonic())
+        limiter.release(time.monotonic() - latency, answers_count, is_throttled)
+
+    def test_limit_adapts(self):
+        limiter = AdaptiveConcurrencyLimiter(max_limit=8, target_latency=0.01)
+
+        self.call(limiter, latency=0, is_throttled=True)
+        self.assertEqual(limiter.limit, 4)
+
+        self.call(limiter, latency=0)
+        self.assertEqual(limiter.limit, 4.25)
+
+        limiter.acquire("course", deadline=time.monotonic())
+        started_at = time.monotonic()
+        time.sleep(0.02)
+        limiter.release(started_at, 1, is_throttled=False)
+        self.assertEqual(limiter.limit, 2.125)
+        self.assertEqual(limiter.in_flight, 0)
+
+    def test_latency_is_per_answer(self):
+        limiter = AdaptiveConcurrencyLimiter(max_limit=8, target_latency=1)
+        limiter.limit = 4
+
+        self.call(limiter, latency=3, answers_count=5)
+
+        self.assertEqual(limiter.limit, 4.25)
+
+    def test_decreases_once_per_window(self):
+        limiter = AdaptiveConcurrencyLimiter(max_limit=8, target_latency=1)
+        started_at = time.monotonic()
+
+        for _ in range(3):
+            limiter.acquire("course", deadline=started_at)
+
+        # Calls in flight during the overload all end throttled
+        for _ in range(3):
+            limiter.release(started_at, 1, is_throttled=True)
+
+        self.assertEqual(limiter.limit, 4)
+
+        self.call(limiter, latency=0, is_throttled=True)
+        self.assertEqual(limiter.limit, 2)
+
+    def test_full_limiter_times_out(self):
+        limiter = AdaptiveConcurrencyLimiter(max_limit=1, target_latency=1)
+        limiter.acquire("course", deadline=time.monotonic())
+
+        with self.assertRaises(DeadlineExceeded):
+            limiter.acquire("course", deadline=time.monotonic() + 0.05)
+
+        self.assertEqual(limiter.in_flight, 1)
+        self.assertFalse(limiter._waiting)
+
+    def test_courses_take_turns(self):
+        limiter = AdaptiveConcurrencyLimiter(max_limit=1, target_latency=1)
+        admitted = []
+
+        async def call(course: str, name: str) -> None:
+            await limiter.aacquire(course, deadline=time.monotonic() + 5)
+            admitted.append(name)
+
+        async def run() -> None:
+            limiter.acquire("busy", deadline=time.monotonic())
+            calls = [
+                asyncio.create_task(call(course, name))
+                for course, name in [("a", "a1"), ("a", "a2"), ("b", "b1")]
+            ]
+            await asyncio.sleep(0.01)
+
+            for _ in calls:
+                limiter.release(time.monotonic(), 1, is_throttled=False)
+                await asyncio.sleep(0.01)
+
+            await asyncio.gather(*calls)
+
+        asyncio.run(run())
+
+        self.assertEqual(admitted, ["a1", "b1", "a2"])
+
+
+@override_settings(
+    CACHES=LOCMEM_CACHE,
+    OPENAI_RATE_LIMIT_SHARED=False,
+    OPENAI_MAX_RETRIES=2,
+    OPENAI_RETRY_BASE_DELAY_SEC=0,
+    OPENAI_CALL_DEADLINE_SEC=5,
+)
+class RateLimiterTest(SimpleTestCase):
+    def test_retries_throttled_calls(self):
+        function = mock.Mock(
+            side_effect=[openai.error.RateLimitError("Slow down"), {"usage": {}}]
+        )
+
+        response = RateLimiter().call(function, estimated_tokens=10, model="model")
+
+        self.assertEqual(response, {"usage": {}})
+        self.assertEqual(function.call_count, 2)
+
+    def test_gives_up_after_max_retries(self):
+        function = mock.Mock(side_effect=openai.error.Timeout("Timed out"))
+
+        with self.assertRaises(openai.error.Timeout):
+            RateLimiter().call(function, estimated_tokens=10, model="model")
+
+        self.assertEqual(function.call_count, 3)
+
+    def test_charges_used_tokens(self):
+        limiter = RateLimiter()
+        function = mock.Mock(return_value={"usage": {"total_tokens": 100}})
+
+        limiter.call(function, estimated_tokens=10, model="model")
+
+        self.assertAlmostEqual(
+            limiter.tokens.available, limiter.tokens.capacity - 100, delta=10
+        )
+
+    @override_settings(OPENAI_MAX_CONCURRENCY=1, OPENAI_CALL_DEADLINE_SEC=0.05)
+    def test_waits_for_slot_before_budgets(self):
+        limiter = RateLimiter()
+        limiter._configure()
+        limiter.concurrency.acquire("other course", deadline=time.monotonic())
+        function = mock.Mock(return_value={"usage": {}})
+
+        with self.assertRaises(DeadlineExceeded):
+            limiter.call(function, estimated_tokens=10, model="model")
+
+        function.assert_not_called()
+        self.assertEqual(limiter.requests.available, limiter.requests.capacity)
+        self.assertEqual(limiter.tokens.available, limiter.tokens.capacity)
+
+    @override_settings(OPENAI_TOKENS_PER_MINUTE=60, OPENAI_CALL_DEADLINE_SEC=0.05)
+    def test_gives_slot_back_when_budget_is_exhausted(self):
+        limiter = RateLimiter()
+        limiter._configure()
+        limiter.tokens.acquire(60, deadline=time.monotonic())
+
+        with self.assertRaises(DeadlineExceeded):
+            limiter.call(mock.Mock(), estimated_tokens=10, model="model")
+
+        self.assertEqual(limiter.concurrency.in_flight, 0)
+        self.assertEqual(limiter.concurrency.limit, limiter.concurrency.max_limit)
@@ -0,0 +1,148 @@
+import csv
+import datetime
+import io
+
+from django.contrib.auth import get_user_model
+from django.core.signals import request_finished, request_started
+from django.db import close_old_connections
+from django.http import StreamingHttpResponse
+from django.test import TestCase, TransactionTestCase
+from openpyxl import load_workbook
+from rest_framework.test import APIClient
+
+from api.tests.utils import asgi_request
+from core.models import (
+    Course,
+    CourseMembership,
+    Question,
+    Quiz,
+    Subject,
+    Task,
+    TaskSession,
+    UserAnswer,
+)
+
+
+class ExportTestMixin:
+    def create_fixture(self) -> None:
+        User = get_user_model()
+        self.teacher = User.objects.create_user(
+            email="teacher@example.com", password="password"
+        )
+        self.student = User.objects.create_user(
+            email="student@example.com",
+            password="password",
+            first_name="Ann",
+            last_name="Lee",
+        )
+        subject = Subject.objects.create(name="Subject")
+        subject.teachers.add(self.teacher)
+        quiz = Quiz.objects.create(name="Quiz", max_duration=30, subject=subject)
+        self.question = Question.objects.create(
+            title="Question", expected_answer="answer", value=10, quiz=quiz
+        )
+        self.course = Course.objects.create(name="Course", subject=subject)
+        CourseMembership.objects.create(
+            user=self.teacher,
+            course=self.course,
+            permission=CourseMembership.UserPermission.OWNER,
+        )
+        CourseMembership.objects.create(user=self.student, course=self.course)
+        now = datetime.datetime.now()
+        self.task = Task.objects.create(
+            title="Task",
+            deadline=now + datetime.timedelta(days=1),
+            course=self.course,
+            quiz=quiz,
+        )
+        task_session = TaskSession.objects.create(
+            task=self.task,
+            user=self.student,
+            finished_at=now + datetime.timedelta(minutes=1),
+            grading_status=TaskSession.GradingStatus.GRADED,
+        )
+        UserAnswer.objects.create(
+            task_session=task_session,
+            question=self.question,
+            text='=HYPERLINK("http://example.com","x")',
+            score=50,
+            comment="-1 for the formula",
+        )
+
+    @property
+    def task_export_path(self) -> str:
+        return f"/api/courses/{self.course.id}/tasks/{self.task.id}/export"
+
+    @property
+    def gradebook_export_path(self) -> str:
+        return f"/api/courses/{self.course.id}/gradebook/export"
+
+
+class ASGIExportTest(ExportTestMixin, TransactionTestCase):
+    """Exports served by the ASGI application, see `asgi_request`."""
+
+    def setUp(self):
+        self.create_fixture()
+
+        # The test database connection must stay open, like the test client does
+        for signal in (request_started, request_finished):
+            signal.disconnect(close_old_connections)
+            self.addCleanup(signal.connect, close_old_connections)
+
+    async def test_task_export_csv(self):
+        status_code, body = await asgi_request(
+            f"{self.task_export_path}/csv/", self.teacher
+        )
+
+        self.assertEqual(status_code, 200)
+        self.assertIn("student@example.com", body.decode("utf-8-sig"))
+
+    async def test_gradebook_export_csv(self):
+        status_code, body = await asgi_request(
+            f"{self.gradebook_export_path}/csv/", self.teacher
+        )
+
+        self.assertEqual(status_code, 200)
+        self.assertIn("Ann Lee", body.decode("utf-8-sig"))
+
+
+class FormulaEscapingTest(ExportTestMixin, TestCase):
+    def setUp(self):
+        self.create_fixture()
+        self.client = APIClient()
+        self.client.force_authenticate(self.teacher)
+
+    def test_csv(self):
+        response = self.client.get(f"{self.task_export_path}/csv/")
+        content = b"".join(response.streaming_content).decode("utf-8-sig")
+        rows = list(csv.reader(io.StringIO(content)))
+
+        self.assertEqual(rows[1][3], '\'=HYPERLINK("http://example.com","x")')
+        self.assertEqual(rows[1][6], "'-1 for the formula")
+        self.assertEqual(rows[1][4], "50")
+
+    def test_xlsx(self):
+        response = self.client.get(f"{self.task_export_path}/xlsx/")
+        workbook = load_workbook(io.BytesIO(b"".join(response.streaming_content)))
+        answer, score = workbook.active["D2"], workbook.active["E2"]
+
+        self.assertEqual(answer.data_type, "s")
+        self.assertEqual(answer.value, '\'=HYPERLINK("http://example.com","x")')
+        self.assertEqual(score.value, 50)
+
+
+class StreamingExportTest(ExportTestMixin, TestCase):
+    def setUp(self):
+        self.create_fixture()
+        self.client = APIClient()
+        self.client.force_authenticate(self.teacher)
+
+    def test_csv_rows_are_queried_while_streaming(self):
+        response = self.client.get(f"{self.task_export_path}/csv/")
+
+        self.assertIsInstance(response, StreamingHttpResponse)
+
+        with self.assertNumQueries(1):
+            content = b"".join(response.streaming_content)
+
+        self.assertIn(b"student@example.com", content)
@@ -0,0 +1,172 @@
+import datetime
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from core.models import (
+    Course,
+    CourseMembership,
+    Question,
+    Quiz,
+    Subject,
+    Task,
+    TaskSession,
+)
+from api.views.task import TaskViewSet
+from openai_client.backends import GraderBackend
+
+
+class FailingGraderBackend(GraderBackend):
+    model = "failing"
+
+    def grade(
+        self, question: str, expected_answer: str, user_answer: str
+    ) -> tuple[int, str]:
+        raise RuntimeError("boom sk-secret")
+
+
+class FinishTestMixin:
+    """A student with an open session of a task with two questions."""
+
+    @classmethod
+    def create_fixture(cls) -> None:
+        cls.student = get_user_model().objects.create_user(
+            email="student@example.com", password="password"
+        )
+        subject = Subject.objects.create(name="Subject")
+        cls.quiz = Quiz.objects.create(name="Quiz", max_duration=60, subject=subject)
+        cls.questions = [
+            Question.objects.create(
+                title=f"What is a variable {i}?",
+                expected_answer=f"A named place storing data {i}",
+                value=10,
+                quiz=cls.quiz,
+            )
+            for i in range(2)
+        ]
+        cls.course = Course.objects.create(name="Course", subject=subject)
+        CourseMembership.objects.create(user=cls.student, course=cls.course)
+        cls.task = Task.objects.create(
+            title="Task",
+            deadline=datetime.datetime.now() + datetime.timedelta(days=1),
+            course=cls.course,
+            quiz=cls.quiz,
+        )
+        cls.task_session = TaskSession.objects.create(task=cls.task, user=cls.student)
+
+    def task_path(self, action: str) -> str:
+        return reverse(
+            f"api:task-{action}",
+            kwargs={"course_pk": self.course.id, "pk": self.task.id},
+        )
+
+    def finish_data(self, answer: str = "A place in memory storing data") -> dict:
+        return {
+            "answers": [
+                {"question_id": question.id, "answer": answer}
+                for question in self.questions
+            ]
+        }
+
+
+@override_settings(
+    GRADING_ASYNC=False,
+    GRADER_BACKEND="api.tests.test_finish.FailingGraderBackend",
+)
+class GradingErrorTest(FinishTestMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_fixture()
+
+    def test_error_details_are_only_logged(self):
+        client = APIClient()
+        client.force_authenticate(self.student)
+
+        with self.assertLogs("openai_client.grading", "ERROR") as logs:
+            response = client.post(
+                self.task_path("finish"), self.finish_data(), format="json"
+            )
+
+        self.assertEqual(response.status_code, 502)
+        self.assertEqual(
+            response.json()["answers"],
+            {str(question.id): "Grading unavailable" for question in self.questions},
+        )
+        self.assertNotIn(b"sk-secret", response.content)
+        self.assertIn("sk-secret", "\n".join(logs.output))
+
+
+@override_settings(
+    GRADING_ASYNC=False,
+    GRADER_BACKEND="openai_client.backends.LocalGraderBackend",
+    GRADER_LOCAL_LATENCY_MS=0,
+    GRADER_LOCAL_LATENCY_JITTER_MS=0,
+)
+class FinishedSessionTest(FinishTestMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_fixture()
+
+    def test_answers_are_prefetched(self):
+        client = APIClient()
+        client.force_authenticate(self.student)
+        finished = client.post(
+            self.task_path("finish"), self.finish_data(), format="json"
+        )
+
+        # As the view gets it
+        task = Task.objects.prefetch_related("quiz__questions").get(id=self.task.id)
+
+        # The session, then its answers with their questions
+        with self.assertNumQueries(2):
+            response = TaskViewSet._finished_session_response(task, self.student)
+            data = response.data
+
+        self.assertEqual(finished.status_code, 200)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(data["user_answers"], finished.json()["user_answers"])
+        self.assertEqual(
+            [answer["question"]["id"] for answer in data["user_answers"]],
+            [question.id for question in self.questions],
+        )
+
+
+@override_settings(
+    GRADING_ASYNC=False,
+    GRADER_BACKEND="openai_client.backends.LocalGraderBackend",
+    GRADER_LOCAL_LATENCY_MS=0,
+    GRADER_LOCAL_LATENCY_JITTER_MS=0,
+)
+class IdempotencyTest(FinishTestMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_fixture()
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.student)
+
+    def finish(self, data: dict):
+        return self.client.post(
+            self.task_path("finish"), data, format="json", HTTP_IDEMPOTENCY_KEY="key"
+        )
+
+    def test_same_request_is_replayed(self):
+        first = self.finish(self.finish_data())
+        second = self.finish(self.finish_data())
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.json(), first.json())
+
+    def test_key_is_not_replayed_for_another_body(self):
+        self.finish(self.finish_data())
+
+        response = self.finish(self.finish_data(answer="Something else"))
+
+        self.assertEqual(response.status_code, 422)
+        self.assertNotIn("user_answers", response.json())
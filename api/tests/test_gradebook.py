@@ -0,0 +1,79 @@
+import datetime
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from core.models import Course, CourseMembership, Quiz, Subject, Task, TaskSession
+
+
+@override_settings(
+    CACHES={
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "gradebook-tests",
+        }
+    }
+)
+class GradebookTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.teacher = User.objects.create_user(
+            email="teacher@example.com", password="password"
+        )
+        subject = Subject.objects.create(name="Subject")
+        subject.teachers.add(cls.teacher)
+        cls.course = Course.objects.create(name="Course", subject=subject)
+        CourseMembership.objects.create(
+            user=cls.teacher,
+            course=cls.course,
+            permission=CourseMembership.UserPermission.OWNER,
+        )
+        task = Task.objects.create(
+            title="Task",
+            deadline=datetime.datetime.now() + datetime.timedelta(days=1),
+            course=cls.course,
+            quiz=Quiz.objects.create(name="Quiz", max_duration=60, subject=subject),
+        )
+        finished_at = datetime.datetime.now() + datetime.timedelta(minutes=1)
+
+        for i, grading_status in enumerate(TaskSession.GradingStatus):
+            student = User.objects.create_user(
+                email=f"student-{i}@example.com",
+                password="password",
+                last_name=str(i),
+            )
+            CourseMembership.objects.create(user=student, course=cls.course)
+            TaskSession.objects.create(
+                task=task,
+                user=student,
+                finished_at=finished_at,
+                grading_status=grading_status,
+                total_mark=10 * (i + 1),
+            )
+
+    def test_only_graded_marks_count(self):
+        client = APIClient()
+        client.force_authenticate(self.teacher)
+
+        response = client.get(
+            reverse("api:courses-gradebook", kwargs={"pk": self.course.id})
+        )
+
+        gradebook = response.json()
+        marks = {
+            student["email"]: student["marks"][0] for student in gradebook["students"]
+        }
+        self.assertEqual(
+            marks,
+            {
+                "student-0@example.com": None,
+                "student-1@example.com": None,
+                "student-2@example.com": 30,
+                "student-3@example.com": None,
+            },
+        )
+        self.assertEqual(gradebook["tasks"][0]["submissions"], 1)
+        self.assertEqual(gradebook["tasks"][0]["average_mark"], 30)
@@ -0,0 +1,65 @@
+from django.test import TestCase, override_settings
+
+from core.grading import grade_answers
+from core.grading_cache import grading_cache
+from core.models import GradingCacheEntry, Question, Quiz, Subject
+from openai_client.backends import GraderBackend
+
+
+class RecordingGraderBackend(GraderBackend):
+    model = "recording"
+    calls: list[tuple[str, str]] = []
+
+    def grade(
+        self, question: str, expected_answer: str, user_answer: str
+    ) -> tuple[int, str]:
+        self.calls.append((expected_answer, user_answer))
+        return 7, "Mostly right"
+
+
+@override_settings(
+    GRADER_BACKEND="api.tests.test_grading_cache.RecordingGraderBackend",
+    GRADING_BATCH_SIZE=1,
+)
+class GradingCacheTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        subject = Subject.objects.create(name="Subject")
+        quiz = Quiz.objects.create(name="Quiz", max_duration=60, subject=subject)
+        cls.question = Question.objects.create(
+            title="What is a variable?",
+            expected_answer="A named place storing data",
+            value=10,
+            quiz=quiz,
+        )
+
+    def setUp(self):
+        grading_cache.clear()
+        RecordingGraderBackend.calls.clear()
+
+    def grade(self, text: str):
+        return grade_answers([(self.question, text)])[self.question.id]
+
+    def test_same_answer_is_graded_once(self):
+        memory_hits = grading_cache.stats()["memory_hits"]
+        first = self.grade("A place in memory with a name")
+        # Only differs in case and whitespace
+        second = self.grade("a place in  memory with a NAME ")
+
+        self.assertEqual(len(RecordingGraderBackend.calls), 1)
+        self.assertEqual((second.score, second.explanation), (7, "Mostly right"))
+        self.assertEqual(second, first)
+        self.assertEqual(grading_cache.stats()["memory_hits"], memory_hits + 1)
+
+    def test_expected_answer_edit_is_a_miss(self):
+        self.grade("A place in memory with a name")
+
+        self.question.expected_answer = "A named memory location"
+        self.question.save()
+        self.grade("A place in memory with a name")
+
+        self.assertEqual(
+            [expected_answer for expected_answer, _ in RecordingGraderBackend.calls],
+            ["A named place storing data", "A named memory location"],
+        )
+        self.assertEqual(GradingCacheEntry.objects.get().hits, 0)
@@ -0,0 +1,136 @@
+import datetime
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from core.grading import claim_next_job, run_job
+from core.models import (
+    Course,
+    CourseMembership,
+    GradingJob,
+    Question,
+    Quiz,
+    Subject,
+    Task,
+    TaskSession,
+)
+
+
+@override_settings(
+    GRADING_ASYNC=True,
+    GRADING_EAGER=True,
+    GRADER_BACKEND="openai_client.backends.LocalGraderBackend",
+    GRADER_LOCAL_LATENCY_MS=0,
+    GRADER_LOCAL_LATENCY_JITTER_MS=0,
+)
+class EagerGradingTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.student = get_user_model().objects.create_user(
+            email="student@example.com", password="password"
+        )
+        subject = Subject.objects.create(name="Subject")
+        quiz = Quiz.objects.create(name="Quiz", max_duration=60, subject=subject)
+        cls.questions = [
+            Question.objects.create(
+                title=f"Question {i}",
+                expected_answer=f"Answer {i}",
+                value=10,
+                quiz=quiz,
+            )
+            for i in range(2)
+        ]
+        course = Course.objects.create(name="Course", subject=subject)
+        CourseMembership.objects.create(user=cls.student, course=course)
+        cls.task = Task.objects.create(
+            title="Task",
+            deadline=datetime.datetime.now() + datetime.timedelta(days=1),
+            course=course,
+            quiz=quiz,
+        )
+        cls.task_session = TaskSession.objects.create(task=cls.task, user=cls.student)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.student)
+
+    def post(self, action: str, data: dict):
+        path = reverse(
+            f"api:task-{action}",
+            kwargs={"course_pk": self.task.course_id, "pk": self.task.id},
+        )
+        return self.client.post(path, data, format="json")
+
+    def test_finish_reuses_queued_job(self):
+        for question in self.questions:
+            self.post("answer", {"question_id": question.id, "answer": "Answer"})
+
+        response = self.post(
+            "finish",
+            {
+                "answers": [
+                    {"question_id": question.id, "answer": "Answer"}
+                    for question in self.questions
+                ]
+            },
+        )
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(self.task_session.grading_jobs.count(), 1)
+
+        run_job(claim_next_job("worker"))
+
+        self.task_session.refresh_from_db()
+        self.assertEqual(
+            self.task_session.grading_status, TaskSession.GradingStatus.GRADED
+        )
+        self.assertEqual(
+            self.task_session.grading_jobs.get().status, GradingJob.Status.DONE
+        )
+
+    def test_finish_queues_job_when_eager_one_is_running(self):
+        self.post("answer", {"question_id": self.questions[0].id, "answer": "Answer"})
+        eager_job = claim_next_job("worker")
+
+        self.post(
+            "finish",
+            {"answers": [{"question_id": self.questions[1].id, "answer": "Answer"}]},
+        )
+
+        self.assertEqual(
+            self.task_session.grading_jobs.filter(
+                status=GradingJob.Status.QUEUED
+            ).count(),
+            1,
+        )
+        self.assertNotEqual(claim_next_job("worker").id, eager_job.id)
+
+    def test_reclaimed_job_is_left_to_new_worker(self):
+        self.post(
+            "finish",
+            {
+                "answers": [
+                    {"question_id": question.id, "answer": "Answer"}
+                    for question in self.questions
+                ]
+            },
+        )
+        job = claim_next_job("worker-1")
+        # Reclaimed as stale while the first worker was still grading
+        GradingJob.objects.filter(id=job.id).update(
+            claimed_by="worker-2",
+            claimed_at=job.claimed_at + datetime.timedelta(seconds=1),
+            attempts=2,
+        )
+
+        self.assertFalse(run_job(job))
+
+        job.refresh_from_db()
+        self.task_session.refresh_from_db()
+        self.assertEqual(job.status, GradingJob.Status.RUNNING)
+        self.assertEqual(job.claimed_by, "worker-2")
+        self.assertNotEqual(
+            self.task_session.grading_status, TaskSession.GradingStatus.GRADED
+        )
@@ -0,0 +1,82 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from core import metrics
+
+
+class MetricsFilesTest(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        settings = override_settings(
+            METRICS_DIR=self.directory, METRICS_FLUSH_INTERVAL_SEC=0
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def write(self, file_name: str, snapshot: dict) -> None:
+        with open(os.path.join(self.directory, file_name), "w") as file:
+            json.dump(snapshot, file)
+
+    def misses(self) -> float:
+        return metrics.registry.collect()["grading_cache_misses_total"].get((), 0)
+
+    def test_dead_processes_are_merged(self):
+        own_misses = self.misses()
+        dead_pid = subprocess.Popen([sys.executable, "-c", ""]).pid
+        os.waitpid(dead_pid, 0)
+        self.write(
+            f"{dead_pid}-1.json",
+            {
+                "grading_cache_misses_total": [[[], 2]],
+                "grading_in_flight": [[["dead-model"], 1]],
+            },
+        )
+        # A dead process whose id this process reuses
+        self.write(f"{os.getpid()}-1.json", {"grading_cache_misses_total": [[[], 3]]})
+
+        collected = metrics.registry.collect()
+
+        self.assertEqual(collected["grading_cache_misses_total"][()], own_misses + 5)
+        self.assertNotIn(("dead-model",), collected["grading_in_flight"])
+        self.assertEqual(
+            set(os.listdir(self.directory)),
+            {".lock", metrics.AGGREGATE_FILE, metrics.registry.file_name},
+        )
+        self.assertEqual(self.misses(), own_misses + 5)
+
+    def test_exit_flush_is_registered_on_first_change(self):
+        registry = metrics.Registry()
+
+        with mock.patch.object(metrics.atexit, "register") as register:
+            registry.changed()
+            registry.changed()
+
+        register.assert_called_once_with(registry.flush)
+
+
+@override_settings(METRICS_DIR="")
+class MetricsEndpointTest(SimpleTestCase):
+    @override_settings(METRICS_TOKEN="")
+    def test_disabled_without_token(self):
+        self.assertEqual(self.client.get("/metrics").status_code, 404)
+
+    @override_settings(METRICS_TOKEN="secret")
+    def test_requires_token(self):
+        self.assertEqual(self.client.get("/metrics").status_code, 401)
+        self.assertEqual(
+            self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer wrong").status_code,
+            401,
+        )
+
+        response = self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer secret")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"# TYPE grading_calls_total counter", response.content)
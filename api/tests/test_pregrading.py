@@ -0,0 +1,98 @@
+from django.test import SimpleTestCase, TestCase, override_settings
+from rest_framework.test import APIClient
+
+from api.tests.test_finish import FinishTestMixin
+from core.models import Question, Quiz
+from core.pregrading import pregrade
+
+
+@override_settings(GRADING_PREGRADING_RULES={"empty": True, "exact_match": True})
+class PregradeTest(SimpleTestCase):
+    def question(self, quiz_rules: dict = None, question_rules: dict = None):
+        return Question(
+            title="What is a variable?",
+            expected_answer="A named place storing data",
+            quiz=Quiz(pregrading_rules=quiz_rules or {}),
+            pregrading_rules=question_rules or {},
+        )
+
+    def rule(self, text: str, **rules) -> str | None:
+        pregraded = pregrade(self.question(**rules), text)
+        return pregraded and pregraded.rule
+
+    def test_rule_that_fired(self):
+        cases = [
+            ("  ", {}, "empty"),
+            ("Data", {"quiz_rules": {"min_length": 5}}, "min_length"),
+            # 13 characters, under 0.6 of the 26 of the expected answer
+            ("A named place", {"quiz_rules": {"min_length_ratio": 0.6}}, "min_length"),
+            ("a NAMED  place storing data ", {}, "exact_match"),
+            ("A place in memory", {}, None),
+        ]
+
+        for text, rules, expected_rule in cases:
+            with self.subTest(text=text, rules=rules):
+                self.assertEqual(self.rule(text, **rules), expected_rule)
+
+    def test_first_matching_rule_wins(self):
+        # Exact match, but shorter than the minimum length
+        self.assertEqual(
+            self.rule("A named place storing data", quiz_rules={"min_length": 50}),
+            "min_length",
+        )
+
+    def test_question_overrides_quiz(self):
+        self.assertEqual(
+            self.rule(
+                "A named place storing data",
+                quiz_rules={"exact_match": False},
+                question_rules={"exact_match": True},
+            ),
+            "exact_match",
+        )
+        self.assertIsNone(self.rule("", question_rules={"empty": False}))
+
+
+@override_settings(
+    GRADING_ASYNC=False,
+    GRADER_BACKEND="api.tests.test_finish.FailingGraderBackend",
+    GRADING_PREGRADING_RULES={"empty": True, "exact_match": True},
+)
+class PregradedFinishTest(FinishTestMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_fixture()
+
+    def test_rule_is_saved_with_answer(self):
+        client = APIClient()
+        client.force_authenticate(self.student)
+        empty, exact = self.questions
+
+        response = client.post(
+            self.task_path("finish"),
+            {
+                "answers": [
+                    {"question_id": empty.id, "answer": ""},
+                    {"question_id": exact.id, "answer": exact.expected_answer},
+                ]
+            },
+            format="json",
+        )
+
+        # The failing grader is never called
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            {
+                answer["question"]["id"]: (answer["pregrading_rule"], answer["score"])
+                for answer in response.json()["user_answers"]
+            },
+            {empty.id: ("empty", 0), exact.id: ("exact_match", 100)},
+        )
+        self.assertEqual(
+            set(
+                self.task_session.useranswer_set.values_list(
+                    "pregrading_rule", flat=True
+                )
+            ),
+            {"empty", "exact_match"},
+        )
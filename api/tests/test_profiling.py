@@ -0,0 +1,39 @@
+import time
+from unittest import mock
+
+from django.test import TestCase
+
+from api.serializers import SubjectSerializer
+from core.models import Subject
+from core.profiling import TimedListSerializer, profile_request
+
+
+class SerializeTimerTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.subjects = [Subject.objects.create(name=f"Subject {i}") for i in range(2)]
+
+    def slow_representation(self, subject: Subject) -> dict:
+        time.sleep(0.02)
+        return {"id": subject.id}
+
+    def test_data_is_timed(self):
+        serializer = SubjectSerializer(self.subjects[0])
+
+        with mock.patch.object(
+            SubjectSerializer, "to_representation", self.slow_representation
+        ), profile_request() as profile:
+            serializer.data
+
+        self.assertGreaterEqual(profile.durations["serialize"], 0.02)
+
+    def test_lists_are_timed(self):
+        serializer = SubjectSerializer(self.subjects, many=True)
+
+        with mock.patch.object(
+            SubjectSerializer, "to_representation", self.slow_representation
+        ), profile_request() as profile:
+            serializer.data
+
+        self.assertIsInstance(serializer, TimedListSerializer)
+        self.assertGreaterEqual(profile.durations["serialize"], 0.04)
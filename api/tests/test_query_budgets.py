@@ -0,0 +1,512 @@
+import datetime
+import re
+from collections import Counter
+from contextlib import ExitStack
+from dataclasses import dataclass
+from typing import Callable
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.db import connections, reset_queries, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLResolver, reverse
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+import account.urls
+import api.urls
+from core.models import (
+    Course,
+    CourseMembership,
+    Question,
+    Quiz,
+    Subject,
+    Task,
+    TaskSession,
+    UserAnswer,
+)
+
+PASSWORD = "budget-password"
+
+
+class Fixture:
+    """
+    A course of `students` students who all finished the task, one more
+    student with an open session and a user outside of the course.
+    """
+
+    def __init__(self, students: int) -> None:
+        User = get_user_model()
+        password = make_password(PASSWORD)
+        now = datetime.datetime.now()
+
+        self.scale = students
+        self.teacher = User.objects.create(
+            email="budget-teacher@example.com", password=password
+        )
+        self.outsider = User.objects.create(
+            email="budget-outsider@example.com", password=password
+        )
+        self.student = User.objects.create(
+            email="budget-student@example.com", password=password
+        )
+        self.students = User.objects.bulk_create(
+            User(
+                email=f"budget-{i}@example.com", first_name="Student", last_name=str(i)
+            )
+            for i in range(students)
+        )
+
+        self.subject = Subject.objects.create(name="Budget")
+        self.subject.teachers.add(self.teacher)
+        self.other_subject = Subject.objects.create(name="Budget, other")
+        self.quiz = Quiz.objects.create(
+            name="Budget", max_duration=60, subject=self.subject
+        )
+        self.questions = Question.objects.bulk_create(
+            Question(
+                title=f"Question {i}",
+                expected_answer=f"expected answer {i}",
+                value=10,
+                quiz=self.quiz,
+            )
+            for i in range(5)
+        )
+
+        self.course = Course.objects.create(name="Budget", subject=self.subject)
+        self.other_course = Course.objects.create(
+            name="Budget, other", subject=self.subject
+        )
+        CourseMembership.objects.bulk_create(
+            [
+                CourseMembership(
+                    user=self.teacher,
+                    course=self.course,
+                    permission=CourseMembership.UserPermission.OWNER,
+                ),
+                CourseMembership(user=self.student, course=self.course),
+                *(
+                    CourseMembership(user=student, course=self.course)
+                    for student in self.students
+                ),
+            ]
+        )
+
+        self.task = Task.objects.create(
+            title="Budget",
+            deadline=now + datetime.timedelta(days=1),
+            course=self.course,
+            quiz=self.quiz,
+        )
+        TaskSession.objects.create(task=self.task, user=self.student)
+        self.sessions = TaskSession.objects.bulk_create(
+            TaskSession(
+                task=self.task,
+                user=student,
+                finished_at=now + datetime.timedelta(minutes=1),
+                grading_status=TaskSession.GradingStatus.GRADED,
+                total_mark=25,
+                max_mark=50,
+            )
+            for student in self.students
+        )
+        UserAnswer.objects.bulk_create(
+            UserAnswer(
+                task_session=session,
+                question=question,
+                text="expected answer",
+                score=50,
+                comment="Half of the expected answer",
+            )
+            for session in self.sessions
+            for question in self.questions
+        )
+
+
+@dataclass(frozen=True)
+class Endpoint:
+    name: str
+    method: str
+    # Largest number of queries allowed, at any scale
+    budget: int
+    # Fixture attribute of the requesting user, None for anonymous requests
+    user: str | None = "teacher"
+    kwargs: Callable[[Fixture], dict] = lambda fixture: {}
+    data: Callable[[Fixture], dict] | None = None
+
+    def __str__(self) -> str:
+        return f"{self.method.upper()} {self.name}"
+
+
+def subject_kwargs(fixture: Fixture) -> dict:
+    return {"pk": fixture.subject.id}
+
+
+def quiz_list_kwargs(fixture: Fixture) -> dict:
+    return {"subject_pk": fixture.subject.id}
+
+
+def quiz_kwargs(fixture: Fixture) -> dict:
+    return {"subject_pk": fixture.subject.id, "pk": fixture.quiz.id}
+
+
+def question_list_kwargs(fixture: Fixture) -> dict:
+    return {"subject_pk": fixture.subject.id, "quiz_pk": fixture.quiz.id}
+
+
+def question_kwargs(fixture: Fixture) -> dict:
+    return {**question_list_kwargs(fixture), "pk": fixture.questions[0].id}
+
+
+def course_kwargs(fixture: Fixture) -> dict:
+    return {"pk": fixture.course.id}
+
+
+def task_list_kwargs(fixture: Fixture) -> dict:
+    return {"course_pk": fixture.course.id}
+
+
+def task_kwargs(fixture: Fixture) -> dict:
+    return {"course_pk": fixture.course.id, "pk": fixture.task.id}
+
+
+def session_list_kwargs(fixture: Fixture) -> dict:
+    return {"course_pk": fixture.course.id, "task_pk": fixture.task.id}
+
+
+def session_kwargs(fixture: Fixture) -> dict:
+    return {**session_list_kwargs(fixture), "pk": fixture.sessions[-1].id}
+
+
+def quiz_data(fixture: Fixture) -> dict:
+    return {"name": "Budget, changed", "max_duration": 30}
+
+
+def question_data(fixture: Fixture) -> dict:
+    return {"title": "Changed", "expected_answer": "changed answer", "value": 5}
+
+
+def task_data(fixture: Fixture) -> dict:
+    return {
+        "title": "Budget, changed",
+        "deadline": fixture.task.deadline.isoformat(),
+        "quiz": fixture.quiz.id,
+    }
+
+
+def finish_data(fixture: Fixture) -> dict:
+    # Unique answers, so that grades aren't found in the grading cache
+    return {
+        "answers": [
+            {"question_id": question.id, "answer": f"answer {fixture.scale}"}
+            for question in fixture.questions
+        ]
+    }
+
+
+def answer_data(fixture: Fixture) -> dict:
+    return {"question_id": fixture.questions[0].id, "answer": f"answer {fixture.scale}"}
+
+
+def user_data(fixture: Fixture) -> dict:
+    return {"email": "budget-new@example.com", "password": PASSWORD}
+
+
+# Budgets are the current query counts, lower them when an endpoint improves
+ENDPOINTS = (
+    Endpoint("api:api-root", "get", 0),
+    Endpoint("api:subject-list", "get", 2),
+    Endpoint("api:subject-list", "post", 3, data=lambda f: {"name": "New"}),
+    Endpoint(
+        "api:subject-join",
+        "post",
+        3,
+        user="outsider",
+        data=lambda f: {"invitation_token": f.other_subject.invitation_token},
+    ),
+    Endpoint("api:subject-detail", "get", 2, kwargs=subject_kwargs),
+    Endpoint(
+        "api:subject-detail",
+        "put",
+        4,
+        kwargs=subject_kwargs,
+        data=lambda f: {"name": "Changed"},
+    ),
+    Endpoint(
+        "api:subject-detail",
+        "patch",
+        4,
+        kwargs=subject_kwargs,
+        data=lambda f: {"name": "Changed"},
+    ),
+    Endpoint("api:subject-detail", "delete", 38, kwargs=subject_kwargs),
+    Endpoint("api:quiz-list", "get", 3, kwargs=quiz_list_kwargs),
+    Endpoint("api:quiz-list", "post", 4, kwargs=quiz_list_kwargs, data=quiz_data),
+    Endpoint("api:quiz-detail", "get", 3, kwargs=quiz_kwargs),
+    Endpoint("api:quiz-detail", "put", 5, kwargs=quiz_kwargs, data=quiz_data),
+    Endpoint("api:quiz-detail", "patch", 5, kwargs=quiz_kwargs, data=quiz_data),
+    Endpoint("api:quiz-detail", "delete", 31, kwargs=quiz_kwargs),
+    Endpoint("api:question-list", "get", 3, kwargs=question_list_kwargs),
+    Endpoint(
+        "api:question-list",
+        "post",
+        6,
+        kwargs=question_list_kwargs,
+        data=question_data,
+    ),
+    Endpoint("api:question-detail", "get", 3, kwargs=question_kwargs),
+    Endpoint(
+        "api:question-detail", "put", 9, kwargs=question_kwargs, data=question_data
+    ),
+    Endpoint(
+        "api:question-detail", "patch", 9, kwargs=question_kwargs, data=question_data
+    ),
+    Endpoint("api:question-detail", "delete", 10, kwargs=question_kwargs),
+    Endpoint("api:courses-list", "get", 1),
+    Endpoint(
+        "api:courses-list",
+        "post",
+        5,
+        data=lambda f: {"name": "New", "subject": f.subject.id},
+    ),
+    Endpoint(
+        "api:courses-join",
+        "post",
+        3,
+        user="outsider",
+        data=lambda f: {"invitation_token": f.other_course.invitation_token},
+    ),
+    Endpoint("api:courses-detail", "get", 5, kwargs=course_kwargs),
+    Endpoint(
+        "api:courses-detail",
+        "put",
+        6,
+        kwargs=course_kwargs,
+        data=lambda f: {"name": "Changed"},
+    ),
+    Endpoint(
+        "api:courses-detail",
+        "patch",
+        6,
+        kwargs=course_kwargs,
+        data=lambda f: {"name": "Changed"},
+    ),
+    Endpoint("api:courses-detail", "delete", 14, kwargs=course_kwargs),
+    Endpoint(
+        "api:courses-change-user-permission",
+        "post",
+        18,
+        kwargs=course_kwargs,
+        data=lambda f: {"user": f.student.id, "permission": "teacher"},
+    ),
+    Endpoint("api:courses-gradebook", "get", 4, kwargs=course_kwargs),
+    Endpoint(
+        "api:courses-gradebook-export",
+        "get",
+        4,
+        kwargs=lambda f: {"pk": f.course.id, "file_format": "csv"},
+    ),
+    Endpoint("api:task-list", "get", 2, user="student", kwargs=task_list_kwargs),
+    Endpoint("api:task-list", "post", 6, kwargs=task_list_kwargs, data=task_data),
+    Endpoint("api:task-detail", "get", 3, kwargs=task_kwargs),
+    Endpoint("api:task-detail", "put", 5, kwargs=task_kwargs, data=task_data),
+    Endpoint("api:task-detail", "patch", 5, kwargs=task_kwargs, data=task_data),
+    Endpoint("api:task-detail", "delete", 8, kwargs=task_kwargs),
+    Endpoint(
+        "api:task-export",
+        "get",
+        3,
+        kwargs=lambda f: {**task_kwargs(f), "file_format": "csv"},
+    ),
+    Endpoint("api:task-start", "post", 5, user="student", kwargs=task_kwargs),
+    Endpoint(
+        "api:task-answer",
+        "post",
+        9,
+        user="student",
+        kwargs=task_kwargs,
+        data=answer_data,
+    ),
+    Endpoint(
+        "api:task-finish",
+        "post",
+        13,
+        user="student",
+        kwargs=task_kwargs,
+        data=finish_data,
+    ),
+    Endpoint("api:session-list", "get", 2, kwargs=session_list_kwargs),
+    Endpoint("api:session-detail", "get", 7, kwargs=session_kwargs),
+    Endpoint("api:session-detail", "delete", 7, kwargs=session_kwargs),
+    Endpoint("account:create", "post", 2, user=None, data=user_data),
+    Endpoint(
+        "account:token_obtain_pair",
+        "post",
+        1,
+        user=None,
+        data=lambda f: {"email": f.teacher.email, "password": PASSWORD},
+    ),
+    Endpoint(
+        "account:token_refresh",
+        "post",
+        0,
+        user=None,
+        data=lambda f: {"refresh": str(RefreshToken.for_user(f.teacher))},
+    ),
+    Endpoint("account:me", "get", 0),
+    Endpoint("account:me", "put", 3, data=user_data),
+    Endpoint("account:me", "patch", 1, data=lambda f: {"first_name": "Changed"}),
+)
+
+
+def routes() -> set[tuple[str, str]]:
+    """Names and methods of every route of the API and account apps."""
+
+    def walk(patterns):
+        for pattern in patterns:
+            if isinstance(pattern, URLResolver):
+                yield from walk(pattern.url_patterns)
+            else:
+                yield pattern
+
+    found = set()
+
+    for urls in (api.urls, account.urls):
+        for pattern in walk(urls.urlpatterns):
+            callback = pattern.callback
+            methods = getattr(callback, "actions", None) or [
+                method
+                for method in callback.view_class.http_method_names
+                if hasattr(callback.view_class, method)
+            ]
+
+            for method in methods:
+                if method not in ("options", "head"):
+                    found.add((f"{urls.app_name}:{pattern.name}", method))
+
+    return found
+
+
+def counted(sqls: list[str]) -> list[str]:
+    """
+    Queries which count against the budget. Cascading deletes remove 100
+    rows per query, so the repeated statements of one batched delete are
+    counted once.
+    """
+    batches = set()
+    result = []
+
+    for sql in sqls:
+        shape = query_shape(sql)
+
+        if shape.startswith("DELETE") and "IN (...)" in shape:
+            if shape in batches:
+                continue
+
+            batches.add(shape)
+
+        result.append(sql)
+
+    return result
+
+
+def query_shape(sql: str) -> str:
+    """SQL without literal values, so that repeated queries look the same."""
+    sql = re.sub(r"'(?:[^']|'')*'", "?", sql)
+    sql = re.sub(r"\b\d+(\.\d+)?\b", "?", sql)
+    return re.sub(r"\((?:\?, )*\?\)", "(...)", sql)
+
+
+@override_settings(
+    GRADER_BACKEND="openai_client.backends.LocalGraderBackend",
+    GRADER_LOCAL_LATENCY_MS=0,
+    GRADER_LOCAL_LATENCY_JITTER_MS=0,
+    # A cache of our own, emptied before every request
+    CACHES={
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "query-budgets",
+        }
+    },
+)
+class QueryBudgetTest(TestCase):
+    """
+    The number of SQL queries of every API endpoint stays within its
+    budget and doesn't grow with the number of students.
+    """
+
+    scales = (5, 200)
+
+    def test_every_route_has_a_budget(self):
+        covered = {(endpoint.name, endpoint.method) for endpoint in ENDPOINTS}
+
+        self.assertEqual(routes() - covered, set())
+
+    def test_budgets(self):
+        small, large = self.scales
+        queries = {}
+
+        for scale in self.scales:
+            with transaction.atomic():
+                fixture = Fixture(scale)
+
+                for endpoint in ENDPOINTS:
+                    queries[endpoint, scale] = self._request(endpoint, fixture)
+
+                transaction.set_rollback(True)
+
+        for endpoint in ENDPOINTS:
+            small_queries = counted(queries[endpoint, small])
+            large_queries = counted(queries[endpoint, large])
+            shapes = "\n".join(
+                f"  {count} x {shape}"
+                for shape, count in Counter(map(query_shape, large_queries)).items()
+            )
+
+            with self.subTest(endpoint=str(endpoint)):
+                self.assertEqual(
+                    len(large_queries),
+                    len(small_queries),
+                    f"queries grow from {small} to {large} students:\n{shapes}",
+                )
+                self.assertLessEqual(
+                    len(large_queries),
+                    endpoint.budget,
+                    f"over the budget:\n{shapes}",
+                )
+
+    def _request(self, endpoint: Endpoint, fixture: Fixture) -> list[str]:
+        client = APIClient()
+
+        if endpoint.user:
+            client.force_authenticate(getattr(fixture, endpoint.user))
+
+        path = reverse(endpoint.name, kwargs=endpoint.kwargs(fixture))
+        data = endpoint.data(fixture) if endpoint.data else None
+
+        cache.clear()
+        # The query log is bounded, a full one would be captured as empty
+        reset_queries()
+
+        # Every endpoint starts from the same fixture
+        with transaction.atomic(), ExitStack() as stack:
+            captures = [
+                stack.enter_context(CaptureQueriesContext(connection))
+                for connection in connections.all()
+            ]
+            response = getattr(client, endpoint.method)(path, data, format="json")
+
+            # Queries made while the body is sent count as well
+            if response.streaming:
+                body = b"".join(response.streaming_content)
+            else:
+                body = response.content
+
+            stack.close()
+            transaction.set_rollback(True)
+
+        self.assertLess(response.status_code, 400, f"{endpoint}: {body!r}")
+
+        return [query["sql"] for capture in captures for query in capture]
@@ -0,0 +1,67 @@
+import datetime
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from core.models import Course, CourseMembership, Quiz, Subject, Task
+from core.task_cache import get_cached_task_version
+
+
+@override_settings(
+    CACHES={
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "task-cache-tests",
+        }
+    }
+)
+class TaskDetailCacheTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = get_user_model().objects.create_user(
+            email="teacher@example.com", password="password"
+        )
+        subject = Subject.objects.create(name="Subject")
+        subject.teachers.add(cls.teacher)
+        cls.course = Course.objects.create(name="Course", subject=subject)
+        CourseMembership.objects.create(
+            user=cls.teacher,
+            course=cls.course,
+            permission=CourseMembership.UserPermission.OWNER,
+        )
+        cls.task = Task.objects.create(
+            title="Task",
+            deadline=datetime.datetime.now() + datetime.timedelta(days=1),
+            course=cls.course,
+            quiz=Quiz.objects.create(name="Quiz", max_duration=60, subject=subject),
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.teacher)
+
+    def get(self, pk: int, **headers):
+        path = reverse(
+            "api:task-detail", kwargs={"course_pk": self.course.id, "pk": pk}
+        )
+        return self.client.get(path, **headers)
+
+    def test_unknown_task_takes_no_version(self):
+        response = self.get(self.task.id + 1000)
+
+        self.assertEqual(response.status_code, 404)
+        self.assertIsNone(get_cached_task_version(self.task.id + 1000))
+
+    def test_etag_is_revalidated(self):
+        response = self.get(self.task.id)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNotNone(get_cached_task_version(self.task.id))
+
+        response = self.get(self.task.id, HTTP_IF_NONE_MATCH=response["ETag"])
+
+        self.assertEqual(response.status_code, 304)
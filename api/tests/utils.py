@@ -0,0 +1,58 @@
+from asgiref.sync import sync_to_async
+from asgiref.testing import ApplicationCommunicator
+from rest_framework_simplejwt.tokens import AccessToken
+
+from config.asgi import application
+
+
+async def asgi_request(
+    path: str,
+    user=None,
+    method: str = "GET",
+    body: bytes = b"",
+    extra_headers: dict[str, str] | None = None,
+) -> tuple[int, bytes]:
+    """
+    Request served by the ASGI application itself, not the test client.
+    It runs sync code in threads of its own, which only see committed data.
+    """
+    headers = [
+        (b"host", b"testserver"),
+        (b"content-type", b"application/json"),
+        *(
+            (name.lower().encode(), value.encode())
+            for name, value in (extra_headers or {}).items()
+        ),
+    ]
+
+    if user is not None:
+        token = await sync_to_async(AccessToken.for_user)(user)
+        headers.append((b"authorization", f"Bearer {token}".encode()))
+
+    communicator = ApplicationCommunicator(
+        application,
+        {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": method,
+            "scheme": "http",
+            "path": path,
+            "query_string": b"",
+            "headers": headers,
+        },
+    )
+    await communicator.send_input({"type": "http.request", "body": body})
+    start = await communicator.receive_output(timeout=5)
+    content = b""
+
+    while True:
+        message = await communicator.receive_output(timeout=5)
+        content += message.get("body", b"")
+
+        if not message.get("more_body"):
+            break
+
+    # The response is closed, and request_finished sent, after the body
+    await communicator.wait(timeout=5)
+    return start["status"], content
@@ -0,0 +1,131 @@
+from operator import itemgetter
+from typing import Any, Callable, Iterable
+
+from rest_framework import serializers
+from rest_framework.utils.serializer_helpers import ReturnDict, ReturnList
+
+from core.profiling import timer
+from core.tracing import span
+
+# Formatting of the fields the model serializers would use
+to_datetime = serializers.DateTimeField().to_representation
+
+
+class ValuesSerializer:
+    """
+    Read-only serializer of `QuerySet.values()` rows, producing the same
+    output as a ModelSerializer without model instances or field objects.
+
+    `fields` are (name, value, to_representation) triples, where value is
+    a key of the row or a function of the whole row. None values are
+    output as they are, like in ModelSerializer. `lookups` are passed to
+    `values()` and have to include the fields the list is ordered by.
+    """
+
+    fields: tuple[tuple[str, str | Callable[[dict], Any], Callable | None], ...] = ()
+    lookups: tuple[str, ...] = ()
+
+    def __init_subclass__(cls, **kwargs) -> None:
+        super().__init_subclass__(**kwargs)
+        cls._accessors = tuple(
+            (name, itemgetter(value) if isinstance(value, str) else value, convert)
+            for name, value, convert in cls.fields
+        )
+
+    def __init__(self, instance: Iterable[dict] = None, many: bool = False, **kwargs):
+        self.instance = instance
+        self.many = many
+
+    def to_representation(self, row: dict) -> dict:
+        data = {}
+
+        for name, get, convert in self._accessors:
+            value = get(row)
+            data[name] = value if convert is None or value is None else convert(value)
+
+        return data
+
+    @property
+    def data(self) -> ReturnList | ReturnDict:
+        with timer("serialize"), span("serialize"):
+            if self.many:
+                return ReturnList(
+                    [self.to_representation(row) for row in self.instance],
+                    serializer=self,
+                )
+
+            return ReturnDict(self.to_representation(self.instance), serializer=self)
+
+
+class CourseListValuesSerializer(ValuesSerializer):
+    fields = (
+        ("id", "id", None),
+        ("name", "name", None),
+        (
+            "subject",
+            lambda row: {"id": row["subject_id"], "name": row["subject__name"]},
+            None,
+        ),
+        ("users_count", "users_count", int),
+        ("invitation_token", "invitation_token", None),
+    )
+    lookups = (
+        "id",
+        "name",
+        "subject_id",
+        "subject__name",
+        "users_count",
+        "invitation_token",
+        "created_at",
+    )
+
+
+class TaskValuesSerializer(ValuesSerializer):
+    fields = (
+        ("id", "id", None),
+        ("title", "title", None),
+        ("deadline", "deadline", to_datetime),
+        ("course", "course_id", None),
+        ("quiz", "quiz_id", None),
+        ("quiz_name", "quiz__name", None),
+    )
+    lookups = (
+        "id",
+        "title",
+        "deadline",
+        "course_id",
+        "quiz_id",
+        "quiz__name",
+        "created_at",
+    )
+
+
+class TaskSessionValuesSerializer(ValuesSerializer):
+    fields = (
+        ("id", "id", None),
+        ("started_at", "started_at", to_datetime),
+        ("finished_at", "finished_at", to_datetime),
+        ("task", "task_id", None),
+        ("user", "user_id", None),
+        (
+            "user_full_name",
+            # Same as User.get_full_name
+            lambda row: f"{row['user__first_name']} {row['user__last_name']}".strip(),
+            None,
+        ),
+        ("grading_status", "grading_status", None),
+        ("total_mark", "total_mark", float),
+        ("max_mark", "max_mark", int),
+    )
+    lookups = (
+        "id",
+        "started_at",
+        "finished_at",
+        "task_id",
+        "user_id",
+        "user__first_name",
+        "user__last_name",
+        "grading_status",
+        "total_mark",
+        "max_mark",
+    )
@@ -1,7 +1,8 @@
 from typing import Type
 
 from django.db import transaction
-from django.db.models import QuerySet
+from django.db.models import Count, QuerySet
+from django.http import HttpResponse
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.generics import get_object_or_404
@@ -10,27 +11,43 @@ from rest_framework.request import Request
 from rest_framework.response import Response
 from rest_framework.serializers import Serializer
 
-from api.permissions import IsCourseOwner
+from api.exports import export_response, gradebook_rows
+from api.mixins import ReplicaReadMixin, ValuesListMixin
+from api.pagination import CoursePagination
+from api.permissions import IsCourseOwner, IsCourseTeacher
 from api.serializers import (
     CourseSerializer,
+    CourseListSerializer,
     InvitationTokenSerializer,
     CourseDetailSerializer,
     CourseCreateSerializer,
     ChangeCourseUserPermissionSerializer,
 )
 from api.utils import invitation_token_verifications
+from api.values_serializers import CourseListValuesSerializer
+from core.gradebook import get_gradebook
 from core.models import Course, CourseMembership
 
 
-class CourseViewSet(viewsets.ModelViewSet):
+class CourseViewSet(ReplicaReadMixin, ValuesListMixin, viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
+    replica_actions = ("gradebook",)
+    values_serializer_class = CourseListValuesSerializer
+    pagination_class = CoursePagination
 
     def get_queryset(self) -> QuerySet:
+        if self.action == "list":
+            # Members are only counted, so that a page stays small
+            # however many users the courses have
+            return Course.objects.annotate(users_count=Count("users")).filter(
+                users__in=[self.request.user]
+            )
+
         return (
             Course.objects.filter(users__in=[self.request.user])
             .select_related("subject")
             .prefetch_related("users")
-            .prefetch_related("coursemembership_set")
+            .prefetch_related("coursemembership_set__user")
         )
 
     def get_serializer_class(self) -> Type[Serializer]:
@@ -46,6 +63,12 @@ class CourseViewSet(viewsets.ModelViewSet):
         if self.action == "create":
             return CourseCreateSerializer
 
+        if self.action in ("gradebook", "gradebook_export"):
+            return Serializer
+
+        if self.action == "list":
+            return CourseListSerializer
+
         return CourseSerializer
 
     def get_serializer_context(self) -> dict:
@@ -110,3 +133,20 @@ class CourseViewSet(viewsets.ModelViewSet):
             {"detail": f"Successfully changed user permission!"},
             status=status.HTTP_200_OK,
         )
+
+    @action(detail=True, methods=["GET"], permission_classes=[IsCourseTeacher])
+    def gradebook(self, request: Request, pk: int = None) -> Response:
+        return Response(get_gradebook(pk), status=status.HTTP_200_OK)
+
+    @action(
+        detail=True,
+        methods=["GET"],
+        url_path=r"gradebook/export/(?P<file_format>csv|xlsx)",
+        permission_classes=[IsCourseTeacher],
+    )
+    def gradebook_export(
+        self, request: Request, pk: int = None, file_format: str = None
+    ) -> HttpResponse:
+        return export_response(
+            request, gradebook_rows(pk), f"course-{pk}-gradebook", file_format
+        )
@@ -0,0 +1,26 @@
+import secrets
+
+from django.conf import settings
+from django.http import Http404, HttpRequest, HttpResponse
+from django.views.decorators.http import require_GET
+
+from core.metrics import render
+
+
+@require_GET
+def metrics(request: HttpRequest) -> HttpResponse:
+    """
+    Grading metrics of all processes in the Prometheus text format,
+    only served to scrapers sending METRICS_TOKEN.
+    """
+    if not settings.METRICS_TOKEN:
+        raise Http404
+
+    if not secrets.compare_digest(
+        request.headers.get("Authorization", ""), f"Bearer {settings.METRICS_TOKEN}"
+    ):
+        return HttpResponse(status=401)
+
+    return HttpResponse(
+        render(), content_type="text/plain; version=0.0.4; charset=utf-8"
+    )
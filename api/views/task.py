@@ -1,8 +1,13 @@
 import datetime
+import time
 from typing import Type
 
+from django.conf import settings
 from django.db import transaction
-from django.db.models import QuerySet
+from django.db.models import Prefetch, QuerySet, prefetch_related_objects
+from django.http import Http404, HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.exceptions import ValidationError
@@ -10,42 +15,120 @@ from rest_framework.request import Request
 from rest_framework.response import Response
 from rest_framework.serializers import Serializer
 
+from api.exports import export_response, task_results_rows
+from api.idempotency import (
+    acquire_lock,
+    get_replay,
+    hash_body,
+    release_lock,
+    store_replay,
+    wait_for_lock_release,
+)
+from api.mixins import ReplicaReadMixin, ValuesListMixin
+from api.pagination import TaskPagination
 from api.permissions import IsCourseTeacher, IsCourseStudent
 from api.serializers import (
+    AnswerSerializer,
     TaskSerializer,
     TaskDetailSerializer,
     TaskSessionDetailSerializer,
     TaskSessionResultSerializer,
     TaskSessionFinishSerializer,
 )
-from core.models import Task, Course, TaskSession, UserAnswer
-from openai_client.main import get_assistant_answer
+from api.values_serializers import TaskValuesSerializer
+from core import metrics
+from core.gradebook import invalidate_gradebook
+from core.grading import enqueue_grading, grade_answers
+from core.models import Task, Course, Question, TaskSession, UserAnswer
+from core.task_cache import (
+    get_cached_task_version,
+    get_task_payload,
+    get_task_version,
+)
+from openai_client.grading import GRADING_UNAVAILABLE, GradingResult
 
 MAX_SENDING_DELAY_MIN = 3
 
 
-class TaskViewSet(viewsets.ModelViewSet):
+class TaskViewSet(ReplicaReadMixin, ValuesListMixin, viewsets.ModelViewSet):
+    replica_actions = ("retrieve",)
+    values_serializer_class = TaskValuesSerializer
+    pagination_class = TaskPagination
+
     def get_permissions(self) -> list:
-        if self.action in ("list", "start", "finish", None):
+        if self.action in ("list", "start", "answer", "finish", None):
             permission_classes = [IsCourseStudent]
         else:
             permission_classes = [IsCourseTeacher]
 
         return [permission() for permission in permission_classes]
 
+    def initial(self, request: Request, *args, **kwargs) -> None:
+        self._started_at = time.perf_counter()
+        super().initial(request, *args, **kwargs)
+
+    def finalize_response(
+        self, request: Request, response: Response, *args, **kwargs
+    ) -> Response:
+        if self.action == "finish" and hasattr(self, "_started_at"):
+            metrics.finish_latency.observe(
+                time.perf_counter() - self._started_at, status=response.status_code
+            )
+
+        return super().finalize_response(request, response, *args, **kwargs)
+
     def get_queryset(self) -> QuerySet:
-        return Task.objects.filter(course_id=self.kwargs["course_pk"]).prefetch_related(
-            "quiz__questions"
+        queryset = Task.objects.filter(course_id=self.kwargs["course_pk"])
+
+        # Task detail payloads are rendered from the cache most of the time
+        if self.action in ("update", "partial_update", "answer", "finish"):
+            return queryset.prefetch_related("quiz__questions")
+
+        return queryset.select_related("quiz")
+
+    def retrieve(self, request: Request, pk: int = None, **kwargs) -> HttpResponse:
+        version = get_cached_task_version(pk)
+        task = None
+
+        # Versions are only started for tasks found, any other id is a 404
+        # before it takes a cache key
+        if version is None:
+            task = self.get_object()
+            version = get_task_version(pk)
+
+        data = get_task_payload(
+            "detail",
+            pk,
+            version,
+            lambda: self.get_serializer(task or self.get_object()).data,
         )
 
+        if data["course"] != int(self.kwargs["course_pk"]):
+            raise Http404
+
+        etag = quote_etag(f"{pk}-{version}")
+        last_modified = version // 10**9
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        ) or Response(data, status=status.HTTP_200_OK)
+
+        response["ETag"] = etag
+        response["Last-Modified"] = http_date(last_modified)
+        # Clients have to revalidate, the payload changes with the quiz
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
     def get_serializer_class(self) -> Type[Serializer]:
         if self.action in ("retrieve", "update", "partial_update"):
             return TaskDetailSerializer
 
+        if self.action == "answer":
+            return AnswerSerializer
+
         if self.action == "finish":
             return TaskSessionFinishSerializer
 
-        if self.action == "start":
+        if self.action in ("start", "export"):
             return Serializer
 
         return TaskSerializer
@@ -65,16 +148,31 @@ class TaskViewSet(viewsets.ModelViewSet):
     def start(self, request: Request, pk: int = None, **kwargs) -> Response:
         task = self.get_object()
 
-        if datetime.datetime.now() > task.deadline:
-            return Response(
-                {"detail": "You've missed deadline for the task!"},
-                status=status.HTTP_400_BAD_REQUEST,
-            )
+        if self._has_missed_deadline(task):
+            return self._missed_deadline_response()
 
         task_session, is_created = TaskSession.objects.get_or_create(
             task=task, user=request.user
         )
+        task_session.task = task
+
+        return self._started_session_response(task_session, is_created)
+
+    @staticmethod
+    def _has_missed_deadline(task: Task) -> bool:
+        return datetime.datetime.now() > task.deadline
+
+    @staticmethod
+    def _missed_deadline_response() -> Response:
+        return Response(
+            {"detail": "You've missed deadline for the task!"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
 
+    @staticmethod
+    def _started_session_response(
+        task_session: TaskSession, is_created: bool
+    ) -> Response:
         serializer = TaskSessionDetailSerializer(task_session)
 
         if not is_created:
@@ -88,70 +186,432 @@ class TaskViewSet(viewsets.ModelViewSet):
 
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
+    @action(
+        detail=True,
+        methods=["GET"],
+        url_path=r"export/(?P<file_format>csv|xlsx)",
+        name="export",
+    )
+    def export(
+        self, request: Request, pk: int = None, file_format: str = None, **kwargs
+    ) -> HttpResponse:
+        task = self.get_object()
+
+        return export_response(
+            request, task_results_rows(task), f"task-{task.id}-results", file_format
+        )
+
+    @staticmethod
+    def _close_session(task_session: TaskSession, grading_status: str) -> bool:
+        """
+        Set finished_at only if no other request has finished the session
+        in the meantime, returns whether this request did it.
+        """
+        task_session.finished_at = datetime.datetime.now()
+        task_session.grading_status = grading_status
+
+        is_closed = TaskSession.objects.filter(
+            id=task_session.id, finished_at__isnull=True
+        ).update(
+            finished_at=task_session.finished_at,
+            grading_status=grading_status,
+            total_mark=task_session.total_mark,
+            max_mark=task_session.max_mark,
+        )
+
+        if is_closed:
+            invalidate_gradebook(task_session.task.course_id)
+
+        return bool(is_closed)
+
+    @staticmethod
+    def _prefetch_answers(task_session: TaskSession) -> None:
+        """Answers of the session with their questions, as results render them."""
+        prefetch_related_objects(
+            [task_session],
+            Prefetch(
+                "useranswer_set",
+                queryset=UserAnswer.objects.select_related("question").order_by(
+                    "question_id"
+                ),
+            ),
+        )
+
+    @classmethod
+    def _result_response(cls, task_session: TaskSession, status_code: int) -> Response:
+        cls._prefetch_answers(task_session)
+        serializer = TaskSessionResultSerializer(task_session)
+
+        return Response(serializer.data, status=status_code)
+
+    @staticmethod
+    def _still_processing_response() -> Response:
+        return Response(
+            {"detail": "Your answers are still being processed!"},
+            status=status.HTTP_409_CONFLICT,
+        )
+
+    @staticmethod
+    def _already_finished_response() -> Response:
+        return Response(
+            {"detail": "You have already finished this task!"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    @classmethod
+    def _finished_session_response(
+        cls, task: Task, user: settings.AUTH_USER_MODEL
+    ) -> Response | None:
+        task_session = TaskSession.objects.filter(
+            task=task, user=user, finished_at__isnull=False
+        ).first()
+
+        if task_session is None:
+            return None
+
+        task_session.task = task
+        cls._prefetch_answers(task_session)
+        serializer = TaskSessionResultSerializer(task_session)
+
+        if task_session.grading_status == TaskSession.GradingStatus.GRADED:
+            return Response(serializer.data, status=status.HTTP_200_OK)
+
+        return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
+
+    @action(detail=True, methods=["POST"], name="answer")
+    def answer(self, request: Request, pk: int = None, **kwargs) -> Response:
+        """
+        Save or change the answer to one question of the open session.
+        Answers are graded in the background when GRADING_EAGER is on,
+        finish then only grades the ones changed since. Runs under the
+        finish lock, so no answer is saved while the session is finished.
+        """
+        task = self.get_object()
+        lock_key = f"finish:{request.user.id}:{task.id}"
+        token = acquire_lock(lock_key)
+
+        while token is None:
+            if not wait_for_lock_release(lock_key):
+                return self._still_processing_response()
+
+            token = acquire_lock(lock_key)
+
+        try:
+            return self._answer(request, task)
+        finally:
+            release_lock(lock_key, token)
+
+    def _answer(self, request: Request, task: Task) -> Response:
+        task_session, response = self._get_open_session(task, request.user)
+
+        if response is not None:
+            return response
+
+        serializer = AnswerSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        question_id = serializer.validated_data["question_id"]
+        text = serializer.validated_data["answer"]
+
+        if not any(
+            question.id == question_id for question in task.quiz.questions.all()
+        ):
+            raise ValidationError(
+                {
+                    "question_id": f"Question with id {question_id} does not exist for this task!"
+                }
+            )
+
+        user_answer = task_session.useranswer_set.filter(
+            question_id=question_id
+        ).first()
+
+        if user_answer is not None and user_answer.text == text:
+            return Response(serializer.data, status=status.HTTP_200_OK)
+
+        with transaction.atomic():
+            # Marks of open sessions aren't stored, so the signals keeping
+            # them in sync are skipped
+            if user_answer is None:
+                UserAnswer.objects.bulk_create(
+                    [
+                        UserAnswer(
+                            question_id=question_id,
+                            text=text,
+                            comment="",
+                            task_session=task_session,
+                        )
+                    ]
+                )
+            else:
+                UserAnswer.objects.filter(id=user_answer.id).update(
+                    text=text, score=None, comment="", pregrading_rule=""
+                )
+
+            if settings.GRADING_EAGER:
+                enqueue_grading(task_session)
+
+        return Response(
+            serializer.data,
+            status=status.HTTP_200_OK if user_answer else status.HTTP_201_CREATED,
+        )
+
     @action(detail=True, methods=["POST"], name="finish")
     def finish(self, request: Request, pk: int = None, **kwargs) -> Response:
+        """
+        Only one finish per user and task runs at a time, across processes.
+        A duplicate request waits for the running one and gets its result,
+        requests repeated with the same Idempotency-Key header get
+        the stored response replayed.
+        """
         task = self.get_object()
 
+        lock_key = f"finish:{request.user.id}:{task.id}"
+        idempotency_key = request.headers.get("Idempotency-Key")
+        replay_key = f"{lock_key}:{idempotency_key}" if idempotency_key else None
+        body_hash = hash_body(request) if idempotency_key else None
+
+        if replay_key:
+            response = get_replay(replay_key, body_hash)
+
+            if response is not None:
+                return response
+
+        has_waited = False
+        token = acquire_lock(lock_key)
+
+        while token is None:
+            has_waited = True
+
+            if not wait_for_lock_release(lock_key):
+                return self._still_processing_response()
+
+            if replay_key:
+                response = get_replay(replay_key, body_hash)
+
+                if response is not None:
+                    return response
+
+            token = acquire_lock(lock_key)
+
+        try:
+            response = None
+
+            if has_waited:
+                response = self._finished_session_response(task, request.user)
+
+            if response is None:
+                response = self._finish(request, task)
+
+            if replay_key and response.status_code < 500:
+                store_replay(replay_key, body_hash, response)
+        finally:
+            release_lock(lock_key, token)
+
+        return response
+
+    def _finish(self, request: Request, task: Task) -> Response:
+        task_session, response = self._get_open_session(task, request.user)
+
+        if response is not None:
+            return response
+
+        answers, questions = self._validate_answers(task, request.data)
+        user_answers = self._merge_answers(task_session, answers, questions)
+        ungraded = [
+            user_answer for user_answer in user_answers if user_answer.score is None
+        ]
+
+        if settings.GRADING_ASYNC and ungraded:
+            return self._finish_pending(task_session, user_answers, ungraded, questions)
+
+        # Grading takes network calls, so it's done before opening
+        # the transaction to keep database locks short
+        results = (
+            grade_answers(
+                [(user_answer.question, user_answer.text) for user_answer in ungraded],
+                course_id=task.course_id,
+            )
+            if ungraded
+            else {}
+        )
+
+        return self._finish_graded(
+            task_session, user_answers, ungraded, questions, results
+        )
+
+    @classmethod
+    def _get_open_session(
+        cls, task: Task, user: settings.AUTH_USER_MODEL
+    ) -> tuple[TaskSession | None, Response | None]:
+        """The session answers can be sent to, or the response why not."""
         if datetime.datetime.now() > task.deadline + datetime.timedelta(
             minutes=MAX_SENDING_DELAY_MIN
         ):
-            return Response(
-                {"detail": "You've missed deadline for the task!"},
-                status=status.HTTP_400_BAD_REQUEST,
-            )
+            return None, cls._missed_deadline_response()
 
-        task_session = TaskSession.objects.filter(task=task, user=request.user).first()
+        task_session = TaskSession.objects.filter(task=task, user=user).first()
 
         if task_session is None:
-            return Response(
+            return None, Response(
                 {"detail": "You have not started session for this task!"},
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
+        task_session.task = task
+
         if task_session.finished_at is not None:
-            return Response(
-                {"detail": "You have already finished this task!"},
-                status=status.HTTP_400_BAD_REQUEST,
-            )
+            return None, cls._already_finished_response()
 
-        # answers format: [{"question_id": 1, "answer": "some answer"}, ...]
+        return task_session, None
 
-        serializer_class = self.get_serializer_class()
+    @staticmethod
+    def _validate_answers(
+        task: Task, data: dict
+    ) -> tuple[list[tuple[Question, str]], dict[int, Question]]:
+        """Returns (question, answer text) pairs and questions by id."""
+        # answers format: [{"question_id": 1, "answer": "some answer"}, ...]
 
-        serializer = serializer_class(data=request.data)
+        serializer = TaskSessionFinishSerializer(data=data)
         serializer.is_valid(raise_exception=True)
 
-        with transaction.atomic():
-            for answer in serializer.validated_data["answers"]:
-                question_id = answer["question_id"]
-                question = task.quiz.questions.filter(id=question_id).first()
-
-                if question is None:
-                    raise ValidationError(
-                        {
-                            "answers": f"Question with id {question_id} does not exist for this task!"
-                        }
-                    )
-
-                answer = answer["answer"]
+        # questions are prefetched with the task, so they're validated
+        # without any queries
+        questions = {question.id: question for question in task.quiz.questions.all()}
+        answers = []
+        answered_question_ids = set()
+
+        for answer in serializer.validated_data["answers"]:
+            question_id = answer["question_id"]
+            question = questions.get(question_id)
+
+            if question is None:
+                raise ValidationError(
+                    {
+                        "answers": f"Question with id {question_id} does not exist for this task!"
+                    }
+                )
 
-                score, explanation = get_assistant_answer(
-                    question.title, question.expected_answer, answer
+            if question_id in answered_question_ids:
+                raise ValidationError(
+                    {
+                        "answers": f"Question with id {question_id} is answered more than once!"
+                    }
                 )
 
-                UserAnswer.objects.create(
+            answered_question_ids.add(question_id)
+            answers.append((question, answer["answer"]))
+
+        return answers, questions
+
+    @staticmethod
+    def _merge_answers(
+        task_session: TaskSession,
+        answers: list[tuple[Question, str]],
+        questions: dict[int, Question],
+    ) -> list[UserAnswer]:
+        """
+        The answers saved one by one with the ones sent to finish applied.
+        Changed answers lose their grade, unchanged ones keep it.
+        """
+        user_answers = {
+            user_answer.question_id: user_answer
+            for user_answer in task_session.useranswer_set.all()
+        }
+
+        for user_answer in user_answers.values():
+            user_answer.question = questions[user_answer.question_id]
+
+        for question, text in answers:
+            user_answer = user_answers.get(question.id)
+
+            if user_answer is None:
+                user_answers[question.id] = UserAnswer(
                     question=question,
-                    text=answer,
-                    score=score,
-                    comment=explanation,
+                    text=text,
+                    comment="",
                     task_session=task_session,
                 )
+            elif user_answer.text != text:
+                user_answer.text = text
+                user_answer.score = None
+                user_answer.comment = ""
+                user_answer.pregrading_rule = ""
+
+        return list(user_answers.values())
+
+    @staticmethod
+    def _save_answers(
+        user_answers: list[UserAnswer], ungraded: list[UserAnswer]
+    ) -> None:
+        """Create the new answers and update the changed or graded ones."""
+        new_answers = [
+            user_answer for user_answer in user_answers if user_answer.pk is None
+        ]
+        changed_answers = [
+            user_answer for user_answer in ungraded if user_answer.pk is not None
+        ]
+
+        UserAnswer.objects.bulk_create(new_answers)
+        UserAnswer.objects.bulk_update(
+            changed_answers, ["text", "score", "comment", "pregrading_rule"]
+        )
+
+    @classmethod
+    def _finish_pending(
+        cls,
+        task_session: TaskSession,
+        user_answers: list[UserAnswer],
+        ungraded: list[UserAnswer],
+        questions: dict[int, Question],
+    ) -> Response:
+        """Store the ungraded answers, for the grade worker."""
+        task_session.set_marks(user_answers, questions.values())
+
+        with transaction.atomic():
+            if not cls._close_session(task_session, TaskSession.GradingStatus.PENDING):
+                return cls._already_finished_response()
+
+            cls._save_answers(user_answers, ungraded)
+            enqueue_grading(task_session)
+
+        return cls._result_response(task_session, status.HTTP_202_ACCEPTED)
+
+    @classmethod
+    def _finish_graded(
+        cls,
+        task_session: TaskSession,
+        user_answers: list[UserAnswer],
+        ungraded: list[UserAnswer],
+        questions: dict[int, Question],
+        results: dict[int, GradingResult],
+    ) -> Response:
+        errors = {
+            question_id: GRADING_UNAVAILABLE
+            for question_id, result in results.items()
+            if not result.is_ok
+        }
+
+        if errors:
+            return Response(
+                {
+                    "detail": "Some answers could not be graded, please try again!",
+                    "answers": errors,
+                },
+                status=status.HTTP_502_BAD_GATEWAY,
+            )
 
-            task_session.finished_at = datetime.datetime.now()
-            task_session.save()
+        for user_answer in ungraded:
+            result = results[user_answer.question_id]
+            user_answer.score = result.score
+            user_answer.comment = result.explanation
+            user_answer.pregrading_rule = result.pregrading_rule
 
-        task_session.refresh_from_db()
+        task_session.set_marks(user_answers, questions.values())
 
-        serializer = TaskSessionResultSerializer(task_session)
+        with transaction.atomic():
+            if not cls._close_session(task_session, TaskSession.GradingStatus.GRADED):
+                return cls._already_finished_response()
+
+            cls._save_answers(user_answers, ungraded)
 
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return cls._result_response(task_session, status.HTTP_200_OK)
@@ -0,0 +1,248 @@
+"""
+Async versions of the start and finish actions of TaskViewSet, served
+instead of them under ASGI, see config/urls_asgi.py. A submission waiting
+for the grader only holds a coroutine, not a worker thread. Responses
+are the same as the ones of the viewset, request bodies have to be JSON.
+"""
+import functools
+import json
+import time
+from types import SimpleNamespace
+from typing import Awaitable, Callable
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.http import Http404, HttpRequest, HttpResponse
+from django.utils.cache import patch_vary_headers
+from rest_framework import exceptions
+from rest_framework.response import Response
+from rest_framework.views import exception_handler
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from api.idempotency import (
+    acquire_lock,
+    await_lock_release,
+    get_replay,
+    hash_body,
+    release_lock,
+    store_replay,
+)
+from api.permissions import IsCourseStudent
+from api.renderers import ORJSONRenderer
+from api.views.task import TaskViewSet
+from core.db import pin_to_primary
+from core import metrics
+from core.grading import agrade_answers
+from core.models import Task, TaskSession
+
+AsyncView = Callable[[HttpRequest, str, str], Awaitable[Response]]
+
+
+def _authorize(request: HttpRequest, course_pk: str, pk: str) -> None:
+    user_auth = JWTAuthentication().authenticate(request)
+
+    if user_auth is None:
+        raise exceptions.NotAuthenticated()
+
+    request.user, request.auth = user_auth
+    view = SimpleNamespace(kwargs={"course_pk": course_pk, "pk": pk})
+
+    if not IsCourseStudent().has_permission(request, view):
+        raise exceptions.PermissionDenied()
+
+
+def _handle_exception(exc: Exception) -> Response:
+    """Same responses as APIView.handle_exception."""
+    if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+        exc.auth_header = JWTAuthentication().authenticate_header(None)
+
+    response = exception_handler(exc, {})
+
+    if response is None:
+        raise exc
+
+    return response
+
+
+def _render(response: Response) -> HttpResponse:
+    response.accepted_renderer = ORJSONRenderer()
+    response.accepted_media_type = ORJSONRenderer.media_type
+    response.renderer_context = {}
+    response["Allow"] = "POST, OPTIONS"
+    patch_vary_headers(response, ("Accept",))
+
+    return response.render()
+
+
+def api_view(view: AsyncView) -> AsyncView:
+    """Authentication, permissions and error handling of the viewset."""
+
+    @functools.wraps(view)
+    async def wrapper(request: HttpRequest, course_pk: str, pk: str) -> HttpResponse:
+        try:
+            if request.method != "POST":
+                raise exceptions.MethodNotAllowed(request.method)
+
+            await sync_to_async(_authorize)(request, course_pk, pk)
+            response = await view(request, course_pk, pk)
+        except Exception as exc:
+            response = _handle_exception(exc)
+
+        # Same read-your-writes pinning as ReplicaReadMixin
+        if response.status_code < 400 and request.user.is_authenticated:
+            await sync_to_async(pin_to_primary)(request.user.id)
+
+        return _render(response)
+
+    # Authenticated by the JWT header, like the viewset
+    wrapper.csrf_exempt = True
+    return wrapper
+
+
+def observe_finish(view: AsyncView) -> AsyncView:
+    """Same finish latency metric as TaskViewSet.finalize_response."""
+
+    @functools.wraps(view)
+    async def wrapper(request: HttpRequest, course_pk: str, pk: str) -> HttpResponse:
+        started_at = time.perf_counter()
+        response = await view(request, course_pk, pk)
+        metrics.finish_latency.observe(
+            time.perf_counter() - started_at, status=response.status_code
+        )
+
+        return response
+
+    return wrapper
+
+
+def _parse(request: HttpRequest) -> dict:
+    if not request.body:
+        return {}
+
+    if request.content_type != "application/json":
+        raise exceptions.UnsupportedMediaType(request.content_type)
+
+    try:
+        return json.loads(request.body)
+    except ValueError as exc:
+        raise exceptions.ParseError(f"JSON parse error - {exc}")
+
+
+async def _get_task(course_pk: str, pk: str, with_questions: bool) -> Task:
+    queryset = Task.objects.filter(course_id=course_pk)
+
+    if with_questions:
+        queryset = queryset.prefetch_related("quiz__questions")
+    else:
+        queryset = queryset.select_related("quiz")
+
+    try:
+        return await queryset.aget(pk=pk)
+    except (Task.DoesNotExist, TypeError, ValueError, ValidationError):
+        raise Http404
+
+
+@api_view
+async def start(request: HttpRequest, course_pk: str, pk: str) -> Response:
+    task = await _get_task(course_pk, pk, with_questions=False)
+
+    if TaskViewSet._has_missed_deadline(task):
+        return TaskViewSet._missed_deadline_response()
+
+    task_session, is_created = await TaskSession.objects.aget_or_create(
+        task=task, user=request.user
+    )
+    task_session.task = task
+
+    return await sync_to_async(TaskViewSet._started_session_response)(
+        task_session, is_created
+    )
+
+
+@observe_finish
+@api_view
+async def finish(request: HttpRequest, course_pk: str, pk: str) -> Response:
+    """Single-flight and idempotent the same way as TaskViewSet.finish."""
+    task = await _get_task(course_pk, pk, with_questions=True)
+
+    lock_key = f"finish:{request.user.id}:{task.id}"
+    idempotency_key = request.headers.get("Idempotency-Key")
+    replay_key = f"{lock_key}:{idempotency_key}" if idempotency_key else None
+    body_hash = hash_body(request) if idempotency_key else None
+
+    if replay_key:
+        response = await sync_to_async(get_replay)(replay_key, body_hash)
+
+        if response is not None:
+            return response
+
+    has_waited = False
+    token = await sync_to_async(acquire_lock)(lock_key)
+
+    while token is None:
+        has_waited = True
+
+        if not await await_lock_release(lock_key):
+            return TaskViewSet._still_processing_response()
+
+        if replay_key:
+            response = await sync_to_async(get_replay)(replay_key, body_hash)
+
+            if response is not None:
+                return response
+
+        token = await sync_to_async(acquire_lock)(lock_key)
+
+    try:
+        response = None
+
+        if has_waited:
+            response = await sync_to_async(TaskViewSet._finished_session_response)(
+                task, request.user
+            )
+
+        if response is None:
+            response = await _finish(request, task)
+
+        if replay_key and response.status_code < 500:
+            await sync_to_async(store_replay)(replay_key, body_hash, response)
+    finally:
+        await sync_to_async(release_lock)(lock_key, token)
+
+    return response
+
+
+async def _finish(request: HttpRequest, task: Task) -> Response:
+    task_session, response = await sync_to_async(TaskViewSet._get_open_session)(
+        task, request.user
+    )
+
+    if response is not None:
+        return response
+
+    answers, questions = TaskViewSet._validate_answers(task, _parse(request))
+    user_answers = await sync_to_async(TaskViewSet._merge_answers)(
+        task_session, answers, questions
+    )
+    ungraded = [
+        user_answer for user_answer in user_answers if user_answer.score is None
+    ]
+
+    if settings.GRADING_ASYNC and ungraded:
+        return await sync_to_async(TaskViewSet._finish_pending)(
+            task_session, user_answers, ungraded, questions
+        )
+
+    results = (
+        await agrade_answers(
+            [(user_answer.question, user_answer.text) for user_answer in ungraded],
+            course_id=task.course_id,
+        )
+        if ungraded
+        else {}
+    )
+
+    return await sync_to_async(TaskViewSet._finish_graded)(
+        task_session, user_answers, ungraded, questions, results
+    )
@@ -2,20 +2,33 @@ from typing import Type
 
 from django.db.models import QuerySet
 from rest_framework import viewsets, mixins
+from rest_framework.filters import OrderingFilter
+from rest_framework.exceptions import ValidationError
 from rest_framework.serializers import Serializer
 
+from api.mixins import ReplicaReadMixin, ValuesListMixin
+from api.pagination import TaskSessionPagination
 from api.permissions import IsCourseStudent, IsCourseTeacher
 from api.serializers import TaskSessionSerializer, TaskSessionResultSerializer
+from api.values_serializers import TaskSessionValuesSerializer
 from core.models import TaskSession
 
 
 class TaskSessionViewSet(
+    ReplicaReadMixin,
+    ValuesListMixin,
     mixins.ListModelMixin,
     mixins.RetrieveModelMixin,
     mixins.DestroyModelMixin,
     viewsets.GenericViewSet,
 ):
     permission_classes = (IsCourseStudent,)
+    replica_actions = ("list",)
+    values_serializer_class = TaskSessionValuesSerializer
+    pagination_class = TaskSessionPagination
+    filter_backends = (OrderingFilter,)
+    ordering_fields = ("total_mark", "max_mark", "started_at", "finished_at")
+    ordering = ("id",)
 
     def get_queryset(self) -> QuerySet:
         queryset = TaskSession.objects.filter(task_id=self.kwargs["task_pk"])
@@ -23,9 +36,31 @@ class TaskSessionViewSet(
         if not IsCourseTeacher().has_permission(self.request, self):
             queryset = queryset.filter(user=self.request.user)
 
-        return queryset.select_related("user").prefetch_related(
-            "useranswer_set__question"
-        )
+        grading_status = self.request.query_params.get("grading_status")
+
+        if grading_status:
+            queryset = queryset.filter(grading_status=grading_status)
+
+        min_total_mark = self.request.query_params.get("min_total_mark")
+        max_total_mark = self.request.query_params.get("max_total_mark")
+
+        try:
+            if min_total_mark:
+                queryset = queryset.filter(total_mark__gte=float(min_total_mark))
+
+            if max_total_mark:
+                queryset = queryset.filter(total_mark__lte=float(max_total_mark))
+        except ValueError:
+            raise ValidationError("Total mark filters must be numbers!")
+
+        queryset = queryset.select_related("user")
+
+        if self.action == "retrieve":
+            queryset = queryset.prefetch_related(
+                "useranswer_set__question", "task__quiz__questions"
+            )
+
+        return queryset
 
     def get_serializer_class(self) -> Type[Serializer]:
         if self.action == "retrieve":
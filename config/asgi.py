@@ -3,14 +3,41 @@ ASGI config for config project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Requests are resolved with config.urls_asgi, which serves start and
+finish with async views. The debug toolbar middleware is sync-only and
+would make every request hold a thread, so it's off unless
+DEBUG_TOOLBAR=True is set explicitly.
+
+Database connections are closed at the end of every request. Under
+ASGI every request runs its sync code in a thread of its own, and a
+persistent connection left in such a thread is never reused or closed,
+so they would pile up under load. Use a connection pooler, e.g.
+PgBouncer, to save the cost of connecting.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/4.1/howto/deployment/asgi/
 """
 
 import os
 
-from django.core.asgi import get_asgi_application
+import django
+from django.core.handlers.asgi import ASGIHandler
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
+os.environ.setdefault("DEBUG_TOOLBAR", "False")
+os.environ["DATABASE_CONN_MAX_AGE"] = "0"
+
+django.setup(set_prefix=False)
+
+
+class AsyncViewsASGIHandler(ASGIHandler):
+    def create_request(self, scope, body_file):
+        request, error_response = super().create_request(scope, body_file)
+
+        if request is not None:
+            request.urlconf = "config.urls_asgi"
+
+        return request, error_response
+
 
-application = get_asgi_application()
+application = AsyncViewsASGIHandler()
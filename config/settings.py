@@ -12,6 +12,8 @@ https://docs.djangoproject.com/en/4.1/ref/settings/
 import os
 from datetime import timedelta
 from pathlib import Path
+
+from django.core.exceptions import ImproperlyConfigured
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -48,7 +50,6 @@ INSTALLED_APPS = [
     "rest_framework",
     "drf_spectacular",
     "rest_framework_simplejwt",
-    "debug_toolbar",
     "corsheaders",
     "core",
     "api",
@@ -61,8 +62,9 @@ CORS_ALLOWED_ORIGINS = [
 
 
 MIDDLEWARE = [
+    "api.middleware.TracingMiddleware",
+    "api.middleware.ProfilingMiddleware",
     "django.middleware.security.SecurityMiddleware",
-    "debug_toolbar.middleware.DebugToolbarMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -72,6 +74,13 @@ MIDDLEWARE = [
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
 
+# The toolbar middleware is sync-only, config/asgi.py turns it off
+DEBUG_TOOLBAR = os.getenv("DEBUG_TOOLBAR", "True") == "True"
+
+if DEBUG_TOOLBAR:
+    INSTALLED_APPS.append("debug_toolbar")
+    MIDDLEWARE.insert(3, "debug_toolbar.middleware.DebugToolbarMiddleware")
+
 ROOT_URLCONF = "config.urls"
 
 TEMPLATES = [
@@ -96,13 +105,56 @@ WSGI_APPLICATION = "config.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/4.1/ref/settings/#databases
 
+# SQLite by default, a server database in production, e.g.
+# DATABASE_ENGINE="django.db.backends.postgresql"
+DATABASE_ENGINE = os.getenv("DATABASE_ENGINE", "django.db.backends.sqlite3")
+DATABASE_NAME = os.getenv("DATABASE_NAME")
+
+# Only SQLite has a name to fall back to, a server database would be
+# looked up by the path of the SQLite file
+if not DATABASE_NAME:
+    if DATABASE_ENGINE != "django.db.backends.sqlite3":
+        raise ImproperlyConfigured(f"DATABASE_NAME is required by {DATABASE_ENGINE}")
+
+    DATABASE_NAME = BASE_DIR / "db.sqlite3"
+
 DATABASES = {
     "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
+        "ENGINE": DATABASE_ENGINE,
+        "NAME": DATABASE_NAME,
+        "USER": os.getenv("DATABASE_USER", ""),
+        "PASSWORD": os.getenv("DATABASE_PASSWORD", ""),
+        "HOST": os.getenv("DATABASE_HOST", ""),
+        "PORT": os.getenv("DATABASE_PORT", ""),
+        # Keep connections open between requests, checking them before reuse,
+        # always 0 under ASGI, see config.asgi
+        "CONN_MAX_AGE": int(os.getenv("DATABASE_CONN_MAX_AGE", 60)),
+        "CONN_HEALTH_CHECKS": True,
     }
 }
 
+# Read replica of the default database, read-heavy endpoints use it
+if os.getenv("DATABASE_REPLICA_HOST"):
+    DATABASES["replica"] = {
+        **DATABASES["default"],
+        "HOST": os.getenv("DATABASE_REPLICA_HOST"),
+        "TEST": {"MIRROR": "default"},
+    }
+
+DATABASE_ROUTERS = ["core.db.ReplicaRouter"]
+
+# How long a user reads from the default database after a write,
+# should be longer than the replication lag
+DATABASE_REPLICA_PIN_SEC = int(os.getenv("DATABASE_REPLICA_PIN_SEC", 10))
+
+# Pragmas set on every SQLite connection: WAL lets readers work while
+# a writer commits, busy_timeout makes writers wait instead of failing
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", 5000)),
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
@@ -165,11 +217,20 @@ SPECTACULAR_SETTINGS = {
 }
 
 
+# Default and maximum number of items on one page of list endpoints,
+# clients can ask for another size with the `page_size` query parameter
+API_PAGE_SIZE = int(os.getenv("API_PAGE_SIZE", 50))
+API_MAX_PAGE_SIZE = int(os.getenv("API_MAX_PAGE_SIZE", 200))
+
 REST_FRAMEWORK = {
     "DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema",
     "DEFAULT_AUTHENTICATION_CLASSES": (
         "rest_framework_simplejwt.authentication.JWTAuthentication",
     ),
+    "DEFAULT_RENDERER_CLASSES": (
+        "api.renderers.ORJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ),
 }
 
 
@@ -180,3 +241,113 @@ SIMPLE_JWT = {
 }
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+
+# Maximum number of grading calls made at the same time for one submission
+GRADING_MAX_WORKERS = int(os.getenv("GRADING_MAX_WORKERS", 8))
+
+# When enabled, finish only stores the answers and returns 202,
+# grading is done later by `manage.py grade_worker`
+GRADING_ASYNC = os.getenv("GRADING_ASYNC", "False") == "True"
+# When enabled, answers saved one by one during the session are graded
+# right away by `manage.py grade_worker`, finish only grades what changed
+GRADING_EAGER = os.getenv("GRADING_EAGER", "False") == "True"
+GRADING_JOB_MAX_ATTEMPTS = int(os.getenv("GRADING_JOB_MAX_ATTEMPTS", 3))
+# Running jobs not finished within this time are considered abandoned
+GRADING_JOB_TIMEOUT_SEC = int(os.getenv("GRADING_JOB_TIMEOUT_SEC", 600))
+
+# Number of grades kept in the in-process tier of the grading cache
+GRADING_CACHE_LRU_SIZE = int(os.getenv("GRADING_CACHE_LRU_SIZE", 10000))
+
+# Number of answers graded with one completion, 1 sends every answer on its own
+GRADING_BATCH_SIZE = int(os.getenv("GRADING_BATCH_SIZE", 1))
+
+# Dotted path to the grader backend class, e.g.
+# "openai_client.backends.LocalGraderBackend" for offline grading
+GRADER_BACKEND = os.getenv(
+    "GRADER_BACKEND", "openai_client.backends.OpenAIGraderBackend"
+)
+# Artificial latency of the local grader backend
+GRADER_LOCAL_LATENCY_MS = float(os.getenv("GRADER_LOCAL_LATENCY_MS", 0))
+GRADER_LOCAL_LATENCY_JITTER_MS = float(os.getenv("GRADER_LOCAL_LATENCY_JITTER_MS", 0))
+# "uniform" jitter up to the value above, or "exponential" with it as the mean,
+# which gives the long tail of real completions
+GRADER_LOCAL_LATENCY_DISTRIBUTION = os.getenv(
+    "GRADER_LOCAL_LATENCY_DISTRIBUTION", "uniform"
+)
+
+# Client side limits of calls to OpenAI
+OPENAI_REQUESTS_PER_MINUTE = int(os.getenv("OPENAI_REQUESTS_PER_MINUTE", 3500))
+OPENAI_TOKENS_PER_MINUTE = int(os.getenv("OPENAI_TOKENS_PER_MINUTE", 90000))
+# Count the per minute limits in the cache, shared by all processes using it
+OPENAI_RATE_LIMIT_SHARED = os.getenv("OPENAI_RATE_LIMIT_SHARED", "False") == "True"
+OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", 16))
+# Calls slower than this per graded answer make the concurrency limit
+# back off like a 429 does
+OPENAI_TARGET_LATENCY_SEC = float(os.getenv("OPENAI_TARGET_LATENCY_SEC", 20))
+OPENAI_CALL_DEADLINE_SEC = float(os.getenv("OPENAI_CALL_DEADLINE_SEC", 60))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", 5))
+OPENAI_RETRY_BASE_DELAY_SEC = float(os.getenv("OPENAI_RETRY_BASE_DELAY_SEC", 0.5))
+OPENAI_RETRY_MAX_DELAY_SEC = float(os.getenv("OPENAI_RETRY_MAX_DELAY_SEC", 20))
+
+# Rules resolving trivial answers without the grader, quizzes and
+# questions can override them with their own pregrading_rules
+GRADING_PREGRADING_RULES = {
+    "empty": True,
+    "min_length": 0,
+    "min_length_ratio": 0,
+    "exact_match": True,
+}
+
+# Cache shared by all processes in production, e.g.
+# CACHE_BACKEND="django.core.cache.backends.redis.RedisCache"
+# CACHE_LOCATION="redis://127.0.0.1:6379"
+# The default locmem cache is one per process, so every worker starts
+# its own task versions and the task ETags differ between workers
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv(
+            "CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"
+        ),
+        "LOCATION": os.getenv("CACHE_LOCATION", ""),
+    }
+}
+
+# How long finish of one user and task is locked against duplicates
+FINISH_LOCK_TIMEOUT_SEC = int(os.getenv("FINISH_LOCK_TIMEOUT_SEC", 300))
+# How long a duplicate finish waits for the running one
+FINISH_WAIT_TIMEOUT_SEC = int(os.getenv("FINISH_WAIT_TIMEOUT_SEC", 120))
+IDEMPOTENCY_KEY_TTL_SEC = int(os.getenv("IDEMPOTENCY_KEY_TTL_SEC", 60 * 60 * 24))
+
+# Gradebooks are invalidated on every grade change, this only bounds
+# how long a stale user name can be shown
+GRADEBOOK_CACHE_TIMEOUT_SEC = int(os.getenv("GRADEBOOK_CACHE_TIMEOUT_SEC", 60 * 60))
+
+# Task detail payloads are invalidated on every change of the task,
+# its quiz or its questions, this only bounds how long they're kept
+TASK_CACHE_TIMEOUT_SEC = int(os.getenv("TASK_CACHE_TIMEOUT_SEC", 60 * 60 * 24))
+
+# Course permissions are invalidated on every membership change, this
+# only bounds how long a change made around the signals can be missed
+MEMBERSHIP_CACHE_TIMEOUT_SEC = int(os.getenv("MEMBERSHIP_CACHE_TIMEOUT_SEC", 60 * 5))
+
+# Request timings, see api.middleware.ProfilingMiddleware
+PROFILING_SERVER_TIMING = os.getenv("PROFILING_SERVER_TIMING", "True") == "True"
+PROFILING_SLOW_REQUEST_MS = int(os.getenv("PROFILING_SLOW_REQUEST_MS", 2000))
+# Profile one in this many requests to the views below, 0 turns it off
+PROFILING_SAMPLE_EVERY = int(os.getenv("PROFILING_SAMPLE_EVERY", 0))
+PROFILING_SAMPLE_VIEWS = os.getenv("PROFILING_SAMPLE_VIEWS", "task-finish").split(",")
+PROFILING_DIR = os.getenv("PROFILING_DIR", BASE_DIR / "profiles")
+
+# Every process writes its metrics here for /metrics to add them up,
+# empty keeps them in memory for single process servers
+METRICS_DIR = os.getenv("METRICS_DIR", BASE_DIR / "metrics")
+METRICS_FLUSH_INTERVAL_SEC = float(os.getenv("METRICS_FLUSH_INTERVAL_SEC", 1))
+# Bearer token the scraper has to send, /metrics is disabled without one
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+# Import path of the span exporter, e.g. core.tracing.JSONFileExporter or
+# core.tracing.LoggingExporter, empty turns tracing off
+TRACING_EXPORTER = os.getenv("TRACING_EXPORTER", "")
+# Share of the requests traced, unless their traceparent header decides
+TRACING_SAMPLE_RATE = float(os.getenv("TRACING_SAMPLE_RATE", 1))
+TRACING_FILE = os.getenv("TRACING_FILE", BASE_DIR / "traces.jsonl")
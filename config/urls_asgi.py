@@ -0,0 +1,21 @@
+"""
+URLs served under ASGI: the same as config.urls, except that start and
+finish are served by their async views.
+"""
+from django.urls import re_path
+
+from api.views import task_async
+from config.urls import urlpatterns as sync_urlpatterns
+
+urlpatterns = [
+    re_path(
+        r"^api/courses/(?P<course_pk>[^/.]+)/tasks/(?P<pk>[^/.]+)/start/$",
+        task_async.start,
+        name="task-start",
+    ),
+    re_path(
+        r"^api/courses/(?P<course_pk>[^/.]+)/tasks/(?P<pk>[^/.]+)/finish/$",
+        task_async.finish,
+        name="task-finish",
+    ),
+] + sync_urlpatterns
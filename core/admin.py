@@ -1,6 +1,16 @@
 from django.contrib import admin
 
-from core.models import Subject, Course, Quiz, Question, TaskSession, UserAnswer, Task
+from core.models import (
+    Subject,
+    Course,
+    Quiz,
+    Question,
+    TaskSession,
+    UserAnswer,
+    Task,
+    GradingJob,
+    GradingCacheEntry,
+)
 
 
 @admin.register(Subject)
@@ -41,3 +51,15 @@ class QuestionAdmin(admin.ModelAdmin):
 @admin.register(UserAnswer)
 class UserAnswerAdmin(admin.ModelAdmin):
     pass
+
+
+@admin.register(GradingJob)
+class GradingJobAdmin(admin.ModelAdmin):
+    list_display = ("task_session", "status", "attempts", "claimed_by", "created_at")
+    list_filter = ("status",)
+
+
+@admin.register(GradingCacheEntry)
+class GradingCacheEntryAdmin(admin.ModelAdmin):
+    list_display = ("question", "score", "hits", "prompt_version", "created_at")
+    list_filter = ("model", "prompt_version")
@@ -0,0 +1,66 @@
+import contextlib
+import contextvars
+from typing import Iterator
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+
+REPLICA = "replica"
+
+# Set while serving a request allowed to read from the replica
+_use_replica = contextvars.ContextVar("use_replica", default=False)
+
+
+def _pin_key(user_id: int) -> str:
+    return f"db-pin:{user_id}"
+
+
+def pin_to_primary(user_id: int) -> None:
+    """Read from the default database until the user's writes replicate."""
+    if REPLICA not in connections.databases:
+        return
+
+    cache.set(_pin_key(user_id), True, timeout=settings.DATABASE_REPLICA_PIN_SEC)
+
+
+def is_pinned_to_primary(user_id: int) -> bool:
+    return cache.get(_pin_key(user_id)) is not None
+
+
+def reads_from_replica() -> bool:
+    return _use_replica.get() and REPLICA in connections.databases
+
+
+@contextlib.contextmanager
+def use_replica() -> Iterator[None]:
+    token = _use_replica.set(True)
+
+    try:
+        yield
+    finally:
+        _use_replica.reset(token)
+
+
+class ReplicaRouter:
+    """
+    Sends reads made inside `use_replica` to the replica, when one is
+    configured. Everything else, including writes, uses the default
+    database.
+    """
+
+    def db_for_read(self, model, **hints) -> str | None:
+        if reads_from_replica():
+            return REPLICA
+
+        return None
+
+    def db_for_write(self, model, **hints) -> str | None:
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints) -> bool | None:
+        # Both aliases hold the same data
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints) -> bool | None:
+        return db != REPLICA
@@ -0,0 +1,110 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Sum
+
+from core.db import reads_from_replica
+from core.models import CourseMembership, Task, TaskSession
+
+
+def _cache_key(course_id: int) -> str:
+    return f"gradebook:{course_id}"
+
+
+def invalidate_gradebook(*course_ids: int) -> None:
+    keys = [_cache_key(course_id) for course_id in course_ids]
+
+    # Otherwise a gradebook built before the commit could be cached again
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def build_gradebook(course_id: int) -> dict:
+    """
+    Students x tasks matrix of marks of the course with per student totals
+    and per task averages. Marks of tasks not finished, or not graded yet,
+    are None, so partial marks of pending sessions never look final.
+    """
+    tasks = list(
+        Task.objects.filter(course_id=course_id)
+        .annotate(max_mark=Sum("quiz__questions__value"))
+        .order_by("deadline", "id")
+        .values("id", "title", "deadline", "max_mark")
+    )
+    students = list(
+        CourseMembership.objects.filter(
+            course_id=course_id,
+            permission=CourseMembership.UserPermission.STUDENT,
+        )
+        .order_by("user__last_name", "user__first_name", "user__email")
+        .values("user_id", "user__email", "user__first_name", "user__last_name")
+    )
+    marks = {
+        (user_id, task_id): total_mark
+        for user_id, task_id, total_mark in TaskSession.objects.filter(
+            task__course_id=course_id,
+            grading_status=TaskSession.GradingStatus.GRADED,
+            user__coursemembership__course_id=course_id,
+            user__coursemembership__permission=CourseMembership.UserPermission.STUDENT,
+        ).values_list("user_id", "task_id", "total_mark")
+    }
+
+    max_mark = sum(task["max_mark"] or 0 for task in tasks)
+    task_marks = {task["id"]: [] for task in tasks}
+    rows = []
+
+    for student in students:
+        row_marks = []
+
+        for task in tasks:
+            mark = marks.get((student["user_id"], task["id"]))
+            row_marks.append(mark)
+
+            if mark is not None:
+                task_marks[task["id"]].append(mark)
+
+        rows.append(
+            {
+                "id": student["user_id"],
+                "email": student["user__email"],
+                "first_name": student["user__first_name"],
+                "last_name": student["user__last_name"],
+                "marks": row_marks,
+                "total_mark": sum(mark for mark in row_marks if mark is not None),
+                "max_mark": max_mark,
+            }
+        )
+
+    return {
+        "tasks": [
+            {
+                **task,
+                "max_mark": task["max_mark"] or 0,
+                "submissions": len(task_marks[task["id"]]),
+                "average_mark": (
+                    sum(task_marks[task["id"]]) / len(task_marks[task["id"]])
+                    if task_marks[task["id"]]
+                    else None
+                ),
+            }
+            for task in tasks
+        ],
+        "students": rows,
+    }
+
+
+def get_gradebook(course_id: int) -> dict:
+    """Cached gradebook, rebuilt after the next grade change in the course."""
+    key = _cache_key(course_id)
+    gradebook = cache.get(key)
+
+    if gradebook is None:
+        gradebook = build_gradebook(course_id)
+        timeout = settings.GRADEBOOK_CACHE_TIMEOUT_SEC
+
+        # Replica could still miss the change the cache was invalidated for
+        if reads_from_replica():
+            timeout = min(timeout, settings.DATABASE_REPLICA_PIN_SEC)
+
+        cache.set(key, gradebook, timeout=timeout)
+
+    return gradebook
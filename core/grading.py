@@ -0,0 +1,280 @@
+import datetime
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+
+from core.gradebook import invalidate_gradebook
+from core.grading_cache import CachedGrade, grading_cache, make_key
+from core.models import GradingJob, Question, TaskSession, UserAnswer
+from core.pregrading import pregrade
+from core.profiling import timer
+from core.tracing import span
+from openai_client.grading import (
+    GradingRequest,
+    GradingResult,
+    agrade_concurrently,
+    grade_concurrently,
+)
+
+
+def _prepare_grading(
+    answers: list[tuple[Question, str]], course_id: int | None
+) -> tuple[dict[int, GradingResult], dict[int, str], dict, list[GradingRequest]]:
+    """
+    Resolve what can be resolved without the model. Returns the results
+    so far, cache keys by question id, the cached grades found and
+    the requests left for the model.
+    """
+    results = {}
+    answers_to_grade = []
+
+    for question, text in answers:
+        pregraded = pregrade(question, text)
+
+        if pregraded is None:
+            answers_to_grade.append((question, text))
+        else:
+            results[question.id] = GradingResult(
+                question.id,
+                score=pregraded.score,
+                explanation=pregraded.explanation,
+                pregrading_rule=pregraded.rule,
+            )
+
+    keys = {
+        question.id: make_key(question, text) for question, text in answers_to_grade
+    }
+    cached = grading_cache.get_many(list(keys.values()))
+
+    results.update(
+        (
+            question.id,
+            GradingResult(
+                question.id,
+                score=cached[keys[question.id]].score,
+                explanation=cached[keys[question.id]].explanation,
+            ),
+        )
+        for question, _ in answers_to_grade
+        if keys[question.id] in cached
+    )
+    requests = [
+        GradingRequest(
+            question_id=question.id,
+            question=question.title,
+            expected_answer=question.expected_answer,
+            user_answer=text,
+            course_id=course_id,
+        )
+        for question, text in answers_to_grade
+        if question.id not in results
+    ]
+
+    return results, keys, cached, requests
+
+
+def _cache_results(
+    results: dict[int, GradingResult], keys: dict[int, str], cached: dict
+) -> None:
+    grading_cache.set_many(
+        {
+            keys[question_id]: CachedGrade(
+                question_id, result.score, result.explanation
+            )
+            for question_id, result in results.items()
+            if result.is_ok and question_id in keys and keys[question_id] not in cached
+        }
+    )
+
+
+def grade_answers(
+    answers: list[tuple[Question, str]], course_id: int | None = None
+) -> dict[int, GradingResult]:
+    """
+    Grade (question, answer text) pairs, returning results by question id.
+    Trivial answers are resolved by the pre-grading rules and answers
+    already graded before are taken from the grading cache, only the rest
+    are sent to the model.
+    """
+    results, keys, cached, requests = _prepare_grading(answers, course_id)
+
+    with timer("grader"), span("grading", {"grading.requests": len(requests)}):
+        results.update(grade_concurrently(requests))
+
+    _cache_results(results, keys, cached)
+
+    return results
+
+
+async def agrade_answers(
+    answers: list[tuple[Question, str]], course_id: int | None = None
+) -> dict[int, GradingResult]:
+    """Same as `grade_answers`, waiting for the model without a thread."""
+    results, keys, cached, requests = await sync_to_async(_prepare_grading)(
+        answers, course_id
+    )
+
+    with timer("grader"), span("grading", {"grading.requests": len(requests)}):
+        results.update(await agrade_concurrently(requests))
+
+    await sync_to_async(_cache_results)(results, keys, cached)
+
+    return results
+
+
+def grade_pending_answers(task_session: TaskSession) -> dict[int, str]:
+    """
+    Grade every answer of the session that has no score yet.
+    Returns grading errors by question id, graded answers are saved
+    even when some of the others have failed.
+    """
+    user_answers = list(
+        task_session.useranswer_set.filter(score__isnull=True).select_related(
+            "question__quiz"
+        )
+    )
+    results = grade_answers(
+        [(user_answer.question, user_answer.text) for user_answer in user_answers],
+        course_id=task_session.task.course_id,
+    )
+
+    errors = {}
+    graded_answers = []
+
+    for user_answer in user_answers:
+        result = results[user_answer.question_id]
+
+        if not result.is_ok:
+            errors[user_answer.question_id] = result.error
+            continue
+
+        user_answer.score = result.score
+        user_answer.comment = result.explanation
+        user_answer.pregrading_rule = result.pregrading_rule
+        graded_answers.append(user_answer)
+
+    with transaction.atomic():
+        for user_answer in graded_answers:
+            # Answers of open sessions can be changed while they're graded
+            UserAnswer.objects.filter(
+                id=user_answer.id, text=user_answer.text, score__isnull=True
+            ).update(
+                score=user_answer.score,
+                comment=user_answer.comment,
+                pregrading_rule=user_answer.pregrading_rule,
+            )
+
+    return errors
+
+
+def enqueue_grading(task_session: TaskSession) -> None:
+    """
+    Queue grading of the session's pending answers, reusing a job still
+    queued, e.g. by eager grading. The update locks the queued job until
+    the transaction commits, so a worker claiming it sees the session
+    as this transaction leaves it.
+    """
+    is_queued = GradingJob.objects.filter(
+        task_session=task_session, status=GradingJob.Status.QUEUED
+    ).update(status=GradingJob.Status.QUEUED)
+
+    if not is_queued:
+        GradingJob.objects.create(task_session=task_session)
+
+
+def claim_next_job(worker_id: str) -> GradingJob | None:
+    """
+    Atomically take the oldest queued job, or a running one whose worker
+    has not finished it within GRADING_JOB_TIMEOUT_SEC.
+    The claim is a conditional UPDATE, so when several workers race
+    for the same job only one of them gets it.
+    """
+    while True:
+        now = datetime.datetime.now()
+        stale_before = now - datetime.timedelta(
+            seconds=settings.GRADING_JOB_TIMEOUT_SEC
+        )
+        candidate = (
+            GradingJob.objects.filter(
+                Q(status=GradingJob.Status.QUEUED)
+                | Q(status=GradingJob.Status.RUNNING, claimed_at__lt=stale_before)
+            )
+            .order_by("created_at", "id")
+            .values("id", "status", "claimed_at")
+            .first()
+        )
+
+        if candidate is None:
+            return None
+
+        is_claimed = GradingJob.objects.filter(**candidate).update(
+            status=GradingJob.Status.RUNNING,
+            claimed_by=worker_id,
+            claimed_at=now,
+            attempts=F("attempts") + 1,
+        )
+
+        if is_claimed:
+            return GradingJob.objects.select_related("task_session__task").get(
+                id=candidate["id"]
+            )
+
+
+def run_job(job: GradingJob) -> bool:
+    """
+    Grade the pending answers of the job's session. Jobs of open sessions
+    grade the answers sent one by one, the session is left as it is
+    until finish. Returns False when the job took so long that another
+    worker reclaimed it, the result is then left to that worker.
+    """
+    task_session = job.task_session
+    is_open = task_session.finished_at is None
+
+    if not is_open:
+        TaskSession.objects.filter(id=task_session.id).update(
+            grading_status=TaskSession.GradingStatus.IN_PROGRESS
+        )
+
+    try:
+        errors = grade_pending_answers(task_session)
+    except Exception as error:
+        errors = {None: str(error) or repr(error)}
+
+    with transaction.atomic():
+        if not errors:
+            job.status = GradingJob.Status.DONE
+            job.last_error = ""
+            job.finished_at = datetime.datetime.now()
+            grading_status = TaskSession.GradingStatus.GRADED
+        elif job.attempts < settings.GRADING_JOB_MAX_ATTEMPTS:
+            job.status = GradingJob.Status.QUEUED
+            job.last_error = str(errors)
+            grading_status = TaskSession.GradingStatus.PENDING
+        else:
+            job.status = GradingJob.Status.FAILED
+            job.last_error = str(errors)
+            job.finished_at = datetime.datetime.now()
+            grading_status = TaskSession.GradingStatus.FAILED
+
+        # Conditional like the claim, only the worker holding the claim
+        # finishes the job
+        is_owned = GradingJob.objects.filter(
+            pk=job.pk, status=GradingJob.Status.RUNNING, claimed_at=job.claimed_at
+        ).update(
+            status=job.status, last_error=job.last_error, finished_at=job.finished_at
+        )
+
+        if not is_owned:
+            return False
+
+        if is_open:
+            return True
+
+        task_sessions = TaskSession.objects.filter(id=task_session.id)
+        task_sessions.update(grading_status=grading_status)
+        task_sessions.update_marks()
+
+    invalidate_gradebook(task_session.task.course_id)
+    return True
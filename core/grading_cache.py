@@ -0,0 +1,157 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import NamedTuple
+
+from django.conf import settings
+from django.db.models import F
+
+from core import metrics
+from core.models import GradingCacheEntry, Question
+from core.utils import normalize_answer
+from openai_client.backends import get_grader
+
+
+class CachedGrade(NamedTuple):
+    question_id: int
+    score: int
+    explanation: str
+
+
+def make_key(question: Question, answer: str) -> str:
+    grader = get_grader()
+    payload = json.dumps(
+        [
+            question.title,
+            question.expected_answer,
+            normalize_answer(answer),
+            grader.model,
+            grader.prompt_version,
+        ],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class GradingCache:
+    """
+    Two-tier cache of grades: a bounded in-process LRU in front of
+    the GradingCacheEntry table shared by all processes.
+    """
+
+    def __init__(self, max_size: int | None = None) -> None:
+        self.max_size = max_size
+        self._entries: OrderedDict[str, CachedGrade] = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+
+    def _put(self, key: str, grade: CachedGrade) -> None:
+        max_size = self.max_size or settings.GRADING_CACHE_LRU_SIZE
+        self._entries[key] = grade
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > max_size:
+            self._entries.popitem(last=False)
+
+    def get_many(self, keys: list[str]) -> dict[str, CachedGrade]:
+        found = {}
+
+        with self._lock:
+            for key in keys:
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    found[key] = self._entries[key]
+
+            self.memory_hits += len(found)
+
+        metrics.grading_cache_hits.inc(len(found), tier="memory")
+
+        missing = [key for key in keys if key not in found]
+
+        if missing:
+            db_found = {
+                entry.key: CachedGrade(
+                    entry.question_id, entry.score, entry.explanation
+                )
+                for entry in GradingCacheEntry.objects.filter(key__in=missing)
+            }
+
+            if db_found:
+                GradingCacheEntry.objects.filter(key__in=db_found).update(
+                    hits=F("hits") + 1
+                )
+
+            with self._lock:
+                for key, grade in db_found.items():
+                    self._put(key, grade)
+
+                self.db_hits += len(db_found)
+                self.misses += len(missing) - len(db_found)
+
+            metrics.grading_cache_hits.inc(len(db_found), tier="db")
+            metrics.grading_cache_misses.inc(len(missing) - len(db_found))
+
+            found.update(db_found)
+
+        return found
+
+    def set_many(self, grades: dict[str, CachedGrade]) -> None:
+        grader = get_grader()
+        GradingCacheEntry.objects.bulk_create(
+            [
+                GradingCacheEntry(
+                    key=key,
+                    question_id=grade.question_id,
+                    model=grader.model,
+                    prompt_version=grader.prompt_version,
+                    score=grade.score,
+                    explanation=grade.explanation,
+                )
+                for key, grade in grades.items()
+            ],
+            ignore_conflicts=True,
+        )
+
+        with self._lock:
+            for key, grade in grades.items():
+                self._put(key, grade)
+
+    def invalidate_question(self, question_id: int) -> None:
+        GradingCacheEntry.objects.filter(question_id=question_id).delete()
+
+        with self._lock:
+            for key in [
+                key
+                for key, grade in self._entries.items()
+                if grade.question_id == question_id
+            ]:
+                del self._entries[key]
+
+    def purge_stale(self) -> int:
+        """Delete entries made with another grader or prompt version."""
+        grader = get_grader()
+        deleted, _ = GradingCacheEntry.objects.exclude(
+            model=grader.model, prompt_version=grader.prompt_version
+        ).delete()
+        return deleted
+
+    def clear(self) -> None:
+        GradingCacheEntry.objects.all().delete()
+
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "memory_hits": self.memory_hits,
+                "db_hits": self.db_hits,
+                "misses": self.misses,
+            }
+
+
+grading_cache = GradingCache()
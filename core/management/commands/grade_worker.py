@@ -0,0 +1,84 @@
+import multiprocessing
+import os
+import socket
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from core.grading import claim_next_job, run_job
+
+
+class Command(BaseCommand):
+    help = (
+        "Grade submissions queued by finish in asynchronous grading mode "
+        "and answers queued as they're saved in eager grading mode"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help="Number of worker processes",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=1.0,
+            help="Seconds to wait before checking an empty queue again",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Exit as soon as the queue is empty",
+        )
+
+    def handle(self, *args, **options):
+        workers = max(options["workers"], 1)
+        worker_options = (options["poll_interval"], options["once"])
+
+        if workers == 1:
+            self.work(*worker_options)
+            return
+
+        # Connections must not be shared with the forked processes
+        connections.close_all()
+        processes = [
+            multiprocessing.Process(target=self.work, args=worker_options)
+            for _ in range(workers)
+        ]
+
+        for process in processes:
+            process.start()
+
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            for process in processes:
+                process.terminate()
+
+    def work(self, poll_interval: float, once: bool) -> None:
+        worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.stdout.write(f"Grading worker {worker_id} started")
+
+        try:
+            while True:
+                job = claim_next_job(worker_id)
+
+                if job is None:
+                    if once:
+                        break
+
+                    time.sleep(poll_interval)
+                    continue
+
+                status = job.status if run_job(job) else "reclaimed by another worker"
+                self.stdout.write(
+                    f"Job {job.id} for session {job.task_session_id}: {status}"
+                )
+        except KeyboardInterrupt:
+            pass
+        finally:
+            connections.close_all()
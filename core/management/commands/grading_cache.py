@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Sum
+
+from core.grading_cache import grading_cache
+from core.models import GradingCacheEntry
+
+
+class Command(BaseCommand):
+    help = "Show grading cache statistics or remove cached grades"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--purge-stale",
+            action="store_true",
+            help="Delete grades made with another model or prompt version",
+        )
+        parser.add_argument(
+            "--clear",
+            action="store_true",
+            help="Delete all cached grades",
+        )
+
+    def handle(self, *args, **options):
+        if options["clear"]:
+            grading_cache.clear()
+            self.stdout.write("Grading cache cleared")
+        elif options["purge_stale"]:
+            deleted = grading_cache.purge_stale()
+            self.stdout.write(f"Deleted {deleted} stale cached grades")
+
+        stats = GradingCacheEntry.objects.aggregate(
+            entries=Count("id"), hits=Sum("hits")
+        )
+        self.stdout.write(f"Entries: {stats['entries']}, hits: {stats['hits'] or 0}")
@@ -0,0 +1,48 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework.request import Request
+
+from core.models import CourseMembership
+
+# Cached in place of None, which the cache can't tell apart from a miss
+NO_MEMBERSHIP = ""
+
+
+def _cache_key(user_id: int, course_id: int) -> str:
+    return f"course-permission:{user_id}:{course_id}"
+
+
+def invalidate_course_permission(user_id: int, course_id: int) -> None:
+    key = _cache_key(user_id, course_id)
+    transaction.on_commit(lambda: cache.delete(key))
+
+
+def get_course_permission(request: Request, course_id: int | str) -> str | None:
+    """
+    Permission of the request user in the course, None if they're not
+    a member. Memoized on the request and cached across requests
+    until the membership changes.
+    """
+    try:
+        course_id = int(course_id)
+    except (TypeError, ValueError):
+        return None
+
+    permissions = request.__dict__.setdefault("_course_permissions", {})
+
+    if course_id not in permissions:
+        key = _cache_key(request.user.id, course_id)
+        permission = cache.get(key)
+
+        if permission is None:
+            permission = (
+                CourseMembership.objects.filter(user=request.user, course_id=course_id)
+                .values_list("permission", flat=True)
+                .first()
+            ) or NO_MEMBERSHIP
+            cache.set(key, permission, timeout=settings.MEMBERSHIP_CACHE_TIMEOUT_SEC)
+
+        permissions[course_id] = permission or None
+
+    return permissions[course_id]
@@ -0,0 +1,396 @@
+"""
+In-process metrics in the Prometheus text format, see `render`.
+
+Every process recording metrics keeps its own values and writes them to
+a file of its own in METRICS_DIR, at most every METRICS_FLUSH_INTERVAL_SEC.
+Files are named after the process id and start time, so a process
+reusing the id of a dead one doesn't overwrite its values. The /metrics
+endpoint adds up the files of all processes, so it's correct whichever
+worker serves it. Counters and histograms of processes which are gone
+are merged into one aggregate file, their gauges are dropped.
+"""
+import atexit
+import contextlib
+import fcntl
+import json
+import math
+import os
+import re
+import threading
+import time
+from typing import Iterator
+
+from django.conf import settings
+
+Labels = tuple[str, ...]
+
+PROCESS_FILE_RE = re.compile(r"^(\d+)-(\d+)\.json$")
+AGGREGATE_FILE = "aggregate.json"
+
+
+class Registry:
+    def __init__(self) -> None:
+        self.metrics: dict[str, "Metric"] = {}
+        self._is_exit_flush_registered = False
+        self._reset()
+
+    def register(self, metric: "Metric") -> None:
+        self.metrics[metric.name] = metric
+
+    def _reset(self) -> None:
+        """A forked process starts from zero, its parent counts the rest."""
+        self.lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._flushed_at = 0.0
+        self._timer = None
+        self.file_name = f"{os.getpid()}-{time.time_ns()}.json"
+
+        for metric in self.metrics.values():
+            metric.values.clear()
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {
+                name: [[list(labels), value] for labels, value in metric.dump()]
+                for name, metric in self.metrics.items()
+            }
+
+    def changed(self) -> None:
+        if not settings.METRICS_DIR:
+            return
+
+        # Only processes recording metrics, e.g. servers and grade
+        # workers, leave a file behind, management commands don't
+        if not self._is_exit_flush_registered:
+            self._is_exit_flush_registered = True
+            atexit.register(self.flush)
+
+        wait = settings.METRICS_FLUSH_INTERVAL_SEC - (
+            time.monotonic() - self._flushed_at
+        )
+
+        if wait <= 0:
+            self.flush()
+        elif self._timer is None:
+            # Flushes the last changes, even if nothing changes after them
+            self._timer = threading.Timer(wait, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def flush(self) -> None:
+        if not settings.METRICS_DIR:
+            return
+
+        with self._flush_lock:
+            self._timer = None
+            self._flushed_at = time.monotonic()
+            os.makedirs(settings.METRICS_DIR, exist_ok=True)
+            _write_json(
+                os.path.join(settings.METRICS_DIR, self.file_name), self.snapshot()
+            )
+
+    def _merge(self, collected: dict, snapshot: dict, with_gauges: bool) -> None:
+        for name, samples in snapshot.items():
+            metric = self.metrics.get(name)
+
+            if metric is None or (isinstance(metric, Gauge) and not with_gauges):
+                continue
+
+            values = collected[name]
+
+            for labels, value in samples:
+                labels = tuple(labels)
+                values[labels] = metric.merge(values.get(labels), value)
+
+    def _collect_files(self, collected: dict) -> None:
+        """
+        Add up the files of METRICS_DIR, first merging the files of dead
+        processes into the aggregate file. Collectors take turns, so
+        no file is merged twice.
+        """
+        directory = settings.METRICS_DIR
+        processes = {}
+
+        for file_name in os.listdir(directory):
+            if match := PROCESS_FILE_RE.match(file_name):
+                pid, started_at = map(int, match.groups())
+                processes.setdefault(pid, []).append((started_at, file_name))
+
+        live, dead = [], []
+
+        for pid, files in processes.items():
+            files.sort()
+
+            # Older files of a reused process id belong to dead processes
+            if _is_running(pid):
+                live.append(files.pop()[1])
+
+            dead.extend(file_name for _, file_name in files)
+
+        with open(os.path.join(directory, ".lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            aggregate_path = os.path.join(directory, AGGREGATE_FILE)
+            aggregate = {name: {} for name in self.metrics}
+            self._merge(aggregate, _read_json(aggregate_path) or {}, False)
+            dead_paths = [os.path.join(directory, file_name) for file_name in dead]
+            dead_snapshots = [_read_json(path) for path in dead_paths]
+
+            if any(dead_snapshots):
+                for snapshot in filter(None, dead_snapshots):
+                    self._merge(aggregate, snapshot, False)
+
+                _write_json(
+                    aggregate_path,
+                    {
+                        name: [
+                            [list(labels), value] for labels, value in values.items()
+                        ]
+                        for name, values in aggregate.items()
+                    },
+                )
+
+            for path in dead_paths:
+                for leftover in (path, f"{path}.tmp"):
+                    with contextlib.suppress(FileNotFoundError):
+                        os.remove(leftover)
+
+        for name, values in aggregate.items():
+            collected[name].update(values)
+
+        for file_name in live:
+            snapshot = _read_json(os.path.join(directory, file_name))
+            self._merge(collected, snapshot or {}, True)
+
+    def collect(self) -> dict[str, dict[Labels, object]]:
+        """Values of all processes, summed up."""
+        collected = {name: {} for name in self.metrics}
+
+        if not settings.METRICS_DIR:
+            self._merge(collected, self.snapshot(), True)
+        else:
+            self.flush()
+            self._collect_files(collected)
+
+        return collected
+
+
+def _read_json(path: str) -> dict | None:
+    try:
+        with open(path) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_json(path: str, data: dict) -> None:
+    # Readers never see a half written file
+    with open(f"{path}.tmp", "w") as file:
+        json.dump(data, file)
+
+    os.replace(f"{path}.tmp", path)
+
+
+def _is_running(pid: int) -> bool:
+    if pid == os.getpid():
+        return True
+
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+
+    return True
+
+
+registry = Registry()
+os.register_at_fork(after_in_child=registry._reset)
+
+
+class Metric:
+    type = ""
+
+    def __init__(
+        self, name: str, documentation: str, labelnames: tuple[str, ...] = ()
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.values: dict[Labels, object] = {}
+        registry.register(self)
+
+    def _labels(self, labels: dict) -> Labels:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _add(self, amount: float, labels: dict) -> None:
+        key = self._labels(labels)
+
+        with registry.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+        registry.changed()
+
+    def dump(self) -> Iterator[tuple[Labels, object]]:
+        return iter(self.values.items())
+
+    @staticmethod
+    def merge(value, other):
+        return (value or 0) + other
+
+    def samples(self, labels: Labels, value) -> Iterator[tuple[str, dict, float]]:
+        yield self.name, dict(zip(self.labelnames, labels)), value
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        self._add(amount, labels)
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        self._add(amount, labels)
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self._add(-amount, labels)
+
+    @contextlib.contextmanager
+    def track_inprogress(self, **labels) -> Iterator[None]:
+        self.inc(**labels)
+
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = (*buckets, math.inf)
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._labels(labels)
+
+        with registry.lock:
+            # Counts per bucket, the sum and the count of observations
+            counts = self.values.setdefault(key, [0] * (len(self.buckets) + 2))
+
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+
+            counts[-2] += value
+            counts[-1] += 1
+
+        registry.changed()
+
+    @contextlib.contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        started_at = time.perf_counter()
+
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started_at, **labels)
+
+    def dump(self) -> Iterator[tuple[Labels, object]]:
+        return ((labels, list(counts)) for labels, counts in self.values.items())
+
+    @staticmethod
+    def merge(value, other):
+        if value is None:
+            return list(other)
+
+        return [a + b for a, b in zip(value, other)]
+
+    def samples(self, labels: Labels, value) -> Iterator[tuple[str, dict, float]]:
+        labels = dict(zip(self.labelnames, labels))
+        cumulative = 0
+
+        for bound, count in zip(self.buckets, value):
+            cumulative += count
+            le = "+Inf" if bound == math.inf else repr(float(bound))
+            yield f"{self.name}_bucket", {**labels, "le": le}, cumulative
+
+        yield f"{self.name}_sum", labels, value[-2]
+        yield f"{self.name}_count", labels, value[-1]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"")
+
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+
+    for name, values in registry.collect().items():
+        metric = registry.metrics[name]
+        lines.append(f"# HELP {name} {metric.documentation}")
+        lines.append(f"# TYPE {name} {metric.type}")
+
+        for labels, value in sorted(values.items()):
+            for sample_name, sample_labels, sample_value in metric.samples(
+                labels, value
+            ):
+                label_text = ",".join(
+                    f'{label}="{_escape(label_value)}"'
+                    for label, label_value in sample_labels.items()
+                )
+                label_text = f"{{{label_text}}}" if label_text else ""
+                lines.append(f"{sample_name}{label_text} {float(sample_value)!r}")
+
+    return "\n".join(lines) + "\n"
+
+
+grading_calls = Counter(
+    "grading_calls_total",
+    "Calls of the grader backend, by outcome",
+    ("model", "kind", "outcome"),
+)
+grading_errors = Counter(
+    "grading_errors_total", "Failed calls of the grader backend", ("model", "error")
+)
+grading_retries = Counter(
+    "grading_retries_total", "Provider calls retried after an error", ("model", "error")
+)
+grading_latency = Histogram(
+    "grading_latency_seconds",
+    "Duration of grader backend calls, including rate limiting and retries",
+    ("model", "kind"),
+)
+grading_in_flight = Gauge(
+    "grading_in_flight", "Grader backend calls in progress", ("model",)
+)
+grading_cache_hits = Counter(
+    "grading_cache_hits_total", "Grades found in the grading cache", ("tier",)
+)
+grading_cache_misses = Counter(
+    "grading_cache_misses_total", "Grades missing from the grading cache"
+)
+prompt_tokens = Counter(
+    "grading_prompt_tokens_total", "Prompt tokens used", ("course", "model")
+)
+completion_tokens = Counter(
+    "grading_completion_tokens_total", "Completion tokens used", ("course", "model")
+)
+finish_latency = Histogram(
+    "finish_latency_seconds",
+    "Duration of task finish requests",
+    ("status",),
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120),
+)
@@ -0,0 +1,96 @@
+# Generated by Django 4.1.5 on 2026-10-18 18:30
+
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def mark_finished_sessions_graded(apps, schema_editor):
+    TaskSession = apps.get_model("core", "TaskSession")
+    TaskSession.objects.filter(finished_at__isnull=False).update(
+        grading_status="graded"
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0002_remove_useranswer_correctness_useranswer_score"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="tasksession",
+            name="grading_status",
+            field=models.CharField(
+                blank=True,
+                choices=[
+                    ("pending", "Pending"),
+                    ("in_progress", "In Progress"),
+                    ("graded", "Graded"),
+                    ("failed", "Failed"),
+                ],
+                max_length=50,
+                null=True,
+            ),
+        ),
+        migrations.RunPython(mark_finished_sessions_graded, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="useranswer",
+            name="score",
+            field=models.IntegerField(
+                blank=True,
+                null=True,
+                validators=[
+                    django.core.validators.MinValueValidator(0),
+                    django.core.validators.MaxValueValidator(100),
+                ],
+            ),
+        ),
+        migrations.CreateModel(
+            name="GradingJob",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("queued", "Queued"),
+                            ("running", "Running"),
+                            ("done", "Done"),
+                            ("failed", "Failed"),
+                        ],
+                        default="queued",
+                        max_length=50,
+                    ),
+                ),
+                ("attempts", models.PositiveIntegerField(default=0)),
+                ("claimed_by", models.CharField(blank=True, max_length=255)),
+                ("claimed_at", models.DateTimeField(blank=True, null=True)),
+                ("last_error", models.TextField(blank=True)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("finished_at", models.DateTimeField(blank=True, null=True)),
+                (
+                    "task_session",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="grading_jobs",
+                        to="core.tasksession",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="gradingjob",
+            index=models.Index(
+                fields=["status", "created_at"], name="core_gradin_status_cc36fa_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 4.1.5 on 2026-10-18 18:31
+
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0003_grading_jobs"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="GradingCacheEntry",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("key", models.CharField(max_length=64, unique=True)),
+                ("model", models.CharField(max_length=255)),
+                ("prompt_version", models.CharField(max_length=50)),
+                (
+                    "score",
+                    models.IntegerField(
+                        validators=[
+                            django.core.validators.MinValueValidator(0),
+                            django.core.validators.MaxValueValidator(100),
+                        ]
+                    ),
+                ),
+                ("explanation", models.TextField()),
+                ("hits", models.PositiveIntegerField(default=0)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "question",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="grading_cache_entries",
+                        to="core.question",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name_plural": "grading cache entries",
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.1.5 on 2026-10-18 18:35
+
+import core.pregrading
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0004_grading_cache_entry"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="question",
+            name="pregrading_rules",
+            field=models.JSONField(
+                blank=True,
+                default=dict,
+                validators=[core.pregrading.validate_pregrading_rules],
+            ),
+        ),
+        migrations.AddField(
+            model_name="quiz",
+            name="pregrading_rules",
+            field=models.JSONField(
+                blank=True,
+                default=dict,
+                validators=[core.pregrading.validate_pregrading_rules],
+            ),
+        ),
+        migrations.AddField(
+            model_name="useranswer",
+            name="pregrading_rule",
+            field=models.CharField(blank=True, max_length=50),
+        ),
+    ]
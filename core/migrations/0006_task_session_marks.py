@@ -0,0 +1,56 @@
+# Generated by Django 4.1.5 on 2026-10-18 18:39
+
+from django.db import migrations, models
+from django.db.models import F, Sum
+
+
+def calculate_marks(apps, schema_editor):
+    TaskSession = apps.get_model("core", "TaskSession")
+    UserAnswer = apps.get_model("core", "UserAnswer")
+    Question = apps.get_model("core", "Question")
+
+    for task_session in TaskSession.objects.filter(
+        finished_at__isnull=False
+    ).select_related("task"):
+        total = UserAnswer.objects.filter(
+            task_session=task_session, score__isnull=False
+        ).aggregate(total=Sum(F("score") * F("question__value")))["total"]
+        maximum = Question.objects.filter(quiz_id=task_session.task.quiz_id).aggregate(
+            total=Sum("value")
+        )["total"]
+
+        task_session.total_mark = (total or 0) / 100
+        task_session.max_mark = maximum or 0
+        task_session.save(update_fields=["total_mark", "max_mark"])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0005_pregrading_rules"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="tasksession",
+            name="max_mark",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="tasksession",
+            name="total_mark",
+            field=models.FloatField(default=0),
+        ),
+        migrations.RunPython(calculate_marks, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="tasksession",
+            index=models.Index(
+                fields=["task", "total_mark"], name="core_taskse_task_id_407fb2_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="tasksession",
+            index=models.Index(
+                fields=["task", "max_mark"], name="core_taskse_task_id_d5cb16_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.1.5 on 2026-10-18 18:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0006_task_session_marks"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="course",
+            index=models.Index(
+                fields=["created_at", "id"], name="core_course_created_45bd79_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="task",
+            index=models.Index(
+                fields=["course", "created_at", "id"],
+                name="core_task_course__e36766_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="tasksession",
+            index=models.Index(
+                fields=["task", "id"], name="core_taskse_task_id_dd2491_idx"
+            ),
+        ),
+    ]
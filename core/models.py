@@ -1,9 +1,13 @@
 import secrets
+from typing import Iterable
 
 from django.conf import settings
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.db import models
-from django.db.models import CheckConstraint, Q
+from django.db.models import CheckConstraint, Q, F, Sum, OuterRef, Subquery, Value
+from django.db.models.functions import Cast, Coalesce
+
+from core.pregrading import validate_pregrading_rules
 
 
 def generate_invitation_token() -> str:
@@ -26,6 +30,9 @@ class Quiz(models.Model):
     name = models.CharField(max_length=255)
     max_duration = models.IntegerField()
     subject = models.ForeignKey(Subject, on_delete=models.CASCADE)
+    pregrading_rules = models.JSONField(
+        default=dict, blank=True, validators=[validate_pregrading_rules]
+    )
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self) -> str:
@@ -40,6 +47,9 @@ class Question(models.Model):
     expected_answer = models.TextField()
     value = models.PositiveIntegerField()
     quiz = models.ForeignKey(Quiz, on_delete=models.CASCADE, related_name="questions")
+    pregrading_rules = models.JSONField(
+        default=dict, blank=True, validators=[validate_pregrading_rules]
+    )
 
     def __str__(self) -> str:
         return self.title
@@ -56,6 +66,9 @@ class Course(models.Model):
     )
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [models.Index(fields=["created_at", "id"])]
+
     def __str__(self) -> str:
         return self.name
 
@@ -84,34 +97,82 @@ class Task(models.Model):
     quiz = models.ForeignKey(Quiz, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [models.Index(fields=["course", "created_at", "id"])]
+
     def __str__(self) -> str:
         return self.title
 
 
+class TaskSessionQuerySet(models.QuerySet):
+    def update_marks(self) -> int:
+        """Recalculate stored marks of the sessions from their answers."""
+        total_marks = (
+            UserAnswer.objects.filter(task_session=OuterRef("pk"), score__isnull=False)
+            .order_by()
+            .values("task_session")
+            .annotate(total=Sum(F("score") * F("question__value")))
+            .values("total")
+        )
+        max_marks = (
+            Question.objects.filter(quiz__task=OuterRef("task_id"))
+            .order_by()
+            .values("quiz")
+            .annotate(total=Sum("value"))
+            .values("total")
+        )
+
+        return self.filter(finished_at__isnull=False).update(
+            total_mark=Cast(Coalesce(Subquery(total_marks), 0), models.FloatField())
+            / Value(100.0),
+            max_mark=Coalesce(Subquery(max_marks), 0),
+        )
+
+
 class TaskSession(models.Model):
+    class GradingStatus(models.TextChoices):
+        PENDING = "pending"
+        IN_PROGRESS = "in_progress"
+        GRADED = "graded"
+        FAILED = "failed"
+
     started_at = models.DateTimeField(auto_now_add=True)
     finished_at = models.DateTimeField(null=True, blank=True)
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     task = models.ForeignKey(Task, on_delete=models.CASCADE)
+    grading_status = models.CharField(
+        max_length=50, choices=GradingStatus.choices, null=True, blank=True
+    )
+    # Stored at finish and kept in sync by signals, see update_marks
+    total_mark = models.FloatField(default=0)
+    max_mark = models.PositiveIntegerField(default=0)
+
+    objects = TaskSessionQuerySet.as_manager()
 
     def __str__(self) -> str:
         return self.task.title + " " + self.user.email
 
-    @property
-    def total_mark(self) -> float:
-        if self.finished_at is None:
-            return 0
-
-        return (
+    def set_marks(
+        self, user_answers: Iterable["UserAnswer"], questions: Iterable[Question]
+    ) -> None:
+        """Calculate marks from answers and questions already in memory."""
+        self.total_mark = (
             sum(
                 user_answer.score * user_answer.question.value
-                for user_answer in self.useranswer_set.all()
+                for user_answer in user_answers
+                if user_answer.score is not None
             )
             / 100
         )
+        self.max_mark = sum(question.value for question in questions)
 
     class Meta:
         unique_together = ("user", "task")
+        indexes = [
+            models.Index(fields=["task", "id"]),
+            models.Index(fields=["task", "total_mark"]),
+            models.Index(fields=["task", "max_mark"]),
+        ]
         constraints = [
             CheckConstraint(
                 check=Q(
@@ -129,10 +190,13 @@ class UserAnswer(models.Model):
 
     text = models.TextField()
     score = models.IntegerField(
-        validators=[MinValueValidator(0), MaxValueValidator(100)]
+        validators=[MinValueValidator(0), MaxValueValidator(100)],
+        null=True,
+        blank=True,
     )
     comment = models.TextField()
     is_adjusted = models.BooleanField(default=False)
+    pregrading_rule = models.CharField(max_length=50, blank=True)
     question = models.ForeignKey(Question, on_delete=models.CASCADE)
     task_session = models.ForeignKey(TaskSession, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -145,7 +209,10 @@ class UserAnswer(models.Model):
         )
 
     @property
-    def mark(self) -> str:
+    def mark(self) -> str | None:
+        if self.score is None:
+            return None
+
         return (
             "{:.2f}".format(self.question.value * (self.score / 100))
             .rstrip("0")
@@ -154,3 +221,51 @@ class UserAnswer(models.Model):
 
     class Meta:
         unique_together = ("question", "task_session")
+
+
+class GradingJob(models.Model):
+    class Status(models.TextChoices):
+        QUEUED = "queued"
+        RUNNING = "running"
+        DONE = "done"
+        FAILED = "failed"
+
+    task_session = models.ForeignKey(
+        TaskSession, on_delete=models.CASCADE, related_name="grading_jobs"
+    )
+    status = models.CharField(
+        max_length=50, choices=Status.choices, default=Status.QUEUED
+    )
+    attempts = models.PositiveIntegerField(default=0)
+    claimed_by = models.CharField(max_length=255, blank=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self) -> str:
+        return f"{self.task_session} ({self.status})"
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "created_at"])]
+
+
+class GradingCacheEntry(models.Model):
+    key = models.CharField(max_length=64, unique=True)
+    question = models.ForeignKey(
+        Question, on_delete=models.CASCADE, related_name="grading_cache_entries"
+    )
+    model = models.CharField(max_length=255)
+    prompt_version = models.CharField(max_length=50)
+    score = models.IntegerField(
+        validators=[MinValueValidator(0), MaxValueValidator(100)]
+    )
+    explanation = models.TextField()
+    hits = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self) -> str:
+        return f"{self.question} ({self.score}%)"
+
+    class Meta:
+        verbose_name_plural = "grading cache entries"
@@ -0,0 +1,86 @@
+from typing import NamedTuple
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+
+from core.utils import normalize_answer
+
+RULE_TYPES = {
+    "empty": bool,
+    "min_length": int,
+    "min_length_ratio": float,
+    "exact_match": bool,
+}
+
+
+class Pregrade(NamedTuple):
+    rule: str
+    score: int
+    explanation: str
+
+
+def validate_pregrading_rules(rules: dict) -> None:
+    if not isinstance(rules, dict):
+        raise ValidationError("Pre-grading rules must be an object.")
+
+    for name, value in rules.items():
+        if name not in RULE_TYPES:
+            raise ValidationError(f"Unknown pre-grading rule: {name}.")
+
+        rule_type = RULE_TYPES[name]
+
+        if isinstance(value, bool) and rule_type is not bool:
+            raise ValidationError(f"Pre-grading rule {name} must be a number.")
+
+        if not isinstance(value, (int, float) if rule_type is float else rule_type):
+            raise ValidationError(
+                f"Pre-grading rule {name} must be of type {rule_type.__name__}."
+            )
+
+
+def get_rules(question) -> dict:
+    """Deployment defaults, overridden by the quiz, overridden by the question."""
+    return {
+        **settings.GRADING_PREGRADING_RULES,
+        **(question.quiz.pregrading_rules or {}),
+        **(question.pregrading_rules or {}),
+    }
+
+
+def pregrade(question, text: str) -> Pregrade | None:
+    """
+    Grade answers which do not need the model, e.g. empty ones, locally.
+    Returns None when the answer has to be graded by the model.
+    """
+    rules = get_rules(question)
+    answer = normalize_answer(text)
+
+    if rules.get("empty") and not answer:
+        return Pregrade("empty", 0, "Відповідь порожня, тому оцінка 0%.")
+
+    min_length = max(
+        rules.get("min_length") or 0,
+        int(
+            (rules.get("min_length_ratio") or 0)
+            * len(normalize_answer(question.expected_answer))
+        ),
+    )
+
+    if len(answer) < min_length:
+        return Pregrade(
+            "min_length",
+            0,
+            f"Відповідь занадто коротка ({len(answer)} символів "
+            f"при мінімумі {min_length}), тому оцінка 0%.",
+        )
+
+    if rules.get("exact_match") and answer == normalize_answer(
+        question.expected_answer
+    ):
+        return Pregrade(
+            "exact_match",
+            100,
+            "Відповідь повністю збігається з очікуваною відповіддю.",
+        )
+
+    return None
@@ -0,0 +1,115 @@
+import contextlib
+import contextvars
+import threading
+import time
+from typing import Iterator
+
+from rest_framework import serializers
+
+from core.tracing import span
+
+
+class RequestProfile:
+    """Time spent by one request in the database, the grader and so on."""
+
+    def __init__(self) -> None:
+        self.started_at = time.perf_counter()
+        self.query_count = 0
+        # Seconds by timer name, e.g. "db", "grader" and "serialize"
+        # Queries of serializers fetching related objects count in both
+        self.durations: dict[str, float] = {}
+        # Sync views of async requests query from worker threads
+        self._lock = threading.Lock()
+
+    def add(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self.durations[name] = self.durations.get(name, 0.0) + seconds
+
+    def add_query(self, seconds: float) -> None:
+        with self._lock:
+            self.query_count += 1
+            self.durations["db"] = self.durations.get("db", 0.0) + seconds
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started_at
+
+
+# Profile of the request being served, None outside of requests
+_profile = contextvars.ContextVar("request_profile", default=None)
+
+
+def get_profile() -> RequestProfile | None:
+    return _profile.get()
+
+
+@contextlib.contextmanager
+def profile_request() -> Iterator[RequestProfile]:
+    profile = RequestProfile()
+    token = _profile.set(profile)
+
+    try:
+        yield profile
+    finally:
+        _profile.reset(token)
+
+
+@contextlib.contextmanager
+def timer(name: str) -> Iterator[None]:
+    """Add the time spent in the block to the request profile."""
+    profile = _profile.get()
+
+    if profile is None:
+        yield
+        return
+
+    started_at = time.perf_counter()
+
+    try:
+        yield
+    finally:
+        profile.add(name, time.perf_counter() - started_at)
+
+
+# Serializer mixin adding the time `.data` takes, turning the instances
+# into primitives, to "serialize". Lists of these serializers are timed the
+# same way, nested serializers count in the serializer using them. Not a
+# docstring, the API schema would describe every serializer with it.
+class SerializeTimerMixin:
+    def __init_subclass__(cls, **kwargs) -> None:
+        super().__init_subclass__(**kwargs)
+
+        if issubclass(cls, serializers.ListSerializer):
+            return
+
+        meta = getattr(cls, "Meta", None)
+
+        if meta is None:
+            cls.Meta = meta = type("Meta", (), {})
+
+        if not hasattr(meta, "list_serializer_class"):
+            meta.list_serializer_class = TimedListSerializer
+
+    @property
+    def data(self):
+        with timer("serialize"), span("serialize"):
+            return super().data
+
+
+class TimedListSerializer(SerializeTimerMixin, serializers.ListSerializer):
+    pass
+
+
+def record_query(execute, sql, params, many, context):
+    """Database execute wrapper counting the queries of the request."""
+    profile = _profile.get()
+
+    if profile is None:
+        return execute(sql, params, many, context)
+
+    started_at = time.perf_counter()
+
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        profile.add_query(time.perf_counter() - started_at)
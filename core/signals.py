@@ -0,0 +1,131 @@
+from django.conf import settings
+from django.db import models
+from django.db.backends.signals import connection_created
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from core.gradebook import invalidate_gradebook
+from core.grading_cache import grading_cache
+from core.memberships import invalidate_course_permission
+from core.profiling import record_query
+from core.task_cache import invalidate_task_cache
+from core.tracing import trace_query
+from core.models import (
+    CourseMembership,
+    Question,
+    Quiz,
+    Task,
+    TaskSession,
+    UserAnswer,
+)
+
+
+def _is_cascade(origin, sender: type[models.Model]) -> bool:
+    """Whether the instance is deleted along with an instance of another model."""
+    return isinstance(origin, models.Model) and not isinstance(origin, sender)
+
+
+@receiver(pre_save, sender=Question)
+def invalidate_question_grades(sender, instance: Question, **kwargs) -> None:
+    if instance.pk is None:
+        return
+
+    previous = (
+        Question.objects.filter(pk=instance.pk)
+        .values("title", "expected_answer")
+        .first()
+    )
+
+    if previous and (
+        previous["title"] != instance.title
+        or previous["expected_answer"] != instance.expected_answer
+    ):
+        grading_cache.invalidate_question(instance.pk)
+
+
+@receiver(post_save, sender=UserAnswer)
+@receiver(post_delete, sender=UserAnswer)
+def update_task_session_marks(sender, instance: UserAnswer, **kwargs) -> None:
+    # The session is deleted as well, or its marks are updated once
+    # for the whole quiz when a question is deleted
+    if _is_cascade(kwargs.get("origin"), UserAnswer):
+        return
+
+    task_sessions = TaskSession.objects.filter(id=instance.task_session_id)
+    task_sessions.update_marks()
+    invalidate_gradebook(*task_sessions.values_list("task__course_id", flat=True))
+
+
+@receiver(post_save, sender=Question)
+@receiver(post_delete, sender=Question)
+def update_quiz_marks(sender, instance: Question, **kwargs) -> None:
+    TaskSession.objects.filter(task__quiz_id=instance.quiz_id).update_marks()
+    invalidate_gradebook(
+        *Task.objects.filter(quiz_id=instance.quiz_id).values_list(
+            "course_id", flat=True
+        )
+    )
+
+
+@receiver(post_save, sender=Task)
+@receiver(post_delete, sender=Task)
+@receiver(post_save, sender=CourseMembership)
+@receiver(post_delete, sender=CourseMembership)
+def invalidate_course_gradebook(
+    sender, instance: Task | CourseMembership, **kwargs
+) -> None:
+    invalidate_gradebook(instance.course_id)
+
+
+@receiver(post_delete, sender=TaskSession)
+def invalidate_task_session_gradebook(sender, instance: TaskSession, **kwargs) -> None:
+    # Deleted task or membership invalidate the gradebook themselves
+    if _is_cascade(kwargs.get("origin"), TaskSession):
+        return
+
+    invalidate_gradebook(
+        *Task.objects.filter(id=instance.task_id).values_list("course_id", flat=True)
+    )
+
+
+@receiver(post_save, sender=CourseMembership)
+@receiver(post_delete, sender=CourseMembership)
+def invalidate_cached_course_permission(
+    sender, instance: CourseMembership, **kwargs
+) -> None:
+    invalidate_course_permission(instance.user_id, instance.course_id)
+
+
+@receiver(post_save, sender=Task)
+@receiver(post_delete, sender=Task)
+def invalidate_task_payloads(sender, instance: Task, **kwargs) -> None:
+    invalidate_task_cache(instance.id)
+
+
+@receiver(post_save, sender=Quiz)
+@receiver(post_delete, sender=Quiz)
+@receiver(post_save, sender=Question)
+@receiver(post_delete, sender=Question)
+def invalidate_quiz_task_payloads(sender, instance: Quiz | Question, **kwargs) -> None:
+    quiz_id = instance.id if isinstance(instance, Quiz) else instance.quiz_id
+    invalidate_task_cache(
+        *Task.objects.filter(quiz_id=quiz_id).values_list("id", flat=True)
+    )
+
+
+@receiver(connection_created)
+def set_sqlite_pragmas(sender, connection, **kwargs) -> None:
+    if connection.vendor != "sqlite":
+        return
+
+    with connection.cursor() as cursor:
+        for name, value in settings.SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+
+
+@receiver(connection_created)
+def install_query_wrappers(sender, connection, **kwargs) -> None:
+    # Only count and trace while a request is, see api.middleware
+    for wrapper in (record_query, trace_query):
+        if wrapper not in connection.execute_wrappers:
+            connection.execute_wrappers.append(wrapper)
@@ -0,0 +1,55 @@
+import time
+from typing import Callable
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from core.db import reads_from_replica
+
+
+def _version_key(task_id: int | str) -> str:
+    return f"task-version:{task_id}"
+
+
+def invalidate_task_cache(*task_ids: int) -> None:
+    keys = [_version_key(task_id) for task_id in task_ids]
+
+    # Otherwise a payload built before the commit could be cached again
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def get_cached_task_version(task_id: int | str) -> int | None:
+    """Version of the task if the cache knows it, see `get_task_version`."""
+    return cache.get(_version_key(task_id))
+
+
+def get_task_version(task_id: int | str) -> int:
+    """
+    Time in nanoseconds of the last change of the task, its quiz or its
+    questions, as seen by the cache. A new version is started whenever
+    the cache doesn't know the task, so only call it for existing tasks.
+    """
+    key = _version_key(task_id)
+    cache.add(key, time.time_ns(), timeout=settings.TASK_CACHE_TIMEOUT_SEC)
+    return cache.get(key) or time.time_ns()
+
+
+def get_task_payload(
+    name: str, task_id: int | str, version: int, build: Callable[[], dict]
+) -> dict:
+    """Rendered task fragment, cached until the task version changes."""
+    key = f"task-payload:{name}:{task_id}:{version}"
+    payload = cache.get(key)
+
+    if payload is None:
+        payload = build()
+        timeout = settings.TASK_CACHE_TIMEOUT_SEC
+
+        # Replica could still miss the change the version was bumped for
+        if reads_from_replica():
+            timeout = min(timeout, settings.DATABASE_REPLICA_PIN_SEC)
+
+        cache.set(key, payload, timeout=timeout)
+
+    return payload
@@ -0,0 +1,245 @@
+"""
+Tracing in the spirit of OpenTelemetry, without its SDK.
+
+api.middleware.TracingMiddleware opens a span for every sampled request,
+continuing the trace of its W3C ``traceparent`` header. Database
+queries, grader calls and rendering open spans nested in it, see
+`span`. The spans of a request are handed to the TRACING_EXPORTER
+together when the request span ends.
+"""
+import contextlib
+import contextvars
+import json
+import logging
+import random
+import re
+import secrets
+import threading
+import time
+from functools import lru_cache
+from typing import Iterator
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+TRACEPARENT_RE = re.compile(
+    r"^([0-9a-f]{2})-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})(-.*)?$"
+)
+
+
+class _Trace:
+    """Spans of one trace finished in this process, exported at once."""
+
+    def __init__(self) -> None:
+        self.spans: list["Span"] = []
+        self.is_open = True
+        self.lock = threading.Lock()
+
+
+class Span:
+    def __init__(
+        self,
+        name: str,
+        trace_id: str,
+        parent_id: str | None,
+        attributes: dict | None,
+        trace: _Trace,
+    ) -> None:
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.attributes = dict(attributes or {})
+        self.status = "ok"
+        self.start_time = time.time_ns()
+        self.end_time: int | None = None
+        self._trace = trace
+
+    def set_attribute(self, key: str, value) -> None:
+        self.attributes[key] = value
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_time": self.start_time,
+            "end_time": self.end_time,
+            "duration_ms": (self.end_time - self.start_time) / 1e6,
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+    def _end(self, is_local_root: bool) -> None:
+        self.end_time = time.time_ns()
+        trace = self._trace
+
+        with trace.lock:
+            if trace.is_open and not is_local_root:
+                trace.spans.append(self)
+                return
+
+            # Spans ending after their request, e.g. in background threads,
+            # are exported on their own
+            spans, trace.spans = [*trace.spans, self], []
+            trace.is_open = False
+
+        _export(spans)
+
+
+class SpanExporter:
+    """Receives the finished spans of a request, see TRACING_EXPORTER."""
+
+    def export(self, spans: list[Span]) -> None:
+        raise NotImplementedError
+
+
+class JSONFileExporter(SpanExporter):
+    """Appends the spans to TRACING_FILE, one JSON object per line."""
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+
+    def export(self, spans: list[Span]) -> None:
+        lines = "".join(
+            json.dumps(span.to_dict(), default=str) + "\n" for span in spans
+        )
+
+        # A single append, so lines of other processes don't interleave
+        with self.lock, open(settings.TRACING_FILE, "a") as file:
+            file.write(lines)
+
+
+class LoggingExporter(SpanExporter):
+    """Logs every span as JSON, for log based collectors."""
+
+    def export(self, spans: list[Span]) -> None:
+        for span in spans:
+            logger.info("Span %s", json.dumps(span.to_dict(), default=str))
+
+
+@lru_cache
+def _load_exporter(path: str) -> SpanExporter:
+    return import_string(path)()
+
+
+def _export(spans: list[Span]) -> None:
+    try:
+        _load_exporter(settings.TRACING_EXPORTER).export(spans)
+    except Exception:
+        # Tracing never fails the request it traces
+        logger.exception("Exporting %d spans failed", len(spans))
+
+
+# Span the code being run belongs to, None when it isn't traced
+_current = contextvars.ContextVar("current_span", default=None)
+
+
+def current_span() -> Span | None:
+    return _current.get()
+
+
+@contextlib.contextmanager
+def _activate(span: Span, is_local_root: bool = False) -> Iterator[Span]:
+    token = _current.set(span)
+
+    try:
+        yield span
+    except BaseException as error:
+        span.status = "error"
+        span.set_attribute("error.type", type(error).__name__)
+        raise
+    finally:
+        _current.reset(token)
+        span._end(is_local_root)
+
+
+def _parse_traceparent(traceparent: str) -> tuple[str, str, bool] | None:
+    match = TRACEPARENT_RE.match(traceparent.strip().lower())
+
+    if match is None:
+        return None
+
+    version, trace_id, parent_id, flags, rest = match.groups()
+
+    if (
+        version == "ff"
+        or (version == "00" and rest)
+        or trace_id == "0" * 32
+        or parent_id == "0" * 16
+    ):
+        return None
+
+    return trace_id, parent_id, bool(int(flags, 16) & 1)
+
+
+@contextlib.contextmanager
+def start_trace(
+    name: str, traceparent: str | None = None, attributes: dict | None = None
+) -> Iterator[Span | None]:
+    """
+    Span of a request, a child of the ``traceparent`` span of the caller.
+    Traces the caller has sampled out aren't traced, new ones are traced
+    at TRACING_SAMPLE_RATE.
+    """
+    if not settings.TRACING_EXPORTER:
+        yield None
+        return
+
+    parent = _parse_traceparent(traceparent) if traceparent else None
+
+    if parent is None:
+        trace_id, parent_id = secrets.token_hex(16), None
+        is_sampled = random.random() < settings.TRACING_SAMPLE_RATE
+    else:
+        trace_id, parent_id, is_sampled = parent
+
+    if not is_sampled:
+        yield None
+        return
+
+    root = Span(name, trace_id, parent_id, attributes, _Trace())
+
+    with _activate(root, is_local_root=True):
+        yield root
+
+
+@contextlib.contextmanager
+def span(name: str, attributes: dict | None = None) -> Iterator[Span | None]:
+    """Child of the current span, nothing is traced outside of traces."""
+    parent = _current.get()
+
+    if parent is None:
+        yield None
+        return
+
+    child = Span(name, parent.trace_id, parent.span_id, attributes, parent._trace)
+
+    with _activate(child):
+        yield child
+
+
+def trace_query(execute, sql, params, many, context):
+    """Database execute wrapper adding a span for every query or batch."""
+    if _current.get() is None:
+        return execute(sql, params, many, context)
+
+    attributes = {
+        "db.system": context["connection"].vendor,
+        "db.alias": context["connection"].alias,
+        "db.operation": sql.split(None, 1)[0].upper() if sql else "",
+        "db.statement": sql,
+    }
+
+    if many and isinstance(params, (list, tuple)):
+        attributes["db.batch_size"] = len(params)
+
+    with span("db.query", attributes):
+        return execute(sql, params, many, context)
@@ -0,0 +1,2 @@
+def normalize_answer(text: str) -> str:
+    return " ".join(text.split()).casefold()
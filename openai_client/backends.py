@@ -0,0 +1,160 @@
+import asyncio
+import random
+import re
+import time
+from functools import lru_cache
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from openai_client import main
+
+
+class GraderBackend:
+    """
+    Grades student answers. ``model`` and ``prompt_version`` identify
+    the grades a backend produces, e.g. for the grading cache.
+    """
+
+    model = ""
+    prompt_version = ""
+
+    def grade(
+        self, question: str, expected_answer: str, user_answer: str
+    ) -> tuple[int, str]:
+        raise NotImplementedError
+
+    def grade_batch(
+        self, answers: list[tuple[int, str, str, str]]
+    ) -> dict[int, tuple[int, str]]:
+        return {
+            answer_id: self.grade(question, expected_answer, user_answer)
+            for answer_id, question, expected_answer, user_answer in answers
+        }
+
+    # Backends without native coroutines grade in a worker thread
+
+    async def agrade(
+        self, question: str, expected_answer: str, user_answer: str
+    ) -> tuple[int, str]:
+        return await sync_to_async(self.grade, thread_sensitive=False)(
+            question, expected_answer, user_answer
+        )
+
+    async def agrade_batch(
+        self, answers: list[tuple[int, str, str, str]]
+    ) -> dict[int, tuple[int, str]]:
+        return await sync_to_async(self.grade_batch, thread_sensitive=False)(answers)
+
+
+class OpenAIGraderBackend(GraderBackend):
+    model = main.MODEL
+    prompt_version = main.PROMPT_VERSION
+
+    def grade(
+        self, question: str, expected_answer: str, user_answer: str
+    ) -> tuple[int, str]:
+        return main.get_assistant_answer(question, expected_answer, user_answer)
+
+    def grade_batch(
+        self, answers: list[tuple[int, str, str, str]]
+    ) -> dict[int, tuple[int, str]]:
+        return main.get_assistant_answers_batch(answers)
+
+    async def agrade(
+        self, question: str, expected_answer: str, user_answer: str
+    ) -> tuple[int, str]:
+        return await main.aget_assistant_answer(question, expected_answer, user_answer)
+
+    async def agrade_batch(
+        self, answers: list[tuple[int, str, str, str]]
+    ) -> dict[int, tuple[int, str]]:
+        return await main.aget_assistant_answers_batch(answers)
+
+
+class LocalGraderBackend(GraderBackend):
+    """
+    Offline grader scoring an answer by the share of expected answer
+    words it contains. Meant for load tests and as a degraded mode
+    when the provider is unavailable, not as a real replacement.
+    Every call sleeps GRADER_LOCAL_LATENCY_MS plus a random jitter
+    of GRADER_LOCAL_LATENCY_JITTER_MS, distributed according to
+    GRADER_LOCAL_LATENCY_DISTRIBUTION.
+    """
+
+    model = "local-lexical"
+    prompt_version = "1"
+
+    WORD_PATTERN = re.compile(r"\w+")
+
+    def _words(self, text: str) -> set[str]:
+        return set(self.WORD_PATTERN.findall(text.casefold()))
+
+    def _latency(self) -> float:
+        """Seconds the next call takes."""
+        jitter_ms = settings.GRADER_LOCAL_LATENCY_JITTER_MS
+
+        if settings.GRADER_LOCAL_LATENCY_DISTRIBUTION == "exponential":
+            jitter_ms = random.expovariate(1 / jitter_ms) if jitter_ms > 0 else 0
+        else:
+            jitter_ms = random.uniform(0, jitter_ms)
+
+        latency_ms = settings.GRADER_LOCAL_LATENCY_MS + jitter_ms
+        return max(latency_ms, 0) / 1000
+
+    def _score(self, expected_answer: str, user_answer: str) -> tuple[int, str]:
+        expected_words = self._words(expected_answer)
+        matched_words = expected_words & self._words(user_answer)
+
+        if not expected_words:
+            return 0, "Автоматична оцінка: очікувана відповідь порожня."
+
+        score = round(100 * len(matched_words) / len(expected_words))
+        explanation = (
+            f"Автоматична оцінка: відповідь містить {len(matched_words)} "
+            f"з {len(expected_words)} ключових слів очікуваної відповіді."
+        )
+
+        return score, explanation
+
+    def _score_batch(
+        self, answers: list[tuple[int, str, str, str]]
+    ) -> dict[int, tuple[int, str]]:
+        return {
+            answer_id: self._score(expected_answer, user_answer)
+            for answer_id, _, expected_answer, user_answer in answers
+        }
+
+    def grade(
+        self, question: str, expected_answer: str, user_answer: str
+    ) -> tuple[int, str]:
+        time.sleep(self._latency())
+        return self._score(expected_answer, user_answer)
+
+    def grade_batch(
+        self, answers: list[tuple[int, str, str, str]]
+    ) -> dict[int, tuple[int, str]]:
+        time.sleep(self._latency())
+        return self._score_batch(answers)
+
+    async def agrade(
+        self, question: str, expected_answer: str, user_answer: str
+    ) -> tuple[int, str]:
+        await asyncio.sleep(self._latency())
+        return self._score(expected_answer, user_answer)
+
+    async def agrade_batch(
+        self, answers: list[tuple[int, str, str, str]]
+    ) -> dict[int, tuple[int, str]]:
+        await asyncio.sleep(self._latency())
+        return self._score_batch(answers)
+
+
+@lru_cache
+def _load_grader(path: str) -> GraderBackend:
+    return import_string(path)()
+
+
+def get_grader() -> GraderBackend:
+    return _load_grader(settings.GRADER_BACKEND)
@@ -0,0 +1,268 @@
+import asyncio
+import contextlib
+import contextvars
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Iterator
+
+from django.conf import settings
+
+from core import metrics, tracing
+from openai_client.backends import get_grader
+from openai_client.rate_limit import current_course
+
+logger = logging.getLogger(__name__)
+
+# All callers are told, details of the failure are only logged as they
+# can hold provider errors and request details
+GRADING_UNAVAILABLE = "Grading unavailable"
+
+
+@dataclass(frozen=True)
+class GradingRequest:
+    question_id: int
+    question: str
+    expected_answer: str
+    user_answer: str
+    course_id: int | None = None
+
+
+@dataclass
+class GradingResult:
+    question_id: int
+    score: int | None = None
+    explanation: str = ""
+    error: str | None = None
+    # Set when the answer was graded by a pre-grading rule, not the model
+    pregrading_rule: str = ""
+
+    @property
+    def is_ok(self) -> bool:
+        return self.error is None
+
+
+@contextlib.contextmanager
+def _measured(kind: str, question_ids: list[int]) -> Iterator[None]:
+    """Metrics and trace span of one grader backend call."""
+    model = get_grader().model
+    attributes = {
+        "grader.model": model,
+        "grader.kind": kind,
+        "question.ids": question_ids,
+    }
+
+    with tracing.span("grader.call", attributes):
+        with metrics.grading_in_flight.track_inprogress(model=model):
+            with metrics.grading_latency.time(model=model, kind=kind):
+                try:
+                    yield
+                except Exception as error:
+                    metrics.grading_calls.inc(model=model, kind=kind, outcome="error")
+                    metrics.grading_errors.inc(model=model, error=type(error).__name__)
+                    raise
+
+    metrics.grading_calls.inc(model=model, kind=kind, outcome="ok")
+
+
+def _grade(request: GradingRequest) -> GradingResult:
+    token = current_course.set(request.course_id)
+
+    try:
+        with _measured("single", [request.question_id]):
+            score, explanation = get_grader().grade(
+                request.question, request.expected_answer, request.user_answer
+            )
+    except Exception:
+        logger.exception("Grading question %s failed", request.question_id)
+        return GradingResult(request.question_id, error=GRADING_UNAVAILABLE)
+    finally:
+        current_course.reset(token)
+
+    return GradingResult(request.question_id, score=score, explanation=explanation)
+
+
+def _batch_answers(requests: list[GradingRequest]) -> list[tuple[int, str, str, str]]:
+    return [
+        (
+            request.question_id,
+            request.question,
+            request.expected_answer,
+            request.user_answer,
+        )
+        for request in requests
+    ]
+
+
+def _batch_results(
+    requests: list[GradingRequest], grades: dict[int, tuple[int, str]], message: str
+) -> list[GradingResult]:
+    return [
+        GradingResult(request.question_id, *grades[request.question_id])
+        if request.question_id in grades
+        else GradingResult(request.question_id, error=message)
+        for request in requests
+    ]
+
+
+def _grade_batch(requests: list[GradingRequest]) -> list[GradingResult]:
+    """
+    Grade requests with one completion. Answers the completion could not
+    be mapped back to are returned as failed, so they can be retried
+    one by one.
+    """
+    token = current_course.set(requests[0].course_id)
+
+    try:
+        with _measured("batch", [request.question_id for request in requests]):
+            grades = get_grader().grade_batch(_batch_answers(requests))
+    except Exception:
+        logger.exception(
+            "Grading questions %s in a batch failed",
+            [request.question_id for request in requests],
+        )
+        grades = {}
+        message = GRADING_UNAVAILABLE
+    else:
+        message = "Answer is missing from the batch completion"
+    finally:
+        current_course.reset(token)
+
+    return _batch_results(requests, grades, message)
+
+
+async def _agrade(request: GradingRequest) -> GradingResult:
+    # Runs as its own asyncio task, with its own copy of the context
+    current_course.set(request.course_id)
+
+    try:
+        with _measured("single", [request.question_id]):
+            score, explanation = await get_grader().agrade(
+                request.question, request.expected_answer, request.user_answer
+            )
+    except Exception:
+        logger.exception("Grading question %s failed", request.question_id)
+        return GradingResult(request.question_id, error=GRADING_UNAVAILABLE)
+
+    return GradingResult(request.question_id, score=score, explanation=explanation)
+
+
+async def _agrade_batch(requests: list[GradingRequest]) -> list[GradingResult]:
+    current_course.set(requests[0].course_id)
+
+    try:
+        with _measured("batch", [request.question_id for request in requests]):
+            grades = await get_grader().agrade_batch(_batch_answers(requests))
+    except Exception:
+        logger.exception(
+            "Grading questions %s in a batch failed",
+            [request.question_id for request in requests],
+        )
+        grades = {}
+        message = GRADING_UNAVAILABLE
+    else:
+        message = "Answer is missing from the batch completion"
+
+    return _batch_results(requests, grades, message)
+
+
+def _run(function, items: list, max_workers: int) -> list:
+    max_workers = min(max_workers, len(items))
+
+    if max_workers <= 1:
+        return [function(item) for item in items]
+
+    with ThreadPoolExecutor(
+        max_workers=max_workers, thread_name_prefix="grading"
+    ) as executor:
+        # Workers run in the caller's context, e.g. inside its trace span
+        futures = [
+            executor.submit(contextvars.copy_context().run, function, item)
+            for item in items
+        ]
+
+        return [future.result() for future in futures]
+
+
+def _batches(
+    requests: list[GradingRequest], batch_size: int
+) -> list[list[GradingRequest]]:
+    return [requests[i : i + batch_size] for i in range(0, len(requests), batch_size)]
+
+
+def grade_concurrently(
+    requests: list[GradingRequest],
+    max_workers: int | None = None,
+    batch_size: int | None = None,
+) -> dict[int, GradingResult]:
+    """
+    Grade all requests at once on a bounded thread pool, so the total time
+    is close to the slowest single call instead of the sum of all of them.
+    A failed call never aborts the others, it is returned as a result
+    with ``error`` set for its question.
+
+    With a batch size above 1 up to that many answers are packed into
+    a single completion, answers of a batch that failed are then graded
+    one by one.
+    """
+    if not requests:
+        return {}
+
+    max_workers = max_workers or settings.GRADING_MAX_WORKERS
+    batch_size = batch_size or settings.GRADING_BATCH_SIZE
+    results = {}
+
+    if batch_size > 1 and len(requests) > 1:
+        for batch_results in _run(
+            _grade_batch, _batches(requests, batch_size), max_workers
+        ):
+            results.update(
+                (result.question_id, result) for result in batch_results if result.is_ok
+            )
+
+        requests = [
+            request for request in requests if request.question_id not in results
+        ]
+
+    if requests:
+        results.update(
+            (result.question_id, result)
+            for result in _run(_grade, requests, max_workers)
+        )
+
+    return results
+
+
+async def agrade_concurrently(
+    requests: list[GradingRequest], batch_size: int | None = None
+) -> dict[int, GradingResult]:
+    """
+    Same as `grade_concurrently` with coroutines instead of threads,
+    so a waiting call only holds a coroutine. Concurrency is bounded
+    by the rate limiter of the grader.
+    """
+    if not requests:
+        return {}
+
+    batch_size = batch_size or settings.GRADING_BATCH_SIZE
+    results = {}
+
+    if batch_size > 1 and len(requests) > 1:
+        for batch_results in await asyncio.gather(
+            *(_agrade_batch(batch) for batch in _batches(requests, batch_size))
+        ):
+            results.update(
+                (result.question_id, result) for result in batch_results if result.is_ok
+            )
+
+        requests = [
+            request for request in requests if request.question_id not in results
+        ]
+
+    if requests:
+        results.update(
+            (result.question_id, result)
+            for result in await asyncio.gather(*map(_agrade, requests))
+        )
+
+    return results
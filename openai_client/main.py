@@ -1,6 +1,10 @@
+import json
+
 import openai
 
 from config import settings
+from core import metrics, tracing
+from openai_client.rate_limit import current_course, rate_limiter
 
 
 SYSTEM_TEACHER_PROMPT = """
@@ -33,31 +37,123 @@ Explanation: Так, пайтон це мова програмування, пр
 Також, не було дано жодної додаткової інформації про цю мову.
 """
 
+SYSTEM_BATCH_TEACHER_PROMPT = """
+You're a teacher, which wants to check student's open-ended quizzes. 
+Behave yourself friendly but at the same moment make sure students answer fully and only the question, which was given.
+Your main goal would be to give scores (in % out of 100% correct) 
+for each answer to the given question, and also to explain, why the score is as it is.
+Also, you will be given an expected answer for each question - take it into account.
+Please, give explanation always using Ukrainian language.
+And expect question/example/answers also to be in Ukrainian language.
+You will be given a JSON list of answers to grade, each one in the format:
+{"id": {id}, "question": {question}, "expected_answer": {expected_answer}, "answer": {user_answer}}
+
+Grade every answer on its own and reply only with a JSON list,
+containing exactly one item for each given id, in the format:
+{"id": {id}, "score": {score}, "explanation": {explanation}}
+"""
+
+EXAMPLE_BATCH_USER_PROMPT = json.dumps(
+    [
+        {
+            "id": 1,
+            "question": "Що таке Пайтон?",
+            "expected_answer": "Пайтон - це мова програмування, що використовується для розробки веб-застосунків, аналізу даних та в машинному навчанні.",
+            "answer": "Пайтон це найбільш ненависна мова програмування в світі.",
+        }
+    ],
+    ensure_ascii=False,
+)
+
+EXAMPLE_BATCH_ASSISTANT_ANSWER = json.dumps(
+    [
+        {
+            "id": 1,
+            "score": 20,
+            "explanation": "Так, пайтон це мова програмування, проте, вона не найбільш ненависна в світі, а доволі гарна мова. Також, не було дано жодної додаткової інформації про цю мову.",
+        }
+    ],
+    ensure_ascii=False,
+)
+
 TEMPERATURE = 0  # Randomness of the completions
 
+MODEL = "gpt-3.5-turbo"
+
+# Bump whenever the prompts above change, so cached grades are not reused
+PROMPT_VERSION = "1"
+
+# Rough upper estimates used to reserve tokens per minute before a call
+CHARS_PER_TOKEN = 2
+COMPLETION_TOKENS_PER_ANSWER = 300
+
 
 openai.api_key = settings.OPENAI_API_KEY
 
 
-def get_assistant_answer(
+def _estimate_tokens(messages: list[dict], answers_count: int) -> int:
+    return (
+        sum(len(message["content"]) for message in messages) // CHARS_PER_TOKEN
+        + COMPLETION_TOKENS_PER_ANSWER * answers_count
+    )
+
+
+def _count_tokens(completion: dict) -> dict:
+    usage = completion.get("usage", {})
+    labels = {"course": current_course.get() or "", "model": MODEL}
+    metrics.prompt_tokens.inc(usage.get("prompt_tokens", 0), **labels)
+    metrics.completion_tokens.inc(usage.get("completion_tokens", 0), **labels)
+
+    if span := tracing.current_span():
+        span.set_attribute("llm.prompt_tokens", usage.get("prompt_tokens", 0))
+        span.set_attribute("llm.completion_tokens", usage.get("completion_tokens", 0))
+
+    return completion
+
+
+def create_completion(messages: list[dict], answers_count: int = 1) -> dict:
+    return _count_tokens(
+        rate_limiter.call(
+            openai.ChatCompletion.create,
+            estimated_tokens=_estimate_tokens(messages, answers_count),
+            answers_count=answers_count,
+            model=MODEL,
+            messages=messages,
+            temperature=TEMPERATURE,
+        )
+    )
+
+
+async def acreate_completion(messages: list[dict], answers_count: int = 1) -> dict:
+    return _count_tokens(
+        await rate_limiter.acall(
+            openai.ChatCompletion.acreate,
+            estimated_tokens=_estimate_tokens(messages, answers_count),
+            answers_count=answers_count,
+            model=MODEL,
+            messages=messages,
+            temperature=TEMPERATURE,
+        )
+    )
+
+
+def _answer_messages(
     question: str, expected_answer: str, user_answer: str
-) -> tuple[int, str]:
+) -> list[dict]:
     prompt = f"Q: {question}\n E: {expected_answer}\n A: {user_answer}"
 
-    completion = openai.ChatCompletion.create(
-        model="gpt-3.5-turbo",
-        messages=[
-            {"role": "system", "content": SYSTEM_TEACHER_PROMPT},
-            {"role": "user", "content": EXAMPLE_USER_PROMPT},
-            {
-                "role": "assistant",
-                "content": EXAMPLE_ASSISTANT_ANSWER,
-            },
-            {"role": "user", "content": prompt},
-        ],
-        temperature=TEMPERATURE,
-    )
+    return [
+        {"role": "system", "content": SYSTEM_TEACHER_PROMPT},
+        {"role": "user", "content": EXAMPLE_USER_PROMPT},
+        {
+            "role": "assistant",
+            "content": EXAMPLE_ASSISTANT_ANSWER,
+        },
+        {"role": "user", "content": prompt},
+    ]
+
 
+def parse_answer(completion: dict) -> tuple[int, str]:
     message = completion["choices"][0]["message"]["content"]
     score, *explanation = message.split("\n")
     explanation = "\n".join(explanation)
@@ -67,6 +163,107 @@ def get_assistant_answer(
     return score, explanation
 
 
+def get_assistant_answer(
+    question: str, expected_answer: str, user_answer: str
+) -> tuple[int, str]:
+    return parse_answer(
+        create_completion(_answer_messages(question, expected_answer, user_answer))
+    )
+
+
+async def aget_assistant_answer(
+    question: str, expected_answer: str, user_answer: str
+) -> tuple[int, str]:
+    return parse_answer(
+        await acreate_completion(
+            _answer_messages(question, expected_answer, user_answer)
+        )
+    )
+
+
+class BatchParseError(ValueError):
+    pass
+
+
+def parse_batch_answer(message: str, ids: list[int]) -> dict[int, tuple[int, str]]:
+    """
+    Map a batch completion back to the given answer ids.
+    Items for unknown ids are ignored, ids missing from the completion
+    are simply absent from the result.
+    """
+    try:
+        items = json.loads(message)
+    except json.JSONDecodeError as error:
+        raise BatchParseError(f"Batch answer is not valid JSON: {error}")
+
+    if not isinstance(items, list):
+        raise BatchParseError("Batch answer is not a JSON list")
+
+    grades = {}
+
+    for item in items:
+        try:
+            answer_id = int(item["id"])
+            score = int(item["score"])
+            explanation = str(item["explanation"])
+        except (TypeError, KeyError, ValueError):
+            continue
+
+        if answer_id in ids and 0 <= score <= 100:
+            grades[answer_id] = (score, explanation)
+
+    return grades
+
+
+def _batch_messages(answers: list[tuple[int, str, str, str]]) -> list[dict]:
+    prompt = json.dumps(
+        [
+            {
+                "id": answer_id,
+                "question": question,
+                "expected_answer": expected_answer,
+                "answer": user_answer,
+            }
+            for answer_id, question, expected_answer, user_answer in answers
+        ],
+        ensure_ascii=False,
+    )
+
+    return [
+        {"role": "system", "content": SYSTEM_BATCH_TEACHER_PROMPT},
+        {"role": "user", "content": EXAMPLE_BATCH_USER_PROMPT},
+        {
+            "role": "assistant",
+            "content": EXAMPLE_BATCH_ASSISTANT_ANSWER,
+        },
+        {"role": "user", "content": prompt},
+    ]
+
+
+def get_assistant_answers_batch(
+    answers: list[tuple[int, str, str, str]]
+) -> dict[int, tuple[int, str]]:
+    """
+    Grade several (id, question, expected_answer, user_answer) items
+    with one completion, returning (score, explanation) by id.
+    """
+    completion = create_completion(_batch_messages(answers), answers_count=len(answers))
+    message = completion["choices"][0]["message"]["content"]
+
+    return parse_batch_answer(message, [answer[0] for answer in answers])
+
+
+async def aget_assistant_answers_batch(
+    answers: list[tuple[int, str, str, str]]
+) -> dict[int, tuple[int, str]]:
+    completion = await acreate_completion(
+        _batch_messages(answers), answers_count=len(answers)
+    )
+    message = completion["choices"][0]["message"]["content"]
+
+    return parse_batch_answer(message, [answer[0] for answer in answers])
+
+
 if __name__ == "__main__":
     print(
         get_assistant_answer(
@@ -0,0 +1,472 @@
+import asyncio
+import contextvars
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Awaitable, Callable, Hashable
+
+import openai
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+from core import metrics
+
+RETRYABLE_ERRORS = (
+    openai.error.RateLimitError,
+    openai.error.ServiceUnavailableError,
+    openai.error.APIConnectionError,
+    openai.error.Timeout,
+    openai.error.TryAgain,
+    openai.error.APIError,
+)
+
+# Course the current grading call is made for, used to share the
+# provider budget fairly between courses
+current_course: contextvars.ContextVar[Hashable] = contextvars.ContextVar(
+    "current_course", default=None
+)
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+class TokenBucket:
+    """Refills ``per_minute`` units evenly over a minute, shared by threads."""
+
+    def __init__(self, per_minute: int) -> None:
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.available = float(per_minute)
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.available = min(
+            self.capacity, self.available + (now - self.updated_at) * self.rate
+        )
+        self.updated_at = now
+
+    def _take(self, amount: int) -> float:
+        """Take the units if available, otherwise return seconds to wait."""
+        with self._lock:
+            self._refill()
+
+            if self.available >= amount:
+                self.available -= amount
+                return 0
+
+            return (amount - self.available) / self.rate
+
+    def acquire(self, amount: int, deadline: float) -> None:
+        amount = min(amount, self.capacity)
+
+        while (wait := self._take(amount)) > 0:
+            if time.monotonic() + wait > deadline:
+                raise DeadlineExceeded("Rate limit budget is exhausted")
+
+            time.sleep(wait)
+
+    async def aacquire(self, amount: int, deadline: float) -> None:
+        amount = min(amount, self.capacity)
+
+        while (wait := self._take(amount)) > 0:
+            if time.monotonic() + wait > deadline:
+                raise DeadlineExceeded("Rate limit budget is exhausted")
+
+            await asyncio.sleep(wait)
+
+    def adjust(self, amount: int) -> None:
+        """Charge (or refund, when negative) units after the fact."""
+        with self._lock:
+            self._refill()
+            self.available = min(self.capacity, self.available - amount)
+
+    async def aadjust(self, amount: int) -> None:
+        self.adjust(amount)
+
+
+class SharedWindowBucket:
+    """
+    Per-minute budget counted in the Django cache, so that all processes
+    using the same cache backend share it. Uses fixed one-minute windows,
+    which is coarser than TokenBucket but only needs add/incr.
+    """
+
+    def __init__(self, name: str, per_minute: int) -> None:
+        self.name = name
+        self.capacity = per_minute
+
+    def _key(self, window: int) -> str:
+        return f"openai-rate-limit:{self.name}:{window}"
+
+    def _take(self, amount: int) -> float:
+        """Take the units if available, otherwise return seconds to wait."""
+        while True:
+            window = int(time.time() // 60)
+            key = self._key(window)
+            cache.add(key, 0, timeout=120)
+
+            try:
+                used = cache.incr(key, amount)
+            except ValueError:
+                continue
+
+            if used <= self.capacity:
+                return 0
+
+            cache.decr(key, amount)
+            return (window + 1) * 60 - time.time() + random.uniform(0, 1)
+
+    def acquire(self, amount: int, deadline: float) -> None:
+        amount = min(amount, self.capacity)
+
+        while (wait := self._take(amount)) > 0:
+            if time.monotonic() + wait > deadline:
+                raise DeadlineExceeded("Rate limit budget is exhausted")
+
+            time.sleep(wait)
+
+    async def aacquire(self, amount: int, deadline: float) -> None:
+        amount = min(amount, self.capacity)
+        take = sync_to_async(self._take, thread_sensitive=False)
+
+        while (wait := await take(amount)) > 0:
+            if time.monotonic() + wait > deadline:
+                raise DeadlineExceeded("Rate limit budget is exhausted")
+
+            await asyncio.sleep(wait)
+
+    def adjust(self, amount: int) -> None:
+        if amount <= 0:
+            return
+
+        key = self._key(int(time.time() // 60))
+        cache.add(key, 0, timeout=120)
+
+        try:
+            cache.incr(key, amount)
+        except ValueError:
+            pass
+
+    async def aadjust(self, amount: int) -> None:
+        await sync_to_async(self.adjust, thread_sensitive=False)(amount)
+
+
+class _AsyncTicket:
+    """Place in line of a coroutine, woken up on its event loop."""
+
+    def __init__(self) -> None:
+        self.loop = asyncio.get_running_loop()
+        self.event = asyncio.Event()
+
+    def wake(self) -> None:
+        self.loop.call_soon_threadsafe(self.event.set)
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    Limits calls in flight, adjusting the limit AIMD-style: it is halved
+    on a throttled or too slow call and grows by about one per window
+    of successful calls. Calls started before the last decrease don't
+    decrease it again, so one overload halves the limit once, like TCP
+    does once per round trip. Waiting callers are admitted round-robin
+    by key, so every course gets its share of the free slots.
+    Threads and coroutines wait in the same line.
+    """
+
+    def __init__(self, max_limit: int, target_latency: float) -> None:
+        self.max_limit = max_limit
+        self.target_latency = target_latency
+        self.limit = float(max_limit)
+        self.in_flight = 0
+        self._decreased_at = float("-inf")
+        self._waiting: OrderedDict[Hashable, deque] = OrderedDict()
+        self._condition = threading.Condition()
+
+    def _next_ticket(self) -> object | None:
+        for tickets in self._waiting.values():
+            return tickets[0]
+
+        return None
+
+    def _remove(self, key: Hashable, ticket: object) -> None:
+        tickets = self._waiting[key]
+        tickets.remove(ticket)
+
+        if tickets:
+            # Move the key to the end of the line, so other keys go next
+            self._waiting.move_to_end(key)
+        else:
+            del self._waiting[key]
+
+    def _notify(self) -> None:
+        self._condition.notify_all()
+        ticket = self._next_ticket()
+
+        # Only the first in line can be admitted, it wakes the next one
+        if isinstance(ticket, _AsyncTicket):
+            ticket.wake()
+
+    def _try_enter(self, key: Hashable, ticket: object) -> bool:
+        if self.in_flight < int(self.limit) and self._next_ticket() is ticket:
+            self._remove(key, ticket)
+            self.in_flight += 1
+            self._notify()
+            return True
+
+        return False
+
+    def acquire(self, key: Hashable, deadline: float) -> None:
+        ticket = object()
+
+        with self._condition:
+            self._waiting.setdefault(key, deque()).append(ticket)
+
+            while not self._try_enter(key, ticket):
+                remaining = deadline - time.monotonic()
+
+                if remaining <= 0:
+                    self._remove(key, ticket)
+                    self._notify()
+                    raise DeadlineExceeded("No grading slot became free in time")
+
+                self._condition.wait(remaining)
+
+    async def aacquire(self, key: Hashable, deadline: float) -> None:
+        ticket = _AsyncTicket()
+
+        with self._condition:
+            self._waiting.setdefault(key, deque()).append(ticket)
+
+        try:
+            while True:
+                with self._condition:
+                    if self._try_enter(key, ticket):
+                        return
+
+                    # Wakes set after this are not lost, they're scheduled
+                    ticket.event.clear()
+
+                remaining = deadline - time.monotonic()
+
+                if remaining <= 0:
+                    raise DeadlineExceeded("No grading slot became free in time")
+
+                try:
+                    await asyncio.wait_for(ticket.event.wait(), remaining)
+                except asyncio.TimeoutError:
+                    pass
+        except BaseException:
+            # Deadline or cancellation, give the place in line up
+            with self._condition:
+                if ticket in self._waiting.get(key, ()):
+                    self._remove(key, ticket)
+                    self._notify()
+
+            raise
+
+    def cancel(self) -> None:
+        """Give a slot back unused, the limit stays as it is."""
+        with self._condition:
+            self.in_flight -= 1
+            self._notify()
+
+    def release(
+        self, started_at: float, answers_count: int, is_throttled: bool
+    ) -> None:
+        """
+        End a call started at the given monotonic time. Its latency is
+        compared with the target per graded answer, as batches of
+        answers take longer.
+        """
+        now = time.monotonic()
+        latency = (now - started_at) / max(answers_count, 1)
+
+        with self._condition:
+            self.in_flight -= 1
+
+            if is_throttled or latency > self.target_latency:
+                if started_at >= self._decreased_at:
+                    self.limit = max(1.0, self.limit / 2)
+                    self._decreased_at = now
+            else:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+            self._notify()
+
+
+class RateLimiter:
+    """
+    Wraps provider calls with adaptive concurrency, requests and tokens
+    per minute budgets, a deadline and retries with exponential backoff
+    and full jitter. Calls take a concurrency slot, admitted round-robin
+    by course, before the per minute budgets, which serve their callers
+    in no particular order. So a burst of one course can't use up the
+    budgets ahead of the other courses.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._is_configured = False
+
+    def _configure(self) -> None:
+        with self._lock:
+            if self._is_configured:
+                return
+
+            if settings.OPENAI_RATE_LIMIT_SHARED:
+                self.requests = SharedWindowBucket(
+                    "requests", settings.OPENAI_REQUESTS_PER_MINUTE
+                )
+                self.tokens = SharedWindowBucket(
+                    "tokens", settings.OPENAI_TOKENS_PER_MINUTE
+                )
+            else:
+                self.requests = TokenBucket(settings.OPENAI_REQUESTS_PER_MINUTE)
+                self.tokens = TokenBucket(settings.OPENAI_TOKENS_PER_MINUTE)
+
+            self.concurrency = AdaptiveConcurrencyLimiter(
+                settings.OPENAI_MAX_CONCURRENCY, settings.OPENAI_TARGET_LATENCY_SEC
+            )
+            self._is_configured = True
+
+    @staticmethod
+    def _retry_delay(attempt: int, deadline: float) -> float | None:
+        """Backoff before the given retry, None when it's not worth retrying."""
+        delay = random.uniform(
+            0,
+            min(
+                settings.OPENAI_RETRY_MAX_DELAY_SEC,
+                settings.OPENAI_RETRY_BASE_DELAY_SEC * 2**attempt,
+            ),
+        )
+
+        if (
+            attempt > settings.OPENAI_MAX_RETRIES
+            or time.monotonic() + delay >= deadline
+        ):
+            return None
+
+        return delay
+
+    @staticmethod
+    def _used_tokens(response: Any, estimated_tokens: int) -> int:
+        """Tokens used above the estimate, negative when fewer were used."""
+        used_tokens = response.get("usage", {}).get("total_tokens")
+        return used_tokens - estimated_tokens if used_tokens else 0
+
+    def call(
+        self,
+        function: Callable[..., Any],
+        estimated_tokens: int,
+        answers_count: int = 1,
+        **kwargs,
+    ) -> Any:
+        self._configure()
+        deadline = time.monotonic() + settings.OPENAI_CALL_DEADLINE_SEC
+        attempt = 0
+
+        while True:
+            self.concurrency.acquire(current_course.get(), deadline)
+
+            try:
+                self.requests.acquire(1, deadline)
+                self.tokens.acquire(estimated_tokens, deadline)
+            except BaseException:
+                self.concurrency.cancel()
+                raise
+
+            started_at = time.monotonic()
+            error = None
+
+            try:
+                response = function(
+                    request_timeout=max(deadline - started_at, 1), **kwargs
+                )
+            except RETRYABLE_ERRORS as call_error:
+                error = call_error
+            finally:
+                self.concurrency.release(
+                    started_at,
+                    answers_count,
+                    isinstance(error, openai.error.RateLimitError),
+                )
+
+            if error is None:
+                if extra_tokens := self._used_tokens(response, estimated_tokens):
+                    self.tokens.adjust(extra_tokens)
+
+                return response
+
+            attempt += 1
+            delay = self._retry_delay(attempt, deadline)
+
+            if delay is None:
+                raise error
+
+            metrics.grading_retries.inc(
+                model=kwargs.get("model", ""), error=type(error).__name__
+            )
+            time.sleep(delay)
+
+    async def acall(
+        self,
+        function: Callable[..., Awaitable],
+        estimated_tokens: int,
+        answers_count: int = 1,
+        **kwargs,
+    ) -> Any:
+        """Same as `call` for coroutine functions, waits without blocking."""
+        self._configure()
+        deadline = time.monotonic() + settings.OPENAI_CALL_DEADLINE_SEC
+        attempt = 0
+
+        while True:
+            await self.concurrency.aacquire(current_course.get(), deadline)
+
+            try:
+                await self.requests.aacquire(1, deadline)
+                await self.tokens.aacquire(estimated_tokens, deadline)
+            except BaseException:
+                self.concurrency.cancel()
+                raise
+
+            started_at = time.monotonic()
+            error = None
+
+            try:
+                response = await function(
+                    request_timeout=max(deadline - started_at, 1), **kwargs
+                )
+            except RETRYABLE_ERRORS as call_error:
+                error = call_error
+            finally:
+                self.concurrency.release(
+                    started_at,
+                    answers_count,
+                    isinstance(error, openai.error.RateLimitError),
+                )
+
+            if error is None:
+                if extra_tokens := self._used_tokens(response, estimated_tokens):
+                    await self.tokens.aadjust(extra_tokens)
+
+                return response
+
+            attempt += 1
+            delay = self._retry_delay(attempt, deadline)
+
+            if delay is None:
+                raise error
+
+            metrics.grading_retries.inc(
+                model=kwargs.get("model", ""), error=type(error).__name__
+            )
+            await asyncio.sleep(delay)
+
+
+rate_limiter = RateLimiter()